@@ -0,0 +1,61 @@
+# copyright ############################### #
+# This file is part of the Xtrack Package.  #
+# Copyright (c) CERN, 2023.                 #
+# ######################################### #
+
+import numpy as np
+
+import xtrack as xt
+import xpart as xp
+import xobjects as xo
+
+# Compare the static split of the particles among the OpenMP threads (default)
+# with the dynamic and guided scheduling, on a lossy dynamic aperture setup
+# (particles lost early leave idle threads with the static split)
+
+num_turns = 200
+num_threads = 'auto'
+
+context = xo.ContextCpu(omp_num_threads=num_threads)
+
+line = xt.Line.from_json(
+    '../../test_data/hllhc14_no_errors_with_coupling_knobs/line_b1.json')
+
+# Switch on LHC octupole circuits to have a smaller dynamic aperture
+for arc in ['12', '23', '34', '45', '56', '67', '78', '81']:
+    line.vars[f'kod.a{arc}b1'] = 2.0
+    line.vars[f'kof.a{arc}b1'] = 2.0
+
+line.build_tracker(_context=context)
+
+# Polar grid extending well outside the dynamic aperture
+x_normalized, y_normalized, r_xy, theta_xy = xp.generate_2D_polar_grid(
+    r_range=(0, 40.), theta_range=(0, np.pi/2), nr=50, ntheta=60)
+
+particles0 = line.build_particles(
+    x_norm=x_normalized, px_norm=0, y_norm=y_normalized, py_norm=0,
+    nemitt_x=3e-6, nemitt_y=3e-6, _context=context)
+
+for scheduling in ['static', 'dynamic', 'guided']:
+    line.config.XTRACK_OMP_SCHEDULE_DYNAMIC = scheduling == 'dynamic'
+    line.config.XTRACK_OMP_SCHEDULE_GUIDED = scheduling == 'guided'
+    for chunk_size in ([None] if scheduling == 'static' else [16, 64, 256]):
+        if chunk_size is None:
+            line.config.pop('XTRACK_OMP_CHUNK_SIZE', None)
+        else:
+            line.config.XTRACK_OMP_CHUNK_SIZE = chunk_size
+
+        # Compile the kernel outside the timed region
+        line.track(particles0.copy(), num_turns=1)
+
+        particles = particles0.copy()
+        line.track(particles, num_turns=num_turns, time=True)
+        n_lost = int(np.sum(context.nparray_from_context_array(
+                                                    particles.state) <= 0))
+        print(f'{scheduling:8s} chunk_size={str(chunk_size):5s}: '
+              f'{line.time_last_track:.3f} s '
+              f'({n_lost}/{particles._capacity} particles lost)')
+
+# The number of threads can also be set for a single call
+line.track(particles0.copy(), num_turns=num_turns, time=True, num_threads=1)
+print(f'1 thread: {line.time_last_track:.3f} s')
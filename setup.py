@@ -42,7 +42,7 @@ setup(
     install_requires=[
         'numpy>=1.0',
         'scipy',
-        'xobjects',
+        'xobjects>=0.2.10',
         'xpart',
         'xdeps'
         ],
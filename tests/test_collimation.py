@@ -424,3 +424,171 @@ def test_losslocationrefinement_skip_refinement_for_collimators():
     loss_loc_refinement.refine_loss_location(particles)
 
     assert np.all(part_before.s == particles.s)
+
+def test_losslocationrefinement_multiple_apertures_and_cache(tmp_path,
+                                                            monkeypatch):
+
+    from xtrack.loss_location_refinement import aperture_cache
+
+    # Isolate the aperture cache from the user's one and from other tests
+    monkeypatch.setenv('XSUITE_APERTURE_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(aperture_cache, '_APERTURE_POLYGONS', {})
+
+    line = xt.Line(elements=[
+        xt.Marker(),
+        xt.LimitEllipse(a=2e-2, b=2e-2),
+        xt.Drift(length=2.),
+        xt.Multipole(knl=[0, 0]),
+        xt.LimitEllipse(a=1e-2, b=1e-2),
+        xt.Drift(length=2.),
+        xt.LimitEllipse(a=0.5e-2, b=0.5e-2),
+        xt.Drift(length=1.),
+        ])
+    line.build_tracker()
+
+    # Particles with straight trajectories, lost on both the second and third
+    # aperture
+    n_part = 1000
+    r_end = np.linspace(0, 5e-2, n_part) # radius at s=5
+    theta = np.linspace(0, 2 * np.pi, n_part)
+    particles0 = xp.Particles(p0c=7e12,
+                              px=r_end / 5 * np.cos(theta),
+                              py=r_end / 5 * np.sin(theta))
+    line.track(particles0)
+    assert set(np.unique(particles0.at_element[particles0.state == 0])) == {4, 6}
+
+    loss_loc_refinement = xt.LossLocationRefinement(line,
+                                                n_theta = 360,
+                                                r_max = 0.5, # m
+                                                dr = 50e-6,
+                                                ds = 0.05,
+                                                save_refine_lines=True,
+                                                allowed_backtrack_types=[
+                                                    xt.Multipole])
+
+    particles = particles0.copy()
+    loss_loc_refinement.refine_loss_location(particles)
+
+    # Expected loss location from the straight trajectories and the linearly
+    # interpolated aperture radius
+    mask_lost = particles.state == 0
+    slope = np.sqrt(particles.px**2 + particles.py**2)
+    s_expected = np.where(particles.at_element == 4,
+                          2e-2 / (slope + 0.5e-2),
+                          1.5e-2 / (slope + 0.25e-2))
+    assert np.allclose(particles.s[mask_lost], s_expected[mask_lost],
+                       rtol=0, atol=0.07)
+
+    # Same result as refining one aperture at a time
+    particles_single = particles0.copy()
+    for i_aper_1, interp_line in loss_loc_refinement.refine_lines.items():
+        xt.loss_location_refinement.loss_location_refinement.\
+            refine_loss_location_single_aperture(
+                particles_single, i_aper_1, interp_line.i_start_thin_0,
+                line, interp_line, allowed_backtrack_types=[xt.Multipole])
+    for nn in ['s', 'x', 'px', 'y', 'py', 'zeta', 'delta']:
+        assert np.all(getattr(particles_single, nn) == getattr(particles, nn))
+    assert set(loss_loc_refinement.refine_lines.keys()) == {4, 6}
+
+    # Second call reuses the interpolating lines built by the first one
+    interp_lines = dict(loss_loc_refinement.refine_lines)
+    particles_second = particles0.copy()
+    loss_loc_refinement.refine_loss_location(particles_second)
+    for kk in [4, 6]:
+        assert loss_loc_refinement.refine_lines[kk] is interp_lines[kk]
+    assert np.all(particles_second.s == particles.s)
+    assert np.all(particles_second.x == particles.x)
+
+    # The interpolating line is rebuilt if the aperture is changed
+    line.elements[6].set_half_axes(0.4e-2, 0.4e-2)
+    loss_loc_refinement.refine_loss_location(particles0.copy())
+    assert loss_loc_refinement.refine_lines[4] is interp_lines[4]
+    assert loss_loc_refinement.refine_lines[6] is not interp_lines[6]
+
+    # All interpolating lines are rebuilt if the tracker is rebuilt
+    interp_lines = dict(loss_loc_refinement.refine_lines)
+    line.discard_tracker()
+    line.build_tracker()
+    loss_loc_refinement.refine_loss_location(particles0.copy())
+    for kk in [4, 6]:
+        assert loss_loc_refinement.refine_lines[kk] is not interp_lines[kk]
+
+    # The aperture cache is not used by default
+    assert len(aperture_cache._APERTURE_POLYGONS) == 0
+    assert len(list(tmp_path.iterdir())) == 0
+
+def test_aperture_characterization_cache(tmp_path, monkeypatch, mocker):
+
+    from xtrack.loss_location_refinement import aperture_cache
+    from xtrack.loss_location_refinement.loss_location_refinement import (
+        characterize_aperture)
+
+    monkeypatch.setenv('XSUITE_APERTURE_CACHE_DIR', str(tmp_path))
+    monkeypatch.delenv('XSUITE_APERTURE_CACHE', raising=False)
+    monkeypatch.setattr(aperture_cache, '_APERTURE_POLYGONS', {})
+
+    def make_line(rot_deg):
+        return xt.Line(elements=[
+            xt.Drift(length=1.),
+            xt.XYShift(dx=1e-3, dy=2e-3),
+            xt.SRotation(angle=rot_deg),
+            xt.LimitRect(min_x=-1e-2, max_x=1e-2, min_y=-2e-2, max_y=2e-2),
+            xt.SRotation(angle=-rot_deg),
+            xt.XYShift(dx=-1e-3, dy=-2e-3),
+            xt.Drift(length=1.),
+            ])
+
+    line = make_line(rot_deg=10.)
+    line.build_tracker()
+
+    kwargs = dict(n_theta=36, r_max=0.5, dr=50e-6, use_cache=True)
+
+    # The on-disk cache is opt-in (polygons are cached in memory only)
+    characterize_aperture(line, 3, **kwargs, buffer_for_poly=line._buffer,
+                          coming_from='upstream')
+    assert len(aperture_cache._APERTURE_POLYGONS) == 1
+    assert len(list(tmp_path.glob('xtrack_aperture_*.npz'))) == 0
+    aperture_cache._APERTURE_POLYGONS.clear()
+
+    monkeypatch.setenv('XSUITE_APERTURE_CACHE', '1')
+    poly_up, i_thin_up = characterize_aperture(line, 3, **kwargs,
+                            buffer_for_poly=line._buffer,
+                            coming_from='upstream')
+    poly_down, i_thin_down = characterize_aperture(line, 3, **kwargs,
+                            buffer_for_poly=line._buffer,
+                            coming_from='downstream')
+    assert len(list(tmp_path.glob('xtrack_aperture_*.npz'))) == 2
+
+    # Identical lattice in a new process (in-memory cache cleared): the
+    # polygons are loaded from disk without tracking any test particle
+    aperture_cache._APERTURE_POLYGONS.clear()
+    line_new = make_line(rot_deg=10.)
+    line_new.build_tracker()
+    mocker.patch.object(line_new, 'track', side_effect=AssertionError)
+    for poly, i_thin, coming_from in [(poly_up, i_thin_up, 'upstream'),
+                                      (poly_down, i_thin_down, 'downstream')]:
+        poly_cached, i_thin_cached = characterize_aperture(line_new, 3,
+                            **kwargs, buffer_for_poly=line_new._buffer,
+                            coming_from=coming_from)
+        assert i_thin_cached == i_thin
+        assert np.all(poly_cached.x_vertices == poly.x_vertices)
+        assert np.all(poly_cached.y_vertices == poly.y_vertices)
+
+    # A different rotation of the aperture is not taken from the cache
+    line_rot = make_line(rot_deg=20.)
+    line_rot.build_tracker()
+    poly_rot, _ = characterize_aperture(line_rot, 3, **kwargs,
+                            buffer_for_poly=line_rot._buffer,
+                            coming_from='upstream')
+    assert not np.allclose(poly_rot.x_vertices, poly_up.x_vertices)
+    assert len(list(tmp_path.glob('xtrack_aperture_*.npz'))) == 3
+
+    aperture_cache.clear_aperture_cache()
+    assert len(list(tmp_path.glob('xtrack_aperture_*.npz'))) == 0
+
+    # Explicit cache directory, without the environment variable
+    monkeypatch.delenv('XSUITE_APERTURE_CACHE')
+    cache_dir = tmp_path / 'explicit'
+    characterize_aperture(line, 3, **kwargs, buffer_for_poly=line._buffer,
+                          coming_from='upstream', cache_dir=cache_dir)
+    assert len(list(cache_dir.glob('xtrack_aperture_*.npz'))) == 1
@@ -228,3 +228,58 @@ def test_footprint_delta0(test_context):
     assert np.isclose((np.max(fp2.qx) - np.max(fp1.qx))/1e-4, 12, atol=0.5, rtol=0)
     assert np.isclose((np.max(fp2.qy) - np.max(fp1.qy))/1e-4, 9, atol=0.5, rtol=0)
 
+
+@for_all_test_contexts
+def test_footprint_tune_methods(test_context, tmp_path):
+
+    if isinstance(test_context, xo.ContextPyopencl):
+        pytest.skip('Pyopencl not yet supported for footprint')
+        return
+
+    line = xt.Line(elements=[xt.LineSegmentMap(length=1., qx=0.31, qy=0.32,
+                        betx=10., bety=20., detx_x=2e3, detx_y=-1e3,
+                        dety_y=3e3, dety_x=-1e3)])
+    line.particle_ref = xp.Particles(p0c=7e12)
+    line.build_tracker(_context=test_context)
+
+    kwargs = dict(nemitt_x=1e-6, nemitt_y=1e-6, freeze_longitudinal=True,
+                  n_r=5, n_theta=4)
+
+    fp_fft = line.get_footprint(n_turns=256, n_fft=2**16, **kwargs)
+    fp_hann = line.get_footprint(n_turns=256, tune_method='hann', **kwargs)
+    fp_naff = line.get_footprint(n_turns=256, tune_method='naff', **kwargs)
+    fp_naff_short = line.get_footprint(n_turns=100, tune_method='naff',
+                                       **kwargs)
+
+    # Zero-padded FFT has a resolution of 1/n_fft and biased by the leakage
+    for fp in [fp_hann, fp_naff, fp_naff_short]:
+        assert np.allclose(fp.qx, fp_fft.qx, rtol=0, atol=2e-5)
+        assert np.allclose(fp.qy, fp_fft.qy, rtol=0, atol=2e-5)
+    assert np.allclose(fp_naff_short.qx, fp_naff.qx, rtol=0, atol=1e-6)
+    assert np.allclose(fp_naff_short.qy, fp_naff.qy, rtol=0, atol=1e-6)
+    assert np.allclose(fp_hann.qx, fp_naff.qx, rtol=0, atol=1e-6)
+    assert np.allclose(fp_hann.qy, fp_naff.qy, rtol=0, atol=1e-6)
+
+    # Detuning with amplitude
+    assert np.isclose(fp_naff.qx[0, 0], 0.31, rtol=0, atol=1e-6)
+    assert np.isclose(fp_naff.qy[0, 0], 0.32, rtol=0, atol=1e-6)
+    beta_gamma = line.particle_ref.beta0[0] * line.particle_ref.gamma0[0]
+    jx = 1e-6 / beta_gamma * fp_naff.x_norm_2d**2 / 2
+    jy = 1e-6 / beta_gamma * fp_naff.y_norm_2d**2 / 2
+    assert np.allclose(fp_naff.qx, 0.31 + 2e3 * jx - 1e3 * jy,
+                       rtol=0, atol=1e-7)
+    assert np.allclose(fp_naff.qy, 0.32 + 3e3 * jy - 1e3 * jx,
+                       rtol=0, atol=1e-7)
+
+    # Turn-by-turn data on disk, read by blocks of particles in threads
+    fp_memmap = line.get_footprint(n_turns=256, tune_method='naff',
+                                   memmap_path=tmp_path / 'tbt',
+                                   num_workers=2, keep_tracking_data=True,
+                                   **kwargs)
+    assert isinstance(fp_memmap.tracking_data, xt.MemmapParticlesMonitor)
+    assert np.all(fp_memmap.qx == fp_naff.qx)
+    assert np.all(fp_memmap.qy == fp_naff.qy)
+
+    q_chunks = xt.footprint.estimate_tunes(fp_memmap.tracking_data.x,
+                            method='naff', chunk_size=3, num_workers=3)
+    assert np.allclose(q_chunks, fp_naff.qx.flatten(), rtol=0, atol=1e-14)
@@ -0,0 +1,119 @@
+# copyright ################################# #
+# This file is part of the Xtrack Package.    #
+# Copyright (c) CERN, 2023.                   #
+# ########################################### #
+import os
+
+import cffi
+import pytest
+
+import xobjects as xo
+import xpart as xp
+import xtrack as xt
+from xtrack.kernel_cache import (evict_kernel_cache, clear_kernel_cache,
+                                 get_kernel_cache_dir, kernel_cache_key,
+                                 get_compiler_id)
+
+
+@pytest.fixture
+def kernel_cache_dir(monkeypatch, tmp_path):
+    monkeypatch.setenv('XSUITE_KERNEL_CACHE', '1')
+    monkeypatch.setenv('XSUITE_KERNEL_CACHE_DIR', str(tmp_path))
+    monkeypatch.setenv('XSUITE_PREBUILT_KERNELS', '0')
+    return tmp_path
+
+
+def _cached_so_files(path):
+    return [ff for ff in path.iterdir()
+            if ff.name.startswith('xtrack_kernel_') and ff.is_file()]
+
+
+@pytest.mark.parametrize('omp_num_threads', [0, 2])
+def test_kernel_cache_reuse(mocker, kernel_cache_dir, omp_num_threads):
+
+    assert get_kernel_cache_dir() == kernel_cache_dir
+
+    line = xt.Line(elements=[xt.Drift(length=2.0), xt.Multipole(knl=[0, 1e-3])])
+    line.build_tracker(_context=xo.ContextCpu(omp_num_threads=omp_num_threads))
+    p = xp.Particles(p0c=1e9, px=3e-6, x=1e-3, _context=line._context)
+    line.track(p)
+    p.move(_context=xo.context_default)
+    x_ref, px_ref = p.x[0], p.px[0]
+
+    assert len(_cached_so_files(kernel_cache_dir)) == 1
+
+    # A new tracker with the same configuration loads the kernel from the cache
+    cffi_compile = mocker.patch.object(cffi.FFI, 'compile')
+
+    line2 = xt.Line(elements=[xt.Drift(length=2.0),
+                              xt.Multipole(knl=[0, 1e-3])])
+    line2.build_tracker(_context=xo.ContextCpu(omp_num_threads=omp_num_threads))
+    p2 = xp.Particles(p0c=1e9, px=3e-6, x=1e-3, _context=line2._context)
+    line2.track(p2)
+    p2.move(_context=xo.context_default)
+
+    cffi_compile.assert_not_called()
+    assert p2.x[0] == x_ref
+    assert p2.px[0] == px_ref
+
+    clear_kernel_cache()
+    assert len(_cached_so_files(kernel_cache_dir)) == 0
+
+
+def test_kernel_cache_lru_eviction(kernel_cache_dir):
+
+    for ii, size in enumerate([10, 20, 30]):
+        ff = kernel_cache_dir / f'xtrack_kernel_{ii}.so'
+        ff.write_bytes(b'0' * size)
+        os.utime(ff, (ii, ii))
+
+    evict_kernel_cache(max_size=55)
+
+    remaining = sorted(ff.name for ff in _cached_so_files(kernel_cache_dir))
+    assert remaining == ['xtrack_kernel_1.so', 'xtrack_kernel_2.so']
+
+
+@pytest.mark.parametrize('env_value', [None, '0'])
+def test_kernel_cache_disabled(monkeypatch, kernel_cache_dir, env_value):
+    # The cache is opt-in
+    if env_value is None:
+        monkeypatch.delenv('XSUITE_KERNEL_CACHE')
+    else:
+        monkeypatch.setenv('XSUITE_KERNEL_CACHE', env_value)
+
+    line = xt.Line(elements=[xt.Drift(length=2.0)])
+    line.build_tracker(_context=xo.ContextCpu())
+    p = xp.Particles(p0c=1e9, px=3e-6)
+    line.track(p)
+
+    assert len(_cached_so_files(kernel_cache_dir)) == 0
+
+    # Explicit request
+    line2 = xt.Line(elements=[xt.Drift(length=3.0)])
+    line2.build_tracker(_context=xo.ContextCpu(), use_kernel_cache=True)
+    assert len(_cached_so_files(kernel_cache_dir)) == 1
+
+
+def test_kernel_cache_key_compiler_and_flags():
+    ctx = xo.ContextCpu()
+    key = kernel_cache_key('src', ctx, xp.Particles,
+                           extra_compile_args=('-O3',), compiler='gcc 12')
+
+    assert key == kernel_cache_key('src', ctx, xp.Particles,
+                                   extra_compile_args=('-O3',),
+                                   compiler='gcc 12')
+    assert key != kernel_cache_key('src', ctx, xp.Particles,
+                                   extra_compile_args=('-O2',),
+                                   compiler='gcc 12')
+    assert key != kernel_cache_key('src', ctx, xp.Particles,
+                                   extra_compile_args=('-O3',),
+                                   compiler='gcc 13')
+    assert key != kernel_cache_key('src', ctx, xp.Particles,
+                                   extra_compile_args=('-O3',),
+                                   extra_link_args=('-O3',),
+                                   compiler='gcc 12')
+
+
+def test_compiler_id(monkeypatch):
+    monkeypatch.setenv('CC', 'my-nonexistent-cc')
+    assert get_compiler_id().startswith('my-nonexistent-cc\nunknown')
@@ -834,6 +834,104 @@ def test_from_json_to_json(tmp_path):
     result.metadata['qx']['lhcb1'] = result.metadata['qx']['lhcb1'] + 1
     assert result.metadata != example_metadata
 
+@pytest.mark.parametrize('mmap', [True, False])
+def test_to_binary_from_binary(tmp_path, mmap):
+
+    line = xt.Line(
+        elements={
+            'm': xt.Multipole(knl=[1, 2]),
+            'd': xt.Drift(length=1),
+            'b': xt.Bend(length=0.5, k0=0.01, h=0.01),
+        },
+        element_names=['m', 'd', 'b', 'm', 'd']
+    )
+    line.particle_ref = xp.Particles(p0c=7e12, mass0=xp.PROTON_MASS_EV)
+    line.metadata = {'qx': 62.31}
+    line.config.TEST1 = True
+    line.matrix_stability_tol = 55.5
+    line._init_var_management()
+    line.vars['k1'] = 2.
+    line.element_refs['m'].knl[1] = line.vars['k1'] * 3
+
+    line.to_binary(tmp_path / 'line.bin')
+    result = xt.Line.from_binary(tmp_path / 'line.bin', mmap=mmap)
+
+    assert result.element_names == ['m', 'd', 'b', 'm', 'd']
+    assert xt._lines_equal(result, line)
+    assert result['b'].h == 0.01
+    assert result.particle_ref.p0c[0] == 7e12
+    assert result.metadata == {'qx': 62.31}
+    assert result.config.TEST1 == True
+    assert result.matrix_stability_tol == 55.5
+
+    # All elements in one buffer, shared with the file in copy-on-write mode
+    assert result['m']._buffer is result['b']._buffer
+    result.vars['k1'] = 4.
+    assert result['m'].knl[1] == 12.
+    assert line['m'].knl[1] == 6.
+    assert xt.Line.from_binary(tmp_path / 'line.bin')['m'].knl[1] == 6.
+    result.vars['k1'] = 2.
+
+    result.build_tracker()
+    particles = result.build_particles(x=[1e-3, 2e-3])
+    particles_ref = particles.copy()
+    result.track(particles)
+    line.build_tracker()
+    line.track(particles_ref)
+    assert np.all(particles.x == particles_ref.x)
+
+    with pytest.raises(ValueError):
+        with open(tmp_path / 'not_a_line.bin', 'wb') as fid:
+            fid.write(b'\0' * 100)
+        xt.Line.from_binary(tmp_path / 'not_a_line.bin')
+
+def test_from_binary_lazy(tmp_path):
+
+    line = xt.Line(
+        elements={
+            'm': xt.Multipole(knl=[0, 0.1]),
+            'd': xt.Drift(length=1),
+            'b': xt.Bend(length=0.5, k0=0.01, h=0.01),
+            'ap': xt.LimitRect(min_x=-0.1, max_x=0.1, min_y=-0.1, max_y=0.1),
+        },
+        element_names=['m', 'd', 'b', 'ap', 'd']
+    )
+    line.particle_ref = xp.Particles(p0c=7e12, mass0=xp.PROTON_MASS_EV)
+    line.to_binary(tmp_path / 'line.bin')
+
+    result = xt.Line.from_binary(tmp_path / 'line.bin', lazy=True)
+    assert result.element_dict.num_loaded == 0
+
+    # Building the tracker and tracking do not need the element objects
+    assert np.isclose(result.get_length(), 2.5)
+    tt = result.get_table()
+    assert np.all(tt.element_type == ['Multipole', 'Drift', 'Bend',
+                                      'LimitRect', 'Drift', ''])
+    result.build_tracker()
+    particles = result.build_particles(x=[1e-3, 2e-3])
+    result.track(particles, num_turns=10)
+    assert result.element_dict.num_loaded == 0
+
+    line.build_tracker()
+    particles_ref = line.build_particles(x=[1e-3, 2e-3])
+    line.track(particles_ref, num_turns=10)
+    assert np.all(particles.x == particles_ref.x)
+
+    # The elements are built when accessed
+    assert isinstance(result['b'], xt.Bend)
+    assert result['b'] is result.element_dict['b']
+    assert result.element_dict.num_loaded == 1
+    result['m'].knl[1] = 0.2
+    result.track(particles, num_turns=1)
+    line['m'].knl[1] = 0.2
+    line.track(particles_ref, num_turns=1)
+    assert np.all(particles.x == particles_ref.x)
+
+    assert xt._lines_equal(result, line)
+    assert result.element_dict.num_loaded == 4
+    assert all(type(ee) is not xt.line._UnloadedElement
+               for ee in dict(result.element_dict).values())
+
 @for_all_test_contexts
 def test_config_propagation(test_context):
     line = xt.Line(elements=10*[xt.Drift(length=1)])
@@ -966,6 +1064,56 @@ def test_insert_thin_elements_at_s_basic():
     assert t1.s[-2] == 5.
     assert t1.s[-3] == 5.
 
+def test_insert_elements_at_s():
+
+    line = xt.Line(
+        elements=[xt.Drift(length=2), xt.Marker(), xt.Drift(length=2),
+                  xt.Quadrupole(length=1, k1=0.1), xt.Drift(length=5)],
+        element_names=['d0', 'm0', 'd1', 'q0', 'd2'])
+
+    line.insert_elements_at_s([
+        (8.5, [('m_d2_b', xt.Marker())]),
+        (1., [('q1', xt.Quadrupole(length=2, k1=0.2))]), # replaces m0
+        (5., [('m_q0_exit', xt.Marker())]),
+        (6., [('m_d2_a0', xt.Marker()), ('m_d2_a1', xt.Marker())]),
+        (0., [('m_start', xt.Marker())]),
+        (7., [('q2', xt.Quadrupole(length=1, k1=0.3)),
+              ('m_q2_exit', xt.Marker())]),
+        (10., [('m_end', xt.Marker())]),
+    ])
+
+    tt = line.get_table()
+    assert np.all(tt.name == np.array([
+        'm_start', 'd0_0', 'q1', 'd0_1', 'q0', 'm_q0_exit', 'd2_0',
+        'm_d2_a0', 'm_d2_a1', 'd2_1', 'q2', 'm_q2_exit', 'd2_2', 'm_d2_b',
+        'd2_3', 'm_end', '_end_point']))
+    assert np.allclose(tt.s, [0, 0, 1, 3, 4, 5, 5, 6, 6, 6, 7, 8, 8, 8.5,
+                              8.5, 10, 10], atol=1e-12, rtol=0)
+    assert np.isclose(line.get_length(), 10, atol=1e-12, rtol=0)
+    assert 'm0' not in line.element_names
+
+    # Overlaps with active elements are rejected
+    with pytest.raises(ValueError):
+        line.insert_elements_at_s([(4.5, [('m_in_q0', xt.Marker())])])
+    with pytest.raises(ValueError):
+        line.insert_elements_at_s(
+            [(3.5, [('q3', xt.Quadrupole(length=1, k1=0.3))])])
+    with pytest.raises(ValueError):
+        line.insert_elements_at_s([
+            (5.5, [('q4', xt.Quadrupole(length=1, k1=0.3))]),
+            (6., [('m_in_q4', xt.Marker())])])
+
+    # Failed insertions leave the line untouched
+    names_before = list(line.element_names)
+    element_dict_keys_before = set(line.element_dict.keys())
+    with pytest.raises(ValueError):
+        line.insert_elements_at_s([(0.5, [('m_ok', xt.Marker())]),
+                                   (4.5, [('m_bad', xt.Marker())])])
+    assert line.element_names == names_before
+    assert set(line.element_dict.keys()) == element_dict_keys_before
+    line.insert_elements_at_s([(0.5, [('m_ok', xt.Marker())])])
+    assert 'm_ok' in line.element_names
+
 def test_insert_thin_elements_at_s_lhc():
 
     line = xt.Line.from_json(test_data_folder /
@@ -0,0 +1,182 @@
+import pathlib
+
+import numpy as np
+import pytest
+
+import xtrack as xt
+
+test_data_folder = pathlib.Path(
+            __file__).parent.joinpath('../test_data').absolute()
+
+
+def test_mad_parser_sequence_and_expressions():
+
+    parser = xt.MadxParser()
+    parser.input('''
+    kq = 0.1;
+    lq := 0.5 * lscale;
+    lscale = 2;
+    if (kq > 1) { kq = 10; } else { ks = 3 * kq; };
+
+    qq: quadrupole, l:=lq, k1:=kq;
+    qf: qq;
+    qd: qq, k1:=-kq;
+    ss: sextupole, l=0.2, k2:=ks;
+    mm: marker;
+
+    cell: sequence, l=10, refer=entry;
+        qf, at=1;
+        ss, at=1.5, from=qf;
+        qd, at=6;
+        mm, at=10;
+    endsequence;
+
+    beam, particle=proton, pc=7000;
+    ''')
+
+    assert parser.eval('kq') == 0.1
+    assert np.isclose(parser.eval('ks'), 0.3, atol=1e-15, rtol=0)
+    assert parser.eval('2 * lq') == 2
+
+    seq = parser.sequence.cell
+    assert seq.beam.particle == 'proton'
+    names = [ee.name for ee in seq.expanded_elements]
+    assert names == ['cell$start', 'drift_0', 'qf', 'drift_1', 'ss',
+                     'drift_2', 'qd', 'drift_3', 'mm', 'cell$end']
+
+    line = xt.Line.from_madx_sequence(seq, deferred_expressions=True,
+                                      allow_thick=True)
+    tt = line.get_table()
+    assert np.isclose(tt['s', 'qf'], 1, atol=1e-12, rtol=0)
+    assert np.isclose(tt['s', 'ss'], 2.5, atol=1e-12, rtol=0)
+    assert np.isclose(tt['s', 'qd'], 6, atol=1e-12, rtol=0)
+    assert np.isclose(line.get_length(), 10, atol=1e-12, rtol=0)
+
+    assert np.isclose(line['qf'].k1, 0.1, atol=1e-15, rtol=0)
+    assert np.isclose(line['qd'].k1, -0.1, atol=1e-15, rtol=0)
+    assert np.isclose(line['qd'].length, 1, atol=1e-15, rtol=0)
+
+    # Expressions are preserved in the line
+    line.vars['kq'] = 0.2
+    assert np.isclose(line['qf'].k1, 0.2, atol=1e-15, rtol=0)
+    assert np.isclose(line['qd'].k1, -0.2, atol=1e-15, rtol=0)
+    line.vars['ks'] = 1.
+    assert np.isclose(line['ss'].k2, 1., atol=1e-15, rtol=0)
+
+
+def test_mad_parser_unsupported_command():
+    parser = xt.MadxParser()
+    with pytest.raises(NotImplementedError):
+        parser.input('''
+        mm: marker;
+        seq: sequence, l=1; endsequence;
+        seqedit, sequence=seq; install, element=mm, at=0.5; endedit;
+        ''')
+
+    for text in ['set_k(val): macro = { kk = val; }; exec, set_k(1);',
+                 'exec, set_k(1);',
+                 'mm: marker; bl: line = (mm, mm);']:
+        with pytest.raises(NotImplementedError):
+            xt.MadxParser().input(text)
+
+
+def test_load_madx_optics_file_cpymad_fallback(tmp_path):
+
+    pytest.importorskip('cpymad.madx')
+
+    line = xt.Line(elements=[xt.Multipole(knl=[0, 0])])
+    line._init_var_management()
+    line.vars['kk'] = 0
+    line.element_refs['e0'].knl[1] = line.vars['kk']
+
+    fname = tmp_path / 'optics.str'
+    fname.write_text('''
+        set_k(val): macro = { kk = val; };
+        exec, set_k(0.3);
+        ''')
+    line.vars.load_madx_optics_file(fname)
+
+    assert line.varval['kk'] == 0.3
+    assert line['e0'].knl[1] == 0.3
+
+    fname = tmp_path / 'optics_with_line.str'
+    fname.write_text('''
+        kk = 0.4;
+        mm: marker;
+        bl: line = (mm, mm);
+        ''')
+    line.vars.load_madx_optics_file(fname)
+
+    assert line.varval['kk'] == 0.4
+    assert line['e0'].knl[1] == 0.4
+
+
+def test_mad_parser_vs_cpymad():
+
+    cpymad = pytest.importorskip('cpymad.madx')
+
+    files = [test_data_folder / 'psb_chicane/psb.seq',
+             test_data_folder / 'psb_chicane/psb_fb_lhc.str']
+
+    mad = cpymad.Madx(stdout=False)
+    for ff in files:
+        mad.call(str(ff))
+    mad.input('beam, particle=proton, pc=0.5708301551893517;')
+    mad.use('psb1')
+
+    parser = xt.MadxParser()
+    for ff in files:
+        parser.call(ff)
+    parser.input('beam, particle=proton, pc=0.5708301551893517;')
+
+    line_ref = xt.Line.from_madx_sequence(mad.sequence.psb1,
+                                          deferred_expressions=True,
+                                          allow_thick=True)
+    line = xt.Line.from_madx_sequence(parser.sequence.psb1,
+                                      deferred_expressions=True,
+                                      allow_thick=True)
+
+    assert line.element_names == line_ref.element_names
+
+    dct = line.to_dict()['elements']
+    dct_ref = line_ref.to_dict()['elements']
+    for nn in line_ref.element_names:
+        for kk, vv in dct_ref[nn].items():
+            if isinstance(vv, str):
+                assert dct[nn][kk] == vv
+            else:
+                assert np.allclose(dct[nn][kk], vv, atol=1e-12, rtol=1e-12)
+
+    for nn in line_ref.vars.keys():
+        if nn == '__vary_default':
+            continue
+        assert np.isclose(line.varval[nn], line_ref.varval[nn],
+                          atol=1e-14, rtol=1e-12)
+
+    line.vars['kbrqf'] = 0.123
+    line_ref.vars['kbrqf'] = 0.123
+    for nn in line_ref.element_names:
+        if hasattr(line_ref[nn], 'k1'):
+            assert np.isclose(line[nn].k1, line_ref[nn].k1,
+                              atol=1e-14, rtol=1e-12)
+
+
+def test_load_madx_optics_file_native():
+
+    parser = xt.MadxParser()
+    parser.call(test_data_folder / 'psb_chicane/psb.seq')
+    parser.call(test_data_folder / 'psb_chicane/psb_fb_lhc.str')
+    parser.input('beam, particle=proton, pc=0.5708301551893517;')
+    line = xt.Line.from_madx_sequence(parser.sequence.psb1,
+                                      deferred_expressions=True,
+                                      allow_thick=True)
+
+    kbrqf = line.varval['kbrqf']
+    line.vars['kbrqf'] = 0
+    assert line['br.qfo11'].k1 == 0
+
+    line.vars.load_madx_optics_file(
+        test_data_folder / 'psb_chicane/psb_fb_lhc.str')
+
+    assert line.varval['kbrqf'] == kbrqf
+    assert line['br.qfo11'].k1 != 0
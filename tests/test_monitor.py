@@ -208,6 +208,62 @@ def test_last_turns_monitor(test_context):
     assert np.all(monitor.x == np.array([[0,0,2,1,0],[3,5,7,9,11],[0,-2,-4,-6,-8],[20,23,26,29,32]]))
 
 
+@for_all_test_contexts
+def test_sparse_ebe_monitor(test_context):
+    line = xt.Line(elements=[xt.Drift(length=1.) for _ in range(10)])
+    line.build_tracker(_context=test_context)
+
+    particles = xp.Particles(p0c=6.5e12, px=[1e-3, 2e-3, 3e-3],
+                             _context=test_context)
+
+    monitor_full = xt.ParticlesMonitor(_context=test_context, start_at_turn=0,
+                                       stop_at_turn=11, num_particles=3)
+    monitor_full.ebe_mode = 1
+    line.track(particles.copy(), turn_by_turn_monitor=monitor_full)
+
+    record_at = [0, 3, 4, 10]
+    monitor = xt.ParticlesMonitor(_context=test_context,
+                                  ebe_record_at=record_at, num_particles=3)
+    assert monitor.ebe_mode == 2
+    line.track(particles.copy(), turn_by_turn_monitor=monitor)
+
+    assert monitor.x.shape == (3, len(record_at))
+    assert_allclose(monitor.x, monitor_full.x[:, record_at], atol=1e-15, rtol=0)
+    assert_allclose(monitor.s, monitor_full.s[:, record_at], atol=1e-15, rtol=0)
+    assert_equal(monitor.at_element, np.array([record_at] * 3))
+
+
+@for_all_test_contexts
+def test_memmap_particles_monitor(test_context, tmp_path):
+    line = xt.Line(elements=[xt.Drift(length=1.),
+                             xt.Multipole(knl=[0, 0.3]),
+                             xt.Drift(length=1.),
+                             xt.Multipole(knl=[0, -0.3], ksl=[0, 0.01])])
+    line.build_tracker(_context=test_context)
+
+    particles = xp.Particles(p0c=6.5e12, x=np.linspace(-1e-3, 1e-3, 5),
+                             y=1e-4, _context=test_context)
+    particles_ref = particles.copy()
+
+    monitor = xt.MemmapParticlesMonitor(tmp_path / 'tbt', start_at_turn=3,
+                                        stop_at_turn=45, num_particles=5,
+                                        turns_per_block=4)
+    line.track(particles, num_turns=30, turn_by_turn_monitor=monitor)
+    line.track(particles, num_turns=20, turn_by_turn_monitor=monitor)
+
+    line.track(particles_ref, num_turns=50, turn_by_turn_monitor=True)
+    monitor_ref = line.record_last_track
+
+    for nn in ['x', 'px', 'y', 'py', 'at_turn', 'particle_id']:
+        assert_equal(monitor[nn], getattr(monitor_ref, nn)[:, 3:45])
+
+    # Read back from disk
+    monitor_disk = xt.MemmapParticlesMonitor.from_path(tmp_path / 'tbt')
+    assert isinstance(monitor_disk.x, np.memmap)
+    assert_equal(monitor_disk.x[2, 10:20], monitor_ref.x[2, 13:23])
+    assert_equal(monitor_disk.at_turn[:, -1], 44)
+
+
 @for_all_test_contexts
 def test_beam_profile_monitor(test_context):
     gen = np.random.default_rng(seed=38715345)
@@ -493,3 +549,116 @@ def test_beam_position_monitor(test_context):
     expected_x_centroid[18:20] = np.nan
     assert_allclose(monitor.x_cen, expected_x_centroid, err_msg="Monitor x centroid does not match expected values")
     assert_allclose(monitor.y_cen, -expected_x_centroid, err_msg="Monitor y centroid does not match expected values")
+
+
+@for_all_test_contexts
+def test_tune_monitor(test_context):
+
+    qx0, qy0 = 0.31, 0.32
+    betx, bety = 10., 20.
+    line = xt.Line(elements=[xt.LineSegmentMap(length=1., qx=qx0, qy=qy0,
+                        betx=betx, bety=bety, detx_x=2e3, detx_y=-1e3,
+                        dety_y=3e3, dety_x=-1e3)])
+    line.particle_ref = xp.Particles(p0c=7e12)
+
+    npart = 20
+    monitor = xt.TuneMonitor(num_particles=npart, start_at_turn=5,
+                             stop_at_turn=205, betx=betx, bety=bety,
+                             _context=test_context)
+    line.append_element(monitor, 'tune_monitor')
+    line.build_tracker(_context=test_context)
+
+    x_norm = np.linspace(1e-6, 4e-4, npart + 2)
+    y_norm = np.linspace(1e-6, 2e-4, npart + 2)
+    particles = line.build_particles(x=x_norm * np.sqrt(betx),
+                                     y=y_norm * np.sqrt(bety),
+                                     px=0, py=0, zeta=0, delta=0)
+    line.track(particles, num_turns=300)
+
+    jx = x_norm[:npart]**2 / 2
+    jy = y_norm[:npart]**2 / 2
+    assert_allclose(monitor.jx, jx, rtol=1e-10, atol=0)
+    assert_allclose(monitor.jy, jy, rtol=1e-10, atol=0)
+    for qx, qy in [(monitor.qx, monitor.qy), (monitor.qx1, monitor.qy1),
+                   (monitor.qx2, monitor.qy2)]:
+        assert_allclose(qx, qx0 + 2e3 * jx - 1e3 * jy, rtol=0, atol=1e-12)
+        assert_allclose(qy, qy0 + 3e3 * jy - 1e3 * jx, rtol=0, atol=1e-12)
+    assert np.all(monitor.tune_diffusion < 1e-12)
+
+    # Nonlinear ring: the windowed average of the phase advances converges
+    # to the tunes obtained from the turn-by-turn data
+    line = xt.Line(elements=[
+        xt.LineSegmentMap(length=1., qx=qx0 / 2, qy=qy0 / 2,
+                          betx=betx, bety=bety),
+        xt.Multipole(knl=[0, 0, 0, 2000]),
+        xt.LineSegmentMap(length=1., qx=qx0 / 2, qy=qy0 / 2,
+                          betx=betx, bety=bety),
+    ])
+    line.particle_ref = xp.Particles(p0c=7e12)
+    line.build_tracker(_context=test_context)
+    tw = line.twiss(method='4d')
+
+    line.discard_tracker()
+    line.insert_element(element=xt.TuneMonitor(num_particles=npart,
+                            stop_at_turn=500, twiss=tw, at_element='e1',
+                            _context=test_context),
+                        name='tune_monitor', index=1)
+    line.build_tracker(_context=test_context)
+    monitor = line['tune_monitor']
+    assert monitor.betx == tw['betx', 'e1']
+
+    particles = line.build_particles(x=x_norm * np.sqrt(betx),
+                                     y=y_norm * np.sqrt(bety),
+                                     px=0, py=0, zeta=0, delta=0)
+    line.track(particles, num_turns=500, turn_by_turn_monitor=True)
+
+    rec = line.record_last_track
+    x_tbt = test_context.nparray_from_context_array(rec.x)[:npart]
+    y_tbt = test_context.nparray_from_context_array(rec.y)[:npart]
+    qx_naff = xt.footprint.estimate_tunes(x_tbt, method='naff')
+    qy_naff = xt.footprint.estimate_tunes(y_tbt, method='naff')
+
+    assert np.all(monitor.qy[1:] - qy0 < -1e-6) # octupole detuning
+    assert_allclose(monitor.qx, qx_naff, rtol=0, atol=1e-7)
+    assert_allclose(monitor.qy, qy_naff, rtol=0, atol=1e-7)
+    assert np.all(monitor.tune_diffusion < 1e-5)
+
+
+
+@for_all_test_contexts
+def test_tune_monitor_tune_close_to_integer(test_context):
+
+    # Phase space rotation with tunes close to an integer and a phase noise
+    # larger than the phase advance per turn: the phase advances oscillate
+    # around zero and must not be mixed with phase advances close to 2 pi
+    qx = np.array([1e-3, 1 - 1e-3, 2e-4])
+    qy = np.array([0.31, 0.9995, 1e-4])
+    npart = len(qx)
+    num_turns = 1000
+
+    monitor = xt.TuneMonitor(num_particles=npart, stop_at_turn=num_turns,
+                             betx=1., bety=1., _context=test_context)
+    line = xt.Line(elements=[monitor])
+    line.build_tracker(_context=test_context)
+
+    gen = np.random.default_rng(seed=123)
+    turns = np.arange(num_turns)[:, None]
+    phase_x = 2 * np.pi * qx * turns + gen.normal(0, 0.02, (num_turns, npart))
+    phase_y = 2 * np.pi * qy * turns + gen.normal(0, 0.02, (num_turns, npart))
+    dphi_x = np.diff(phase_x, axis=0) % (2 * np.pi)
+    assert np.all(np.any(dphi_x < 1, axis=0))
+    assert np.all(np.any(dphi_x > 2 * np.pi - 1, axis=0))
+
+    particles = xp.Particles(p0c=7e12, x=np.zeros(npart),
+                             _context=test_context)
+    np2ctx = test_context.nparray_to_context_array
+    for tt in range(num_turns):
+        particles.x[:] = np2ctx(1e-3 * np.cos(phase_x[tt]))
+        particles.px[:] = np2ctx(-1e-3 * np.sin(phase_x[tt]))
+        particles.y[:] = np2ctx(1e-3 * np.cos(phase_y[tt]))
+        particles.py[:] = np2ctx(-1e-3 * np.sin(phase_y[tt]))
+        line.track(particles, num_turns=1)
+
+    assert_allclose(monitor.qx, qx, rtol=0, atol=1e-5)
+    assert_allclose(monitor.qy, qy, rtol=0, atol=1e-5)
+    assert np.all(monitor.tune_diffusion < 1e-4)
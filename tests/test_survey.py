@@ -61,3 +61,58 @@ def test_survey_element0(test_context):
             assert np.isclose(svc_at_e.drift_length, sv0_at_e.drift_length, rtol=0, atol=1e-12)
             assert np.isclose(svc_at_e.angle, sv0_at_e.angle, rtol=0, atol=1e-12)
             assert np.isclose(svc_at_e.tilt, sv0_at_e.tilt, rtol=0, atol=1e-12)
+
+
+@for_all_test_contexts
+def test_survey_vertical_and_tilted_bends(test_context):
+
+    n_cells = 40
+    angle_cell = 2 * np.pi / n_cells
+    tilt_ring = np.pi / 5
+
+    elements = {
+        'd': xt.Drift(length=1.),
+        'mv': xt.Multipole(knl=[0], hyl=angle_cell),
+        'mt': xt.Multipole(knl=[0], hxl=angle_cell * np.cos(tilt_ring),
+                           hyl=angle_cell * np.sin(tilt_ring)),
+    }
+    line_vertical = xt.Line(elements=elements,
+                            element_names=['d', 'mv'] * n_cells)
+    line_tilted = xt.Line(elements=elements,
+                          element_names=['d', 'mt'] * n_cells)
+
+    for line in [line_vertical, line_tilted]:
+        sv_no_tracker = line.survey()
+        line.build_tracker(_context=test_context)
+        sv = line.survey()
+
+        for kk in ['X', 'Y', 'Z', 'theta', 'phi', 'psi', 'angle', 'tilt']:
+            assert np.allclose(sv[kk], sv_no_tracker[kk], rtol=0, atol=1e-14)
+
+        # Closed ring
+        assert np.isclose(sv.X[-1], 0, rtol=0, atol=1e-12)
+        assert np.isclose(sv.Y[-1], 0, rtol=0, atol=1e-12)
+        assert np.isclose(sv.Z[-1], 0, rtol=0, atol=1e-12)
+
+        # Compare against element-by-element advance
+        v = np.zeros(3)
+        w = xt.survey.get_w_from_angles(0, 0, 0)
+        for ii, (ll, aa, tt) in enumerate(
+                zip(sv.drift_length, sv.angle, sv.tilt)):
+            assert np.allclose([sv.X[ii], sv.Y[ii], sv.Z[ii]], v,
+                               rtol=0, atol=1e-12)
+            v, w = xt.survey.advance_element(v, w, length=ll, angle=aa,
+                                             tilt=tt)
+
+    # Positive hyl bends towards positive y
+    sv = line_vertical.survey()
+    assert np.allclose(sv.X, 0, rtol=0, atol=1e-14)
+    assert np.all(sv.Y[3:-2] > 0)
+    assert np.isclose(np.max(sv.Y), n_cells / np.pi, rtol=0.01)
+    assert np.allclose(sv.tilt[1:-1:2], -np.pi / 2, rtol=0, atol=1e-14)
+
+    # The plane of the tilted ring is rotated by tilt_ring around z
+    sv = line_tilted.survey()
+    assert np.allclose(sv.X * np.sin(tilt_ring), -sv.Y * np.cos(tilt_ring),
+                       rtol=0, atol=1e-10)
+    assert np.allclose(sv.angle[1:-1:2], angle_cell, rtol=0, atol=1e-14)
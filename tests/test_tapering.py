@@ -1,7 +1,10 @@
 import json
 import pathlib
 import numpy as np
+import pytest
 import xtrack as xt
+import xpart as xp
+from xobjects.test_helpers import for_all_test_contexts
 
 test_data_folder = pathlib.Path(
         __file__).parent.joinpath('../test_data').absolute()
@@ -123,3 +126,54 @@ def test_tapering_and_twiss_with_radiation():
         assert np.isclose(
             line['rf3'].voltage*np.sin((line['rf'].lag + line['rf'].lag_taper)/180*np.pi),
             eneloss/4, rtol=1e-5)
+
+
+@for_all_test_contexts
+def test_tapering_simple_ring(test_context):
+
+    if getattr(test_context, 'omp_num_threads', 0):
+        pytest.skip('Twiss with radiation not supported with OpenMP')
+
+    n_cells = 50
+    theta = np.pi / n_cells
+    elements = {}
+    for ii in range(n_cells):
+        for jj, sign in enumerate([1, -1]):
+            elements[f'q{ii}_{jj}'] = xt.Multipole(knl=[0, sign * 0.3])
+            elements[f'd{ii}_{jj}a'] = xt.Drift(length=1.)
+            elements[f'b{ii}_{jj}'] = xt.Multipole(knl=[theta], hxl=theta,
+                                                   length=2.)
+            elements[f'd{ii}_{jj}b'] = xt.Drift(length=1.)
+    elements['cav1'] = xt.Cavity(voltage=30e6, frequency=400e6, lag=180)
+    elements['cav2'] = xt.Cavity(voltage=10e6, frequency=400e6, lag=180)
+
+    line = xt.Line(elements=list(elements.values()),
+                   element_names=list(elements.keys()))
+    line.particle_ref = xp.Particles(mass0=xp.ELECTRON_MASS_EV, q0=-1,
+                                     p0c=6e9)
+    line.build_tracker(_context=test_context)
+
+    line.configure_radiation(model='mean')
+    line.compensate_radiation_energy_loss(record_iterations=True)
+
+    # Energy loss is shared between the cavities according to their voltage
+    assert len(line._tapering_iterations) >= 2
+    tw = line.twiss(eneloss_and_damping=True)
+    assert np.isclose(tw.eneloss_turn, 3.5975e6, rtol=1e-3, atol=0)
+    assert np.abs(tw.delta[0]) < 1e-8
+    assert np.abs(tw.delta[-1]) < 1e-8
+
+    v_cav = np.array([30e6, 10e6])
+    lag_taper = np.array([line['cav1'].lag_taper, line['cav2'].lag_taper])
+    phase = np.deg2rad(180 + lag_taper)
+    eneloss_cav = v_cav * np.sin(phase)
+    assert np.allclose(eneloss_cav / eneloss_cav.sum(), [0.75, 0.25],
+                       rtol=1e-6, atol=0)
+
+    # Multipoles tapered to the energy deviation along the closed orbit
+    tt = line.get_table()
+    tw_at_bends = tw.rows[tt.rows['b.*'].name]
+    for nn, delta in zip(tw_at_bends.name, tw_at_bends.delta):
+        assert np.isclose(line[nn].delta_taper, delta, rtol=0, atol=5e-5)
+    assert np.isclose(line['b0_0'].delta_taper, 0, rtol=0, atol=1e-4)
+    assert line[f'b{n_cells - 1}_1'].delta_taper < -5e-4
@@ -542,3 +542,221 @@ def test_tracking_with_progress(test_context, with_progress, turns, collective):
 
     assert np.all(particles.at_turn == turns)
     assert np.allclose(particles.s, 10 * turns, rtol=0, atol=1e-14)
+
+
+@for_all_test_contexts
+@pytest.mark.parametrize('num_workers', [1, 3])
+def test_track_chunked(test_context, num_workers):
+    if num_workers > 1 and not isinstance(test_context, xo.ContextCpu):
+        pytest.skip('Concurrent chunks only on CPU')
+
+    line = xt.Line(elements=[xt.Drift(length=1.),
+                             xt.Multipole(knl=[0, 0.3]),
+                             xt.Drift(length=1.),
+                             xt.Multipole(knl=[0, -0.3]),
+                             xt.LimitRect(min_x=-0.02, max_x=0.02,
+                                          min_y=-0.02, max_y=0.02)])
+    line.build_tracker(_context=test_context)
+
+    gen = np.random.default_rng(seed=123)
+    particles = xp.Particles(p0c=6.5e12, x=gen.normal(0, 8e-3, 103),
+                             px=gen.normal(0, 3e-3, 103))
+
+    particles_ref = particles.copy(_context=test_context)
+    line.track(particles_ref, num_turns=30, turn_by_turn_monitor=True)
+    particles_ref.move(_context=xo.context_default)
+    monitor_ref = line.record_last_track
+
+    line.track_chunked(particles, chunk_size=17, num_workers=num_workers,
+                       num_turns=30, turn_by_turn_monitor=True)
+    monitor = line.record_last_track
+
+    assert 0 < np.sum(particles.state <= 0) < 103
+
+    particles.sort(interleave_lost_particles=True)
+    particles_ref.sort(interleave_lost_particles=True)
+    for nn in ['particle_id', 'x', 'px', 'state', 'at_turn', 'at_element']:
+        assert np.allclose(getattr(particles, nn), getattr(particles_ref, nn),
+                           atol=1e-15, rtol=0)
+    for nn in ['x', 'px', 'at_turn']:
+        assert np.allclose(getattr(monitor, nn), getattr(monitor_ref, nn),
+                           atol=1e-15, rtol=0)
+
+    # Generator of particles
+    chunks = (xp.Particles(p0c=6.5e12, x=np.linspace(-1e-3, 1e-3, 10) + 1e-3 * ii)
+              for ii in range(3))
+    out = line.track_chunked(chunks, chunk_size=10, num_turns=5)
+    assert len(out.x) == 30
+    assert np.all(out.state == 1)
+
+
+def test_track_chunked_with_monitor():
+
+    def _make_line():
+        line = xt.Line(elements=[
+            xt.Drift(length=1.),
+            xt.Multipole(knl=[0, 0.3]),
+            xt.BeamPositionMonitor(start_at_turn=0, stop_at_turn=5, frev=1,
+                                   sampling_frequency=1),
+            xt.Drift(length=1.)])
+        line.build_tracker()
+        return line
+
+    particles = xp.Particles(p0c=6.5e12, x=np.linspace(-1e-3, 2e-3, 100))
+
+    line = _make_line()
+    # The monitor accumulates over all particles, the chunks cannot be
+    # tracked concurrently
+    with pytest.raises(ValueError):
+        line.track_chunked(particles.copy(), chunk_size=10, num_workers=4,
+                           num_turns=5)
+
+    line_ref = _make_line()
+    line_ref.track(particles.copy(), num_turns=5)
+    monitor_ref = line_ref.elements[2]
+
+    line.track_chunked(particles, chunk_size=10, num_workers=1, num_turns=5)
+    monitor = line.elements[2]
+
+    assert np.all(monitor.count == monitor_ref.count)
+    assert np.allclose(monitor.x_sum, monitor_ref.x_sum, atol=1e-15, rtol=0)
+
+
+@for_all_test_contexts
+def test_track_compact_lost_particles(test_context):
+    line = xt.Line(elements=[xt.Drift(length=1.),
+                             xt.Multipole(knl=[0, 0.3, 0, 30.]),
+                             xt.Drift(length=1.),
+                             xt.Multipole(knl=[0, -0.3]),
+                             xt.LimitRect(min_x=-0.02, max_x=0.02,
+                                          min_y=-0.02, max_y=0.02)])
+    line.build_tracker(_context=test_context)
+
+    gen = np.random.default_rng(seed=123)
+    particles = xp.Particles(p0c=6.5e12, x=gen.normal(0, 8e-3, 1000),
+                             px=gen.normal(0, 3e-3, 1000),
+                             _context=test_context)
+    particles_ref = particles.copy()
+
+    line.track(particles_ref, num_turns=100, turn_by_turn_monitor=True)
+    monitor_ref = line.record_last_track
+    line.track(particles, num_turns=100, turn_by_turn_monitor=True,
+               compact_every_n_turns=7)
+    monitor = line.record_last_track
+
+    particles.move(_context=xo.context_default)
+    particles_ref.move(_context=xo.context_default)
+
+    assert particles._capacity == 1000
+    assert 0 < np.sum(particles.state <= 0) < 1000
+
+    particles.sort(interleave_lost_particles=True)
+    particles_ref.sort(interleave_lost_particles=True)
+    for nn in ['particle_id', 'x', 'px', 'state', 'at_turn', 'at_element']:
+        assert np.all(getattr(particles, nn) == getattr(particles_ref, nn))
+    for nn in ['x', 'px', 'at_turn']:
+        assert np.all(getattr(monitor, nn) == getattr(monitor_ref, nn))
+
+
+def test_track_compact_lost_particles_collective():
+    elements = [xt.Drift(length=1.) for _ in range(3)]
+    elements[1].iscollective = True
+    line = xt.Line(elements=elements)
+    line.build_tracker()
+
+    particles = xp.Particles(p0c=6.5e12, x=[1e-3, 2e-3])
+    with pytest.raises(ValueError, match='compact_every_n_turns'):
+        line.track(particles, num_turns=10, compact_every_n_turns=2)
+
+
+@pytest.mark.parametrize('scheduling', ['dynamic', 'guided'])
+def test_omp_scheduling_and_num_threads(scheduling):
+    context = xo.ContextCpu(omp_num_threads=2)
+    line = xt.Line(elements=[xt.Drift(length=1.),
+                             xt.Multipole(knl=[0, 0.3, 0, 30.]),
+                             xt.Drift(length=1.),
+                             xt.Multipole(knl=[0, -0.3]),
+                             xt.LimitRect(min_x=-0.02, max_x=0.02,
+                                          min_y=-0.02, max_y=0.02)])
+    line.build_tracker(_context=context)
+
+    gen = np.random.default_rng(seed=123)
+    particles = xp.Particles(p0c=6.5e12, x=gen.normal(0, 8e-3, 1000),
+                             px=gen.normal(0, 3e-3, 1000), _context=context)
+    particles_ref = particles.copy()
+    line.track(particles_ref, num_turns=50)
+
+    if scheduling == 'dynamic':
+        line.config.XTRACK_OMP_SCHEDULE_DYNAMIC = True
+    else:
+        line.config.XTRACK_OMP_SCHEDULE_GUIDED = True
+    line.config.XTRACK_OMP_CHUNK_SIZE = 16
+    line.track(particles, num_turns=50, num_threads=3)
+
+    assert context.omp_num_threads == 2
+    assert 0 < np.sum(particles.state <= 0) < 1000
+
+    particles.sort(interleave_lost_particles=True)
+    particles_ref.sort(interleave_lost_particles=True)
+    for nn in ['particle_id', 'x', 'px', 'state', 'at_turn', 'at_element']:
+        assert np.all(getattr(particles, nn) == getattr(particles_ref, nn))
+
+    # num_threads not available without OpenMP
+    line.discard_tracker()
+    line.build_tracker(_context=xo.ContextCpu())
+    with pytest.raises(ValueError):
+        line.track(particles, num_turns=1, num_threads=2)
+
+
+@pytest.mark.parametrize('collective', [False, True])
+def test_profiling(collective):
+    elements = [xt.Drift(length=1.), xt.Multipole(knl=[0, 0.3]),
+                xt.Drift(length=1.), xt.Multipole(knl=[0, -0.3])]
+    if collective:
+        elements[2].iscollective = True
+    line = xt.Line(elements=elements)
+    line.build_tracker()
+
+    particles = xp.Particles(p0c=6.5e12, x=np.linspace(-1e-3, 1e-3, 100))
+    particles_ref = particles.copy()
+    line.track(particles_ref, num_turns=20)
+
+    line.start_profiling()
+    assert line.config.XTRACK_PROFILING
+    line.track(particles, num_turns=10)
+    line.track(particles, num_turns=10)
+
+    for nn in ['x', 'px', 'at_turn', 'state']:
+        assert np.all(getattr(particles, nn) == getattr(particles_ref, nn))
+
+    tab = line.get_profiling_table()
+    assert np.all(tab.name == np.array(line.element_names))
+    assert np.all(tab.element_type == np.array(
+                                ['Drift', 'Multipole', 'Drift', 'Multipole']))
+    assert np.all(tab.num_calls == 20)
+    assert np.all(tab.time > 0)
+    assert np.isclose(np.sum(tab.fraction), 1)
+
+    tab_type = line.get_profiling_table(group_by='element_type')
+    assert np.all(tab_type.name == np.array(['Drift', 'Multipole']))
+    assert np.all(tab_type.num_calls == 40)
+    assert np.isclose(tab_type['time', 'Drift'],
+                      tab['time', 'e0'] + tab['time', 'e2'])
+
+    summary = line.get_profiling_summary()
+    assert summary['particle_turns'] == 2000
+    assert summary['num_track_calls'] == 2
+    assert summary['kernel_time'] > 0
+    assert summary['total_time'] >= summary['kernel_time']
+    assert (summary['collective_time'] > 0) == collective
+    assert np.isclose(summary['particle_turns_per_s'],
+                      2000 / summary['total_time'])
+
+    line.stop_profiling()
+    assert 'XTRACK_PROFILING' not in line.config
+    line.track(particles, num_turns=10)
+    assert line.get_profiling_summary()['particle_turns'] == 2000
+
+    line.start_profiling()
+    assert line.get_profiling_summary()['particle_turns'] == 0
+    assert np.all(line.get_profiling_table().num_calls == 0)
@@ -1465,4 +1465,388 @@ def test_adaptive_steps_for_rmatrix(test_context):
     assert np.isclose(tw.lhcb1.steps_r_matrix['dx'], expected_dx_b1, atol=0, rtol=1e-4)
     assert np.isclose(tw.lhcb1.steps_r_matrix['dy'], expected_dy_b1, atol=0, rtol=1e-4)
     assert np.isclose(tw.lhcb2.steps_r_matrix['dx'], expected_dx_b2, atol=0, rtol=1e-4)
-    assert np.isclose(tw.lhcb2.steps_r_matrix['dy'], expected_dy_b2, atol=0, rtol=1e-4)
\ No newline at end of file
+    assert np.isclose(tw.lhcb2.steps_r_matrix['dy'], expected_dy_b2, atol=0, rtol=1e-4)
+
+
+@for_all_test_contexts
+def test_one_turn_matrices_finite_differences_batch(test_context):
+    n = 6
+    fodo = [
+        xt.Multipole(length=0.2, knl=[0, +0.2], ksl=[0, 0]),
+        xt.Drift(length=1.0),
+        xt.Multipole(length=0.2, knl=[0, -0.2], ksl=[0, 0]),
+        xt.Drift(length=1.0),
+        xt.Multipole(length=1.0, knl=[2 * np.pi / n, 0, 0.1],
+                     hxl=[2 * np.pi / n]),
+        xt.Drift(length=1.0),
+    ]
+    line = xt.Line(elements=n * fodo + [xt.Cavity(frequency=1e9, voltage=0, lag=180)])
+    line.particle_ref = xp.Particles(mass0=xp.PROTON_MASS_EV, q0=1, p0c=1e9)
+    line.build_tracker(_context=test_context)
+
+    tw = line.twiss(method='4d')
+
+    delta_test = [-1e-3, 0, 2e-3]
+    p_co = [tw.particle_on_co.copy(_context=xo.context_default)
+            for _ in delta_test]
+    for pp, dd in zip(p_co, delta_test):
+        pp.update_delta(np.array([dd]))
+    particles_on_co = xp.Particles.merge(p_co, _context=test_context)
+
+    RR_batch = line.compute_one_turn_matrices_finite_differences(
+                                particles_on_co=particles_on_co)['R_matrix']
+    assert RR_batch.shape == (len(delta_test), 6, 6)
+
+    for ii, pp in enumerate(p_co):
+        RR = line.compute_one_turn_matrix_finite_differences(
+            particle_on_co=pp.copy(_context=test_context))['R_matrix']
+        assert np.allclose(RR_batch[ii], RR, atol=1e-7, rtol=0)
+
+    # Off-momentum matrices differ because of the chromaticity
+    assert not np.allclose(RR_batch[0], RR_batch[1], atol=1e-5, rtol=0)
+
+
+@for_all_test_contexts
+def test_one_turn_matrix_ebe_sparse(test_context):
+    n = 6
+    fodo = [
+        xt.Multipole(length=0.2, knl=[0, +0.2], ksl=[0, 0]),
+        xt.Drift(length=1.0),
+        xt.Multipole(length=0.2, knl=[0, -0.2], ksl=[0, 0]),
+        xt.Drift(length=1.0),
+        xt.Multipole(length=1.0, knl=[2 * np.pi / n], hxl=[2 * np.pi / n]),
+        xt.Drift(length=1.0),
+        xt.Marker(),
+    ]
+    line = xt.Line(elements=n * fodo + [xt.Cavity(frequency=1e9, voltage=0, lag=180)])
+    line.particle_ref = xp.Particles(mass0=xp.PROTON_MASS_EV, q0=1, p0c=1e9)
+    line.build_tracker(_context=test_context)
+
+    tw = line.twiss(method='4d')
+
+    out_full = line.compute_one_turn_matrix_finite_differences(
+        particle_on_co=tw.particle_on_co.copy(), element_by_element=True)
+    RR_ebe_full = out_full['R_matrix_ebe']
+    assert RR_ebe_full.shape == (len(line.element_names) + 1, 6, 6)
+
+    out_markers = line.compute_one_turn_matrix_finite_differences(
+        particle_on_co=tw.particle_on_co.copy(), element_by_element=True,
+        only_markers=True)
+    i_markers = np.array([ii for ii, ee in enumerate(line.elements)
+                          if isinstance(ee, xt.Marker)]
+                         + [len(line.element_names)])
+    assert np.all(out_markers['R_matrix_ebe_at_element'] == i_markers)
+    assert out_markers['R_matrix_ebe'].shape == (len(i_markers), 6, 6)
+    assert np.allclose(out_markers['R_matrix_ebe'], RR_ebe_full[i_markers],
+                       atol=1e-12, rtol=0)
+    assert np.allclose(out_markers['R_matrix'], out_full['R_matrix'],
+                       atol=1e-12, rtol=0)
+
+    at_elements = [line.element_names[3], 10, len(line.element_names)]
+    out_at = line.compute_one_turn_matrix_finite_differences(
+        particle_on_co=tw.particle_on_co.copy(), element_by_element=True,
+        at_elements=at_elements)
+    assert np.allclose(out_at['R_matrix_ebe'], RR_ebe_full[[3, 10, -1]],
+                       atol=1e-12, rtol=0)
+
+
+@for_all_test_contexts
+def test_closed_orbit_newton(test_context):
+    n = 6
+    fodo = [
+        xt.Multipole(length=0.2, knl=[0, +0.2], ksl=[0, 0]),
+        xt.Drift(length=1.0),
+        xt.Multipole(length=0.2, knl=[0, -0.2], ksl=[0, 0]),
+        xt.Drift(length=1.0),
+        xt.Multipole(length=1.0, knl=[2 * np.pi / n], hxl=[2 * np.pi / n]),
+        xt.Drift(length=1.0),
+    ]
+    line = xt.Line(elements=n * fodo + [xt.Cavity(frequency=1e9, voltage=0, lag=180)])
+    line.particle_ref = xp.Particles(mass0=xp.PROTON_MASS_EV, q0=1, p0c=1e9)
+    line.build_tracker(_context=test_context)
+
+    line.elements[0].knl[0] = 1e-4
+    line.elements[2].ksl[0] = 2e-4
+
+    p_fsolve = line.find_closed_orbit(delta0=1e-4)
+    p_newton = line.find_closed_orbit(delta0=1e-4,
+                                      co_search_settings={'method': 'newton'})
+
+    info = p_newton._co_search_info
+    assert info['converged']
+    assert info['n_track_calls'] == info['n_iter']
+    assert not info['jacobian_reused']
+
+    for kk in ['x', 'px', 'y', 'py', 'zeta', 'delta']:
+        assert np.allclose(getattr(p_newton, kk), getattr(p_fsolve, kk),
+                           atol=1e-10, rtol=0)
+
+    # Small knob change, the previous solution and Jacobian are reused
+    line.elements[0].knl[0] = 1.1e-4
+    p_newton = line.find_closed_orbit(delta0=1e-4,
+                                      co_search_settings={'method': 'newton'})
+    p_fsolve = line.find_closed_orbit(delta0=1e-4)
+    assert p_newton._co_search_info['jacobian_reused']
+    assert p_newton._co_search_info['converged']
+    for kk in ['x', 'px', 'y', 'py']:
+        assert np.allclose(getattr(p_newton, kk), getattr(p_fsolve, kk),
+                           atol=1e-10, rtol=0)
+
+    tw_newton = line.twiss(method='4d', co_search_settings={'method': 'newton'})
+    tw_fsolve = line.twiss(method='4d')
+    assert np.allclose(tw_newton.x, tw_fsolve.x, atol=1e-10, rtol=0)
+    assert np.isclose(tw_newton.qx, tw_fsolve.qx, atol=1e-8, rtol=0)
+    assert tw_newton.particle_on_co._co_search_info['converged']
+    assert tw_fsolve.particle_on_co._co_search_info is None
+
+    with pytest.raises(ValueError):
+        line.find_closed_orbit(delta0=1e-4,
+            co_search_settings={'method': 'newton', 'max_iter': 0})
+
+
+@for_all_test_contexts
+def test_twiss_incremental(test_context, mocker):
+    n = 6
+    elements = {}
+    element_names = []
+    for ii in range(n):
+        elements.update({
+            f'qf{ii}': xt.Multipole(length=0.2, knl=[0, +0.2]),
+            f'd1_{ii}': xt.Drift(length=1.0),
+            f'qd{ii}': xt.Multipole(length=0.2, knl=[0, -0.2]),
+            f'd2_{ii}': xt.Drift(length=1.0),
+            f'mb{ii}': xt.Multipole(length=1.0, knl=[2 * np.pi / n],
+                                    hxl=[2 * np.pi / n]),
+            f'd3_{ii}': xt.Drift(length=1.0),
+        })
+        element_names += [f'qf{ii}', f'd1_{ii}', f'qd{ii}', f'd2_{ii}',
+                          f'mb{ii}', f'd3_{ii}']
+    line = xt.Line(elements=elements, element_names=element_names)
+    line.particle_ref = xp.Particles(mass0=xp.PROTON_MASS_EV, q0=1, p0c=1e9)
+    line._init_var_management()
+    line.vars['kqd4'] = -0.2
+    line.element_refs['qd4'].knl[1] = line.vars['kqd4']
+    line.build_tracker(_context=test_context)
+
+    tw_init = line.twiss(method='4d').get_twiss_init(at_element='qf0')
+
+    tw_kwargs = dict(method='4d', ele_start='qf0', ele_stop='d3_5',
+                     twiss_init=tw_init)
+
+    line.twiss(incremental=True, **tw_kwargs)
+    mon_before = line.record_last_track
+    x_before = mon_before.x.copy()
+
+    spy_track = mocker.spy(line, 'track')
+    line.vars['kqd4'] = -0.21
+    tw_inc = line.twiss(incremental=True, **tw_kwargs)
+    tw_ref = line.twiss(**tw_kwargs)
+
+    # The monitor of the previous call is not modified
+    assert np.array_equal(mon_before.x, x_before)
+
+    if isinstance(test_context, xo.ContextCpu):
+        # Only the part of the line downstream of the modified element is
+        # tracked again
+        assert spy_track.call_args_list[0].kwargs['ele_start'] == (
+                                        line.element_names.index('qd4'))
+
+    assert np.all(tw_inc.name == tw_ref.name)
+    for kk in ['s', 'x', 'px', 'betx', 'bety', 'alfx', 'alfy', 'mux', 'muy',
+               'dx', 'dpx']:
+        assert np.allclose(tw_inc[kk], tw_ref[kk], atol=1e-12, rtol=0)
+
+    # Changes upstream of the modified element are correctly accounted for
+    line['qf1'].knl[1] = 0.21
+    tw_inc = line.twiss(incremental=True, **tw_kwargs)
+    tw_ref = line.twiss(**tw_kwargs)
+    for kk in ['betx', 'bety', 'mux', 'muy', 'dx']:
+        assert np.allclose(tw_inc[kk], tw_ref[kk], atol=1e-12, rtol=0)
+
+    # Nothing changed
+    tw_inc = line.twiss(incremental=True, **tw_kwargs)
+    for kk in ['betx', 'bety', 'mux', 'muy', 'dx']:
+        assert np.allclose(tw_inc[kk], tw_ref[kk], atol=1e-12, rtol=0)
+
+
+@for_all_test_contexts
+def test_twiss_chromatic_single_pass(test_context, mocker):
+    n = 6
+    fodo = [
+        xt.Multipole(length=0.2, knl=[0, +0.2, 0.1]),
+        xt.Drift(length=1.0),
+        xt.Multipole(length=0.2, knl=[0, -0.2, -0.05]),
+        xt.Drift(length=1.0),
+        xt.Multipole(length=1.0, knl=[2 * np.pi / n], hxl=[2 * np.pi / n]),
+        xt.Drift(length=1.0),
+    ]
+    line = xt.Line(elements=n * fodo)
+    line.particle_ref = xp.Particles(mass0=xp.PROTON_MASS_EV, q0=1, p0c=1e9)
+    line.build_tracker(_context=test_context)
+
+    ele_start = line.element_names[0]
+    ele_stop = line.element_names[20]
+    tw_init = line.twiss(method='4d').get_twiss_init(at_element=ele_start)
+
+    for tw_kwargs in [dict(method='4d'),
+                      dict(method='4d', reverse=True),
+                      dict(method='4d', ele_start=ele_start, ele_stop=ele_stop,
+                           twiss_init=tw_init,
+                           compute_chromatic_properties=True)]:
+
+        # On- and off-momentum particles are tracked together
+        spy_track = mocker.spy(line, 'track')
+        tw = line.twiss(**tw_kwargs)
+        n_part_tracked = [cc.args[0]._capacity
+                          for cc in spy_track.call_args_list
+                          if cc.kwargs.get('turn_by_turn_monitor') is not None]
+        assert n_part_tracked == [39]
+        mocker.stop(spy_track)
+
+        # Separate tracking of the off-momentum particles
+        tw_ref = line.twiss(_keep_tracking_data=True, **tw_kwargs)
+
+        assert np.all(tw.name == tw_ref.name)
+        for kk in ['betx', 'bety', 'dx', 'mux', 'muy', 'dmux', 'dmuy',
+                   'bx_chrom', 'by_chrom', 'ax_chrom', 'ay_chrom']:
+            assert np.allclose(tw[kk], tw_ref[kk], atol=1e-10, rtol=0)
+        if 'twiss_init' not in tw_kwargs:
+            assert np.isclose(tw.dqx, tw_ref.dqx, atol=1e-10, rtol=0)
+            assert np.isclose(tw.dqy, tw_ref.dqy, atol=1e-10, rtol=0)
+
+
+def test_compute_linear_normal_form_batch():
+
+    from xtrack.linear_normal_form import (compute_linear_normal_form,
+                                           compute_linear_normal_form_batch)
+
+    # One-turn matrices built from known optics and tunes
+    n_mat = 50
+    qx = np.linspace(0.05, 0.45, n_mat)
+    qy = qx[::-1] + 0.01
+    qs = np.full(n_mat, 0.002)
+    betx = np.linspace(1., 100., n_mat)
+    alfx = np.linspace(-2., 2., n_mat)
+    bety = np.linspace(50., 5., n_mat)
+    alfy = np.linspace(1., -1., n_mat)
+
+    MM = np.zeros((n_mat, 6, 6))
+    for ii in range(n_mat):
+        W = np.identity(6)
+        W[0, 0] = np.sqrt(betx[ii])
+        W[1, 0] = -alfx[ii] / np.sqrt(betx[ii])
+        W[1, 1] = 1 / np.sqrt(betx[ii])
+        W[2, 2] = np.sqrt(bety[ii])
+        W[3, 2] = -alfy[ii] / np.sqrt(bety[ii])
+        W[3, 3] = 1 / np.sqrt(bety[ii])
+        W[4, 4] = 10.
+        W[5, 5] = 0.1
+        Rot = np.zeros((6, 6))
+        for kk, qq in enumerate([qx[ii], qy[ii], qs[ii]]):
+            mu = 2 * np.pi * qq
+            Rot[2*kk:2*kk+2, 2*kk:2*kk+2] = [[np.cos(mu), np.sin(mu)],
+                                             [-np.sin(mu), np.cos(mu)]]
+        MM[ii] = W @ Rot @ np.linalg.inv(W)
+
+    # Make one matrix unstable
+    MM[10, :2, :2] *= 1.1
+
+    W, invW, Rot, eigenvalues, diagnostics = compute_linear_normal_form_batch(
+        MM, responsiveness_tol=1e-15, stability_tol=1e-3)
+
+    assert W.shape == (n_mat, 6, 6)
+    assert invW.shape == (n_mat, 6, 6)
+    assert Rot.shape == (n_mat, 6, 6)
+    assert eigenvalues.shape == (n_mat, 3)
+
+    mask_ok = np.ones(n_mat, dtype=bool)
+    mask_ok[10] = False
+    assert np.all(diagnostics['valid'] == mask_ok)
+    assert np.all(diagnostics['stable'] == mask_ok)
+    assert np.all(diagnostics['responsive'])
+    assert np.all(np.isnan(W[10]))
+
+    assert np.allclose(W[mask_ok, 0, 0]**2 + W[mask_ok, 0, 1]**2,
+                       betx[mask_ok], rtol=1e-10, atol=0)
+    assert np.allclose(W[mask_ok, 2, 2]**2 + W[mask_ok, 2, 3]**2,
+                       bety[mask_ok], rtol=1e-10, atol=0)
+    assert np.allclose(np.angle(eigenvalues[mask_ok, :]) / 2 / np.pi,
+                       np.array([qx, qy, qs]).T[mask_ok], rtol=0, atol=1e-12)
+
+    # Same as the non-batched version
+    for ii in np.where(mask_ok)[0]:
+        W_ref, invW_ref, Rot_ref, eig_ref = compute_linear_normal_form(MM[ii])
+        assert np.allclose(W[ii], W_ref, rtol=0, atol=1e-14)
+        assert np.allclose(invW[ii], invW_ref, rtol=0, atol=1e-12)
+        assert np.allclose(Rot[ii], Rot_ref, rtol=0, atol=1e-14)
+        assert np.allclose(eigenvalues[ii], eig_ref, rtol=0, atol=1e-14)
+
+    with pytest.raises(ValueError):
+        compute_linear_normal_form(MM[10], stability_tol=1e-3)
+
+    # Batched symplectification
+    MM_sym = xt.linear_normal_form.healy_symplectify(MM[mask_ok] * 1.001)
+    for ii in range(MM_sym.shape[0]):
+        assert np.allclose(MM_sym[ii], xt.linear_normal_form.healy_symplectify(
+            MM[mask_ok][ii] * 1.001), rtol=0, atol=1e-14)
+        assert np.allclose(np.linalg.det(MM_sym[ii]), 1, rtol=0, atol=1e-12)
+
+
+@for_all_test_contexts
+def test_normalized_coordinates_many_elements(test_context):
+    n = 6
+    fodo = [
+        xt.Multipole(length=0.2, knl=[0, +0.2], ksl=[0, 0.01]),
+        xt.Drift(length=1.0),
+        xt.Multipole(length=0.2, knl=[0, -0.2]),
+        xt.Drift(length=1.0),
+        xt.Multipole(length=1.0, knl=[2 * np.pi / n], hxl=[2 * np.pi / n]),
+        xt.Drift(length=1.0),
+    ]
+    line = xt.Line(elements=n * fodo
+                   + [xt.Cavity(frequency=400e6, voltage=6e6, lag=0)])
+    line.particle_ref = xp.Particles(mass0=xp.PROTON_MASS_EV, q0=1, p0c=1e9)
+    line.build_tracker(_context=test_context)
+
+    tw = line.twiss()
+
+    n_part = 1000
+    rng = np.random.default_rng(seed=123)
+    at_element = rng.integers(0, len(line.element_names), n_part)
+    x_norm, px_norm, y_norm, py_norm = rng.normal(size=(4, n_part))
+    zeta_norm, pzeta_norm = 1e-2 * rng.normal(size=(2, n_part))
+
+    particles = tw.build_particles_from_normalized_coordinates(
+        at_element=at_element, x_norm=x_norm, px_norm=px_norm,
+        y_norm=y_norm, py_norm=py_norm, zeta_norm=zeta_norm,
+        pzeta_norm=pzeta_norm, nemitt_x=2.5e-6, nemitt_y=1e-6,
+        _context=test_context)
+
+    # Same as building the particles at each element separately
+    ctx2np = test_context.nparray_from_context_array
+    for ii in [0, 1, 2]:
+        particles_ref = line.build_particles(
+            at_element=at_element[ii], x_norm=x_norm[ii], px_norm=px_norm[ii],
+            y_norm=y_norm[ii], py_norm=py_norm[ii], zeta_norm=zeta_norm[ii],
+            pzeta_norm=pzeta_norm[ii], nemitt_x=2.5e-6, nemitt_y=1e-6)
+        for nn in ['x', 'px', 'y', 'py', 'zeta', 'delta', 's', 'at_element']:
+            assert np.isclose(ctx2np(getattr(particles, nn))[ii],
+                              ctx2np(getattr(particles_ref, nn))[0],
+                              rtol=0, atol=1e-14)
+
+    # Some particles are lost (they are normalized at their loss location)
+    state = ctx2np(particles.state)
+    state[::10] = 0
+    particles.state[:] = test_context.nparray_to_context_array(state)
+
+    norm_coord = tw.get_normalized_coordinates(particles, nemitt_x=2.5e-6,
+                                               nemitt_y=1e-6)
+
+    assert np.all(norm_coord['at_element'] == at_element)
+    assert np.allclose(norm_coord['x_norm'], x_norm, atol=1e-10, rtol=0)
+    assert np.allclose(norm_coord['px_norm'], px_norm, atol=1e-10, rtol=0)
+    assert np.allclose(norm_coord['y_norm'], y_norm, atol=1e-10, rtol=0)
+    assert np.allclose(norm_coord['py_norm'], py_norm, atol=1e-10, rtol=0)
+    assert np.allclose(norm_coord['zeta_norm'], zeta_norm, atol=1e-10, rtol=0)
+    assert np.allclose(norm_coord['pzeta_norm'], pzeta_norm, atol=1e-10,
+                       rtol=0)
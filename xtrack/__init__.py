@@ -28,6 +28,7 @@ from . import linear_normal_form
 from .multiline import Multiline, MultiTwiss
 
 from .mad_loader import MadLoader
+from .mad_parser import MadxParser
 
 from .multisetter import MultiSetter
 
@@ -1,7 +1,131 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import xobjects as xo
 import xtrack as xt
 
+TUNE_METHODS = ('fft', 'hann', 'naff')
+
+
+def _hann_window(n_turns):
+    return 1. - np.cos(2 * np.pi * np.arange(n_turns) / n_turns)
+
+
+def _tune_peak_hann(signal, window):
+    '''
+    Peak of the spectrum of the windowed signals (one per row), refined by
+    interpolating the amplitudes of the bins around the maximum (exact for a
+    pure tone with the Hann window).
+    '''
+
+    n_turns = signal.shape[1]
+    spectrum = np.abs(np.fft.rfft(signal * window, axis=1))
+    spectrum[:, 0] = 0 # remove residual offset
+
+    i_peak = np.argmax(spectrum, axis=1)
+    rows = np.arange(signal.shape[0])
+    a_peak = spectrum[rows, i_peak]
+    a_left = spectrum[rows, np.maximum(i_peak - 1, 0)]
+    a_right = spectrum[rows, np.minimum(i_peak + 1, spectrum.shape[1] - 1)]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        delta = np.where(a_right > a_left,
+                         (2 * a_right - a_peak) / (a_peak + a_right),
+                         -(2 * a_left - a_peak) / (a_peak + a_left))
+    delta = np.nan_to_num(delta, nan=0.)
+
+    return (i_peak + delta) / n_turns
+
+
+def _tune_naff(signal, window, n_iter=5):
+    '''
+    Frequency maximizing the amplitude of the windowed Fourier integral
+    (first step of the NAFF algorithm), found with Newton iterations
+    starting from the interpolated peak of the spectrum.
+    '''
+
+    n_turns = signal.shape[1]
+    tt = np.arange(n_turns)
+    wsignal = signal * window
+    q = _tune_peak_hann(signal, window)
+
+    for _ in range(n_iter):
+        phase = np.exp(-2j * np.pi * q[:, None] * tt[None, :])
+        ff = wsignal * phase
+        f0 = ff.sum(axis=1)
+        f1 = (ff * (-2j * np.pi * tt)).sum(axis=1)
+        f2 = (ff * (-2j * np.pi * tt)**2).sum(axis=1)
+
+        # Newton step on |F(q)|^2
+        d1 = 2 * np.real(f1 * np.conj(f0))
+        d2 = 2 * np.real(f2 * np.conj(f0) + f1 * np.conj(f1))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            step = np.where(d2 < 0, -d1 / d2, 0.)
+        step = np.clip(np.nan_to_num(step), -0.5 / n_turns, 0.5 / n_turns)
+        q = q + step
+
+    return q
+
+
+def estimate_tunes(signals, method='naff', chunk_size=200, num_workers=1,
+                   n_fft=2**18):
+    '''
+    Estimate the tune of each row of a turn-by-turn data array.
+
+    Parameters
+    ----------
+    signals : array_like
+        Turn-by-turn data with shape (n_particles, n_turns). Only blocks of
+        `chunk_size` rows are read at a time, so that the array can be a
+        memory-mapped file (e.g. the data of a `MemmapParticlesMonitor`).
+    method : str
+        'fft' (position of the maximum of the zero-padded FFT, with a
+        resolution of 1/n_fft), 'hann' (interpolated peak of the spectrum
+        with Hann window) or 'naff' (maximum of the Fourier integral with
+        Hann window, as in the first step of the NAFF algorithm). The last
+        two reach a precision well below 1/n_turns without padding.
+    chunk_size : int
+        Number of rows processed together.
+    num_workers : int
+        Number of threads processing the chunks in parallel.
+    n_fft : int
+        Number of points for the FFT (only for method 'fft').
+
+    Returns
+    -------
+    q : np.ndarray
+        Tune of each row (between 0 and 0.5).
+    '''
+
+    assert method in TUNE_METHODS, f'method must be one of {TUNE_METHODS}'
+
+    n_part, n_turns = signals.shape
+    window = _hann_window(n_turns)
+    freq_axis = np.fft.rfftfreq(n_fft)
+
+    def _one_chunk(i_start):
+        sig = np.array(signals[i_start:i_start + chunk_size], dtype=np.float64)
+        sig = sig - sig.mean(axis=1, keepdims=True)
+        if method == 'fft':
+            spectrum = np.abs(np.fft.rfft(sig, n=n_fft, axis=1))
+            return freq_axis[np.argmax(spectrum, axis=1)]
+        elif method == 'hann':
+            return _tune_peak_hann(sig, window)
+        else:
+            return _tune_naff(sig, window)
+
+    chunk_starts = range(0, n_part, chunk_size)
+    if num_workers > 1:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            results = list(executor.map(_one_chunk, chunk_starts))
+    else:
+        results = [_one_chunk(i_start) for i_start in chunk_starts]
+
+    if len(results) == 0:
+        return np.zeros(0)
+
+    return np.concatenate(results)
+
 class LinearRescale():
 
     def __init__(self, knob_name, v0, dv):
@@ -59,7 +183,8 @@ class Footprint():
             mode='polar', r_range=None, theta_range=None, n_r=None, n_theta=None,
             x_norm_range=None, y_norm_range=None, n_x_norm=None, n_y_norm=None,
             keep_fft=False, keep_tracking_data=False,
-            auto_to_numpy=True,fft_chunk_size=200
+            auto_to_numpy=True,fft_chunk_size=200,
+            tune_method='fft', num_workers=1, memmap_path=None
             ):
 
         assert nemitt_x is not None and nemitt_y is not None, (
@@ -72,6 +197,12 @@ class Footprint():
         self.keep_fft = keep_fft
         self.keep_tracking_data = keep_tracking_data
 
+        assert tune_method in TUNE_METHODS, (
+            f'tune_method must be one of {TUNE_METHODS}')
+        self.tune_method = tune_method
+        self.num_workers = num_workers
+        self.memmap_path = memmap_path
+
         self.nemitt_x = nemitt_x
         self.nemitt_y = nemitt_y
 
@@ -152,6 +283,11 @@ class Footprint():
             method={True: '4d', False: '6d'}[freeze_longitudinal]
             )
 
+        if self.tune_method != 'fft' or self.memmap_path is not None:
+            self._compute_footprint_streamed(line, particles,
+                                    freeze_longitudinal=freeze_longitudinal)
+            return
+
         print('Tracking particles for footprint...')
         line.track(particles, num_turns=self.n_turns, turn_by_turn_monitor=True,
                    freeze_longitudinal=freeze_longitudinal)
@@ -215,6 +351,52 @@ class Footprint():
 
         print ('Done computing footprint.')
 
+    def _compute_footprint_streamed(self, line, particles,
+                                    freeze_longitudinal=False):
+
+        # The tunes are estimated from blocks of particles read from the
+        # turn-by-turn data, on the CPU, without zero-padding. With
+        # memmap_path, the data is recorded on disk and never fully loaded.
+
+        num_particles = self.x_norm_2d.size
+        if self.memmap_path is not None:
+            mon = xt.MemmapParticlesMonitor(self.memmap_path,
+                start_at_turn=0, stop_at_turn=self.n_turns,
+                num_particles=num_particles,
+                turns_per_block=min(self.n_turns, 1000),
+                quantities=['x', 'y'])
+        else:
+            mon = True
+
+        print('Tracking particles for footprint...')
+        line.track(particles, num_turns=self.n_turns, turn_by_turn_monitor=mon,
+                   freeze_longitudinal=freeze_longitudinal)
+        print('Done tracking.')
+
+        ctx2np = line._context.nparray_from_context_array
+        assert np.all(ctx2np(particles.state == 1)), (
+            'Some particles were lost during tracking')
+
+        if self.memmap_path is not None:
+            x_tbt = mon.x
+            y_tbt = mon.y
+        else:
+            mon = line.record_last_track
+            x_tbt = ctx2np(mon.x)
+            y_tbt = ctx2np(mon.y)
+
+        kwargs = dict(method=self.tune_method, chunk_size=self.fft_chunk_size,
+                      num_workers=self.num_workers, n_fft=self.n_fft)
+        self.qx = np.reshape(estimate_tunes(x_tbt, **kwargs),
+                             self.x_norm_2d.shape)
+        self.qy = np.reshape(estimate_tunes(y_tbt, **kwargs),
+                             self.y_norm_2d.shape)
+
+        if self.keep_tracking_data:
+            self.tracking_data = mon
+
+        print ('Done computing footprint.')
+
     def _compute_tune_shift(self,_context,J1_2d,J1_grid,J2_2d,J2_grid,q,coherent_tune,epsilon):
         nplike_lib = _context.nplike_lib
         ctx2np = _context.nparray_from_context_array
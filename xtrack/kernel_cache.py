@@ -0,0 +1,303 @@
+# copyright ################################# #
+# This file is part of the Xtrack Package.    #
+# Copyright (c) CERN, 2023.                   #
+# ########################################### #
+import functools
+import hashlib
+import importlib.machinery
+import logging
+import os
+import shlex
+import subprocess
+import sys
+import sysconfig
+import tempfile
+from pathlib import Path
+
+import xobjects as xo
+from xobjects.context import classes_from_kernels, sort_classes
+import xtrack as xt
+
+from .general import _print
+
+LOGGER = logging.getLogger(__name__)
+
+# Maximum size of the cache directory in megabytes, least recently used kernels
+# are removed when the limit is exceeded
+XT_KERNEL_CACHE_DEFAULT_MAX_SIZE_MB = 2048
+
+SO_SUFFIXES = ('.so', '.dll', '.dylib', '.pyd')
+
+# Compiler and linker flags used for the cached kernels (same as the defaults
+# of `ContextCpu.build_kernels`). They are passed explicitly to the compiler,
+# so that the cache key always covers the flags actually used.
+XT_KERNEL_CACHE_COMPILE_ARGS = ('-O3', '-Wno-unused-function')
+XT_KERNEL_CACHE_LINK_ARGS = ('-O3',)
+
+
+def kernel_cache_enabled(use_kernel_cache=None) -> bool:
+    """
+    Return whether the kernel cache is to be used. The cache is opt-in: if
+    `use_kernel_cache` is None, it is enabled only when the environment
+    variable XSUITE_KERNEL_CACHE is set to 1.
+    """
+    if use_kernel_cache is not None:
+        return bool(use_kernel_cache)
+    return os.environ.get('XSUITE_KERNEL_CACHE') == '1'
+
+
+def get_kernel_cache_dir() -> Path:
+    """
+    Return the directory used to store the compiled track kernels. The location
+    can be set with the environment variable XSUITE_KERNEL_CACHE_DIR (default:
+    `~/.cache/xsuite/kernels`, or `$XDG_CACHE_HOME/xsuite/kernels`).
+    """
+    cache_dir = os.environ.get('XSUITE_KERNEL_CACHE_DIR')
+    if cache_dir:
+        return Path(cache_dir).expanduser()
+
+    xdg_cache = os.environ.get('XDG_CACHE_HOME')
+    if xdg_cache:
+        return Path(xdg_cache) / 'xsuite' / 'kernels'
+
+    return Path.home() / '.cache' / 'xsuite' / 'kernels'
+
+
+def get_kernel_cache_max_size() -> int:
+    """
+    Return the maximum size of the kernel cache in bytes. It can be set in
+    megabytes with the environment variable XSUITE_KERNEL_CACHE_MAX_SIZE_MB.
+    """
+    size_mb = os.environ.get('XSUITE_KERNEL_CACHE_MAX_SIZE_MB',
+                             XT_KERNEL_CACHE_DEFAULT_MAX_SIZE_MB)
+    return int(float(size_mb) * 1024**2)
+
+
+@functools.lru_cache(maxsize=None)
+def _compiler_version(compiler):
+    try:
+        out = subprocess.run(
+            shlex.split(compiler)[:1] + ['--version'], capture_output=True,
+            text=True, timeout=30, check=False)
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return 'unknown'
+    return out.stdout.strip() or out.stderr.strip() or 'unknown'
+
+
+def get_compiler_id() -> str:
+    """
+    Return a string identifying the C compiler used by cffi to build the
+    kernels: the compiler command (from the environment variable CC or from
+    the python build configuration), its version and the flags set in the
+    environment.
+    """
+    compiler = (os.environ.get('CC')
+                or sysconfig.get_config_var('CC') or 'cc')
+    flags = ' '.join(os.environ.get(vv, '')
+                     for vv in ('CFLAGS', 'CPPFLAGS', 'LDFLAGS'))
+    return f'{compiler}\n{_compiler_version(compiler)}\n{flags}'
+
+
+def kernel_cache_key(specialized_source, context, particles_class,
+                     extra_compile_args=(), extra_link_args=(),
+                     compiler='') -> str:
+    """
+    Return the content hash identifying a compiled kernel. It covers the
+    generated (specialized) source, the compiler flags, the compiler (see
+    `get_compiler_id`), the context type (including OpenMP), the particles
+    class and the python ABI of the shared object.
+    """
+    hh = hashlib.sha256()
+    for item in (
+        specialized_source,
+        ' '.join(extra_compile_args),
+        ' '.join(extra_link_args),
+        compiler,
+        type(context).__name__,
+        'openmp' if getattr(context, 'openmp_enabled', False) else 'serial',
+        f'{particles_class.__module__}.{particles_class.__name__}',
+        importlib.machinery.EXTENSION_SUFFIXES[0],
+        sys.platform,
+        xo.__version__,
+        xt.__version__,
+    ):
+        hh.update(str(item).encode())
+        hh.update(b'\0')
+    return hh.hexdigest()
+
+
+def _module_name_for_key(key):
+    return f'xtrack_kernel_{key[:32]}'
+
+
+def _cached_so_file(cache_dir, module_name):
+    for suffix in importlib.machinery.EXTENSION_SUFFIXES:
+        so_file = Path(cache_dir) / (module_name + suffix)
+        if so_file.exists():
+            return so_file
+    return None
+
+
+def _generate_specialized_source(context, kernel_descriptions, sources=None,
+                                 extra_classes=(), extra_headers=(),
+                                 apply_to_source=(), specialize=True):
+    # Same steps as `ContextCpu.build_kernels`, without compiling. The classes
+    # are sorted by name, so that the source (and the cache key) does not depend
+    # on the set ordering, which changes from one process to the other. This
+    # relies on xobjects internals (no public hook gives a reproducible source),
+    # hence `build_kernels_with_cache` falls back to a plain build if they are
+    # not available in the installed xobjects version.
+    classes = sorted(classes_from_kernels(kernel_descriptions),
+                     key=lambda cls: cls.__name__)
+    classes += list(extra_classes)
+    classes = sort_classes(classes)
+
+    _, specialized_source = context._build_sources(
+        sources=sources,
+        classes=classes,
+        extra_headers=extra_headers,
+        apply_to_source=apply_to_source,
+        specialize=specialize,
+    )
+    return specialized_source
+
+
+def build_kernels_with_cache(context, kernel_descriptions, cache_dir,
+                             particles_class, **kwargs):
+    """
+    Build kernels as `context.build_kernels` does, but load the shared object
+    from `cache_dir` if a kernel compiled from identical source and options
+    is found there. Otherwise, the kernel is compiled and stored in the cache.
+    """
+    if not isinstance(context, xo.ContextCpu):
+        raise TypeError('The kernel cache is only available on CPU contexts.')
+
+    cache_dir = Path(cache_dir)
+
+    kwargs = kwargs.copy()
+    extra_compile_args = tuple(
+        kwargs.pop('extra_compile_args', XT_KERNEL_CACHE_COMPILE_ARGS))
+    extra_link_args = tuple(
+        kwargs.pop('extra_link_args', XT_KERNEL_CACHE_LINK_ARGS))
+
+    try:
+        specialized_source = _generate_specialized_source(
+            context, kernel_descriptions, **kwargs)
+    except (AttributeError, TypeError) as err:
+        LOGGER.warning('The kernel cache is not supported by the installed '
+                       f'xobjects version ({err}), compiling without cache.')
+        return context.build_kernels(
+            kernel_descriptions=kernel_descriptions,
+            compile=True,
+            extra_compile_args=extra_compile_args,
+            extra_link_args=extra_link_args,
+            **kwargs,
+        )
+
+    key = kernel_cache_key(specialized_source, context, particles_class,
+                           extra_compile_args=extra_compile_args,
+                           extra_link_args=extra_link_args,
+                           compiler=get_compiler_id())
+    module_name = _module_name_for_key(key)
+
+    so_file = _cached_so_file(cache_dir, module_name)
+    if so_file is not None:
+        # As for the prebuilt kernels, only the kernels with an explicit C
+        # name are loaded from the shared object
+        loadable_descriptions = {
+            nn: kk for nn, kk in kernel_descriptions.items()
+            if kk.c_name is not None}
+        try:
+            out_kernels = context.kernels_from_file(
+                module_name=module_name,
+                kernel_descriptions=loadable_descriptions,
+                containing_dir=cache_dir,
+            )
+        except Exception as err:  # corrupted or incompatible file
+            LOGGER.warning(f'Could not load cached kernel `{so_file}` '
+                           f'({err}), recompiling.')
+        else:
+            _touch(so_file)
+            LOGGER.debug(f'Loaded kernel `{module_name}` from cache.')
+            for kernel in out_kernels.values():
+                kernel.specialized_source = specialized_source
+            return out_kernels
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    # Compile in a temporary directory and move the shared object to the cache
+    # atomically, so that concurrent processes never see a partial file
+    with tempfile.TemporaryDirectory(dir=cache_dir) as tmp_dir:
+        out_kernels = context.build_kernels(
+            kernel_descriptions=kernel_descriptions,
+            module_name=module_name,
+            containing_dir=tmp_dir,
+            compile=True,
+            extra_compile_args=extra_compile_args,
+            extra_link_args=extra_link_args,
+            **kwargs,
+        )
+        tmp_so_file = _cached_so_file(tmp_dir, module_name)
+        if tmp_so_file is not None:
+            os.replace(tmp_so_file, cache_dir / tmp_so_file.name)
+
+    evict_kernel_cache(cache_dir)
+
+    return out_kernels
+
+
+def _touch(path):
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def _cached_files(cache_dir):
+    cache_dir = Path(cache_dir)
+    if not cache_dir.is_dir():
+        return []
+    return [ff for ff in cache_dir.iterdir()
+            if ff.is_file() and ff.name.startswith('xtrack_kernel_')
+            and ff.suffix in SO_SUFFIXES]
+
+
+def evict_kernel_cache(cache_dir=None, max_size=None, verbose=False):
+    """
+    Remove the least recently used kernels from the cache until its total
+    size is below `max_size` (in bytes, by default given by
+    `get_kernel_cache_max_size`).
+    """
+    cache_dir = cache_dir or get_kernel_cache_dir()
+
+    if max_size is None:
+        max_size = get_kernel_cache_max_size()
+
+    files = []
+    for ff in _cached_files(cache_dir):
+        try:
+            stat = ff.stat()
+        except OSError:  # removed by another process
+            continue
+        files.append((stat.st_mtime, stat.st_size, ff))
+
+    files.sort()
+    total_size = sum(ff[1] for ff in files)
+
+    for _, size, ff in files:
+        if total_size <= max_size:
+            break
+        try:
+            ff.unlink()
+        except OSError:
+            continue
+        total_size -= size
+        if verbose:
+            _print(f'Removed `{ff}`.')
+
+
+def clear_kernel_cache(cache_dir=None, verbose=False):
+    """
+    Remove all the kernels from the cache.
+    """
+    evict_kernel_cache(cache_dir=cache_dir, max_size=-1, verbose=verbose)
@@ -4,6 +4,7 @@
 # ######################################### #
 
 import io
+import inspect
 import math
 import logging
 import json
@@ -27,6 +28,7 @@ from .slicing import Slicer
 
 from .survey import survey_from_line
 from xtrack.twiss import (compute_one_turn_matrix_finite_differences,
+                          compute_one_turn_matrices_finite_differences,
                           find_closed_orbit_line, twiss_line,
                           compute_T_matrix_line,
                           DEFAULT_MATRIX_STABILITY_TOL,
@@ -40,12 +42,20 @@ from .beam_elements import Drift, BeamElement, Marker, Multipole
 from .footprint import Footprint, _footprint_with_linear_rescale
 from .internal_record import (start_internal_logging_for_elements_of_type,
                               stop_internal_logging_for_elements_of_type)
+from .profiling import (start_profiling, stop_profiling, get_profiling_table,
+                        get_profiling_summary)
 
 from .general import _print
 
 # For xdeps compatibility
 isref = (xd.refs.isref if hasattr(xd.refs, 'isref') else xd.refs._isref)
 
+# Binary line files (see `Line.to_binary`)
+_BINARY_MAGIC = int.from_bytes(b'XTRKLINE', 'little')
+_BINARY_FORMAT_VERSION = 1
+_BINARY_HEADER_SIZE = 64 # magic, version, index size, blob offset and size
+_BINARY_ALIGNMENT = 64
+
 log = logging.getLogger(__name__)
 
 
@@ -249,6 +259,106 @@ class Line:
 
         return cls.from_dict(dct_line, **kwargs)
 
+    @classmethod
+    def from_binary(cls, file, mmap=True, lazy=False, classes=()):
+
+        """Constructs a line from a binary file written by `Line.to_binary`.
+
+        Parameters
+        ----------
+        file : str or Path
+            Path to the binary file.
+        mmap : bool, optional
+            If True (default), the data of the elements is memory-mapped from
+            the file (copy-on-write, the file is never modified), otherwise it
+            is read into memory.
+        lazy : bool, optional
+            If True, the python objects of the elements are built only when
+            the elements are accessed through `line.element_dict` (or
+            `line[name]`, `line.elements`, ...). Building the tracker and
+            tracking do not need them, which reduces the loading time and the
+            memory footprint for very long lines. Default is False.
+        classes : list of classes, optional
+            Extra classes needed to restore the elements.
+
+        Returns
+        -------
+        line : Line
+            Line object, with all the elements in the same buffer on the
+            default CPU context.
+
+        """
+
+        with open(file, 'rb') as fid:
+            header = np.frombuffer(fid.read(_BINARY_HEADER_SIZE), dtype=np.uint64)
+            if header[0] != _BINARY_MAGIC:
+                raise ValueError(f'{file} is not a binary line file')
+            if header[1] != _BINARY_FORMAT_VERSION:
+                raise ValueError(
+                    f'Unsupported binary line format version {header[1]}')
+            index_nbytes, blob_offset, blob_nbytes = (int(vv) for vv in header[2:5])
+            index = json.loads(fid.read(index_nbytes).decode('utf-8'))
+            if not mmap:
+                fid.seek(blob_offset)
+                blob = np.frombuffer(bytearray(fid.read(blob_nbytes)),
+                                     dtype=np.int8)
+
+        if mmap:
+            # Plain array view on the mapping (faster to slice than np.memmap)
+            blob = np.asarray(np.memmap(file, dtype=np.int8, mode='c',
+                                        offset=blob_offset, shape=(blob_nbytes,)))
+
+        _buffer = xo.context_default.new_buffer(capacity=8)
+        _buffer.buffer = blob
+        _buffer.capacity = blob_nbytes
+        _buffer.chunks = [xo.context.Chunk(start, end)
+                          for start, end in index['buffer_free_chunks']]
+
+        class_dict = mk_class_namespace(classes)
+
+        elements_by_offset = {}
+        elements = _LazyElementDict() if lazy else {}
+        for nn, (class_name, offset) in zip(index['element_dict_names'],
+                                            index['element_dict_offsets']):
+            if offset < 0:
+                elements[nn] = class_dict[class_name].from_dict(
+                                                index['python_elements'][nn])
+                continue
+            eltype = class_dict[class_name]
+            if lazy:
+                dict.__setitem__(elements, nn, _UnloadedElement(
+                    elements, nn, eltype, _buffer, offset))
+                continue
+            if offset not in elements_by_offset:
+                elements_by_offset[offset] = eltype(
+                    _xobject=eltype._XoStruct._from_buffer(_buffer, offset))
+            elements[nn] = elements_by_offset[offset]
+
+        dct = index['line']
+        if lazy:
+            self = cls(elements={}, element_names=dct['element_names'])
+            self._element_dict = elements
+        else:
+            self = cls(elements=elements, element_names=dct['element_names'])
+
+        if 'particle_ref' in dct.keys():
+            self.particle_ref = xp.Particles.from_dict(dct['particle_ref'])
+
+        if '_var_manager' in dct.keys():
+            self._init_var_management(dct=dct)
+
+        self.config.data.update(dct['config'])
+        self._extra_config.update(dct['_extra_config'])
+        self.compound_container = CompoundContainer.from_dict(
+                                                    dct['compound_container'])
+        self.metadata = dct['metadata']
+
+        if ('energy_program' in self.element_dict
+             and self.element_dict['energy_program'] is not None):
+            self.energy_program.line = self
+
+        return self
+
     @classmethod
     def from_sequence(cls, nodes=None, length=None, elements=None,
                       sequences=None, copy_elements=False,
@@ -526,6 +636,14 @@ class Line:
 
         out = {}
         out["elements"] = {k: el.to_dict() for k, el in self.element_dict.items()}
+        out.update(self._to_dict_without_elements(
+                            include_var_management=include_var_management))
+
+        return out
+
+    def _to_dict_without_elements(self, include_var_management=True):
+
+        out = {}
         out["element_names"] = self.element_names[:]
         out['config'] = self.config.data.copy()
         out['_extra_config'] = self._extra_config.copy()
@@ -573,9 +691,69 @@ class Line:
             with open(file, 'w') as fid:
                 json.dump(self.to_dict(**kwargs), fid, cls=xo.JEncoder)
 
+    def to_binary(self, file, include_var_management=True):
+        '''Save the line to a binary file, which can be loaded (and
+        memory-mapped) much faster than a json file using `Line.from_binary`.
+
+        The data of the elements is dumped as a single raw block, preceded by
+        an index with the element names and classes, the offsets of the
+        elements in the block, the compounds, the config and the deferred
+        expressions.
+
+        Parameters
+        ----------
+        file: str or Path
+            Path of the file to be written.
+        include_var_management : bool, optional
+            If True (default) the deferred expressions are also saved.
+
+        '''
+
+        # Copy all the elements in a single buffer on CPU
+        _buffer = xo.context_default.new_buffer(capacity=8)
+        copied = {}
+        element_dict_offsets = []
+        python_elements = {}
+        for nn, ee in self.element_dict.items():
+            if not hasattr(ee, '_XoStruct'):
+                python_elements[nn] = ee.to_dict()
+                element_dict_offsets.append(-1)
+                continue
+            if id(ee) not in copied:
+                copied[id(ee)] = ee.copy(_buffer=_buffer)
+            element_dict_offsets.append(copied[id(ee)]._offset)
+
+        dct = self._to_dict_without_elements(
+                            include_var_management=include_var_management)
+
+        index = {
+            'element_dict_names': list(self.element_dict.keys()),
+            'element_dict_offsets': [
+                (ee.__class__.__name__, offset) for ee, offset in zip(
+                    self.element_dict.values(), element_dict_offsets)],
+            'python_elements': python_elements,
+            'buffer_free_chunks': [(ch.start, ch.end) for ch in _buffer.chunks],
+            'line': dct,
+        }
+        index_bytes = json.dumps(index, cls=xo.JEncoder).encode('utf-8')
+
+        blob_offset = _BINARY_HEADER_SIZE + len(index_bytes)
+        blob_offset += (-blob_offset) % _BINARY_ALIGNMENT
+        blob = _buffer.buffer[:_buffer.capacity]
+
+        header = np.zeros(_BINARY_HEADER_SIZE // 8, dtype=np.uint64)
+        header[:5] = [_BINARY_MAGIC, _BINARY_FORMAT_VERSION, len(index_bytes),
+                      blob_offset, blob.nbytes]
+
+        with open(file, 'wb') as fid:
+            fid.write(header.tobytes())
+            fid.write(index_bytes)
+            fid.write(b'\0' * (blob_offset - fid.tell()))
+            fid.write(blob.tobytes())
+
     def _to_table_dict(self):
 
-        elements = list(self.elements)
+        elements = list(self._get_elements(load=False))
         s_elements = np.array(list(self.get_s_elements()) + [self.get_length()])
         element_types = list(map(lambda e: e.__class__.__name__, elements)) + [""]
         isthick = np.array(list(map(_is_thick, elements)) + [False])
@@ -608,7 +786,9 @@ class Line:
         '''
         import pandas as pd
 
-        elements_df = pd.DataFrame(self._to_table_dict())
+        data = self._to_table_dict()
+        data['element'] = list(self.elements) + [None]
+        elements_df = pd.DataFrame(data)
         return elements_df
 
     def get_table(self, attr=False):
@@ -676,6 +856,7 @@ class Line:
             compile=True,
             io_buffer=None,
             use_prebuilt_kernels=True,
+            use_kernel_cache=None,
             enable_pipeline_hold=False,
             **kwargs):
 
@@ -702,6 +883,14 @@ class Line:
         use_prebuilt_kernels: bool, optional
             If True (default) the prebuilt kernels are used if available.
             If False, the kernels are always compiled.
+        use_kernel_cache: bool, optional
+            If True, compiled kernels are stored in and loaded from the
+            user-level kernel cache (see `xtrack.kernel_cache`), so that other
+            processes with the same configuration do not need to recompile
+            them. The shared objects are written to `~/.cache/xsuite/kernels`
+            (or to the directory given by the environment variable
+            XSUITE_KERNEL_CACHE_DIR). If None (default), the cache is used only
+            if the environment variable XSUITE_KERNEL_CACHE is set to 1.
         enable_pipeline_hold: bool, optional
             If True, the pipeline hold mechanism is enabled.
 
@@ -716,6 +905,7 @@ class Line:
                                 compile=compile,
                                 io_buffer=io_buffer,
                                 use_prebuilt_kernels=use_prebuilt_kernels,
+                                use_kernel_cache=use_kernel_cache,
                                 enable_pipeline_hold=enable_pipeline_hold,
                                 **kwargs)
 
@@ -756,6 +946,8 @@ class Line:
         freeze_longitudinal=False,
         time=False,
         with_progress=False,
+        compact_every_n_turns=None,
+        num_threads=None,
         **kwargs):
 
         """
@@ -798,9 +990,25 @@ class Line:
             is provided, it is used as the number of turns between two updates
             of the progress bar. If True, 100 is taken by default. By default,
             equals to False and no progress bar is displayed.
+        compact_every_n_turns: int, optional
+            If provided, the tracking is split in blocks of the given number of
+            turns and the lost particles are moved to the end of the arrays
+            between the blocks, so that only the active particles are tracked
+            (and shared among the threads) in the following block. Useful for
+            long runs with large losses. Not available for collective lines
+            or when time-dependent vars are enabled.
+        num_threads: int, optional
+            Number of OpenMP threads used for this call (only for CPU contexts
+            with OpenMP enabled). By default, the number of threads of the
+            context is used. The scheduling of the particles among the threads
+            can be set with the config flags `XTRACK_OMP_SCHEDULE_DYNAMIC` or
+            `XTRACK_OMP_SCHEDULE_GUIDED` (chunks of `XTRACK_OMP_CHUNK_SIZE`
+            particles, 64 by default) instead of the default static split.
         """
 
         self._check_valid_tracker()
+        if compact_every_n_turns is not None:
+            kwargs['compact_every_n_turns'] = compact_every_n_turns
         return self.tracker._track(
             particles,
             ele_start=ele_start,
@@ -811,8 +1019,72 @@ class Line:
             freeze_longitudinal=freeze_longitudinal,
             time=time,
             with_progress=with_progress,
+            num_threads=num_threads,
             **kwargs)
 
+    def track_chunked(
+        self,
+        particles,
+        chunk_size,
+        num_workers=1,
+        ele_start=0,
+        ele_stop=None,
+        num_elements=None,
+        num_turns=None,
+        turn_by_turn_monitor=None,
+        freeze_longitudinal=False):
+
+        """
+        Track a large set of particles in chunks, so that only a limited number
+        of particles is present at the same time in the context of the tracker.
+
+        Parameters
+        ----------
+        particles: xpart.Particles or iterable of xpart.Particles
+            The particles to track. If an `xpart.Particles` object is provided
+            (on a CPU context), it is updated in place with the result of the
+            tracking. If an iterable (e.g. a generator) is provided, the
+            particles sets are tracked one after the other and the merged
+            result is returned.
+        chunk_size: int
+            Maximum number of particles tracked in a single call.
+        num_workers: int, optional
+            Number of chunks tracked concurrently (on a thread pool). Only
+            available for non-collective lines on CPU contexts, without
+            monitors, internal logging or profiling. Defaults to 1.
+        ele_start: int or str, optional
+            The element to start tracking from (inclusive).
+        ele_stop: int or str, optional
+            The element to stop tracking at (exclusive).
+        num_elements: int, optional
+            The number of elements to track through.
+        num_turns: int, optional
+            The number of turns to track through. Defaults to 1.
+        turn_by_turn_monitor: bool, optional
+            If True, a turn-by-turn monitor covering all particles is filled
+            with the data recorded for the different chunks. It can be
+            retrieved in `line.record_last_track`.
+        freeze_longitudinal: bool, optional
+            If True, the longitudinal coordinates are frozen during tracking.
+
+        Returns
+        -------
+        particles: xpart.Particles
+            The tracked particles.
+        """
+
+        self._check_valid_tracker()
+        return self.tracker._track_chunked(
+            particles,
+            chunk_size=chunk_size,
+            num_workers=num_workers,
+            ele_start=ele_start,
+            ele_stop=ele_stop,
+            num_elements=num_elements,
+            num_turns=num_turns,
+            turn_by_turn_monitor=turn_by_turn_monitor,
+            freeze_longitudinal=freeze_longitudinal)
+
     def slice_thick_elements(self, slicing_strategies):
         """
         Slice thick elements in the line. Slicing is done in place.
@@ -998,6 +1270,7 @@ class Line:
         compute_R_element_by_element=None,
         compute_lattice_functions=None,
         compute_chromatic_properties=None,
+        incremental=None,
         ele_init=None,
         x=None, px=None, y=None, py=None, zeta=None, delta=None,
         betx=None, alfx=None, bety=None, alfy=None, bets=None,
@@ -1266,7 +1539,14 @@ class Line:
             particle is used.
         co_search_settings : dict
             Dictionary containing the settings for the closed orbit search
-            (passed as keyword arguments to the `scipy.fsolve` function)
+            (passed as keyword arguments to the `scipy.fsolve` function).
+            If the key `method` is set to 'newton', a vectorised Newton
+            search is used instead: the trial guesses and the probes for the
+            Jacobian are tracked together in a single call per iteration and
+            the last closed orbit and Jacobian are reused in the following
+            searches. In this case the only accepted settings are `max_iter`
+            and `reuse_jacobian`, and the search information (e.g. number
+            of iterations) is available in `particle_on_co._co_search_info`.
         delta_zeta : float
             Initial delta_zeta coordinate.
         delta0 : float
@@ -1355,7 +1635,8 @@ class Line:
             x_norm_range=None, y_norm_range=None, n_x_norm=None, n_y_norm=None,
             linear_rescale_on_knobs=None,
             freeze_longitudinal=None, delta0=None, zeta0=None,
-            keep_fft=True, keep_tracking_data=False):
+            keep_fft=True, keep_tracking_data=False,
+            tune_method='fft', num_workers=1, memmap_path=None):
 
         '''
         Compute the tune footprint for a beam with given emittences using tracking.
@@ -1413,6 +1694,25 @@ class Line:
             Initial value of the delta coordinate.
         zeta0: float
             Initial value of the zeta coordinate in meters.
+        keep_fft : bool
+            If True, the spectra are stored in the footprint object (only
+            for tune_method 'fft').
+        keep_tracking_data : bool
+            If True, the turn-by-turn data is stored in the footprint object.
+        tune_method : str
+            Method used to estimate the tunes from the turn-by-turn data:
+            'fft' (maximum of the zero-padded FFT, default), 'hann'
+            (interpolated peak of the spectrum with Hann window) or 'naff'
+            (maximum of the Fourier integral with Hann window). The last two
+            reach a high precision from a few hundred turns without
+            zero-padding.
+        num_workers : int
+            Number of threads used to estimate the tunes (not used with
+            tune_method 'fft' unless memmap_path is given).
+        memmap_path : str or Path
+            If given, the turn-by-turn data is recorded on disk in this
+            directory (see `xt.MemmapParticlesMonitor`) and the tunes are
+            estimated reading it by blocks of particles.
 
         Returns
         -------
@@ -1446,7 +1746,8 @@ class Line:
             self, particle_on_co,
             steps_r_matrix=None,
             ele_start=None, ele_stop=None,
-            element_by_element=False, only_markers=False):
+            element_by_element=False, only_markers=False,
+            at_elements=None):
 
         '''Compute the one turn matrix using finite differences.
 
@@ -1463,11 +1764,24 @@ class Line:
         ele_stop : str
             Optional. It can be used to find the periodic solution for a
             portion of the line.
+        element_by_element : bool
+            If True, the matrices from the start of the line to each element
+            are also computed and returned in `R_matrix_ebe`.
+        only_markers : bool
+            If True, the element-by-element matrices are computed only at the
+            markers (and at the end of the line).
+        at_elements : list of str or int
+            Optional. If provided, the element-by-element matrices are computed
+            only at the entrance of the given elements (the index equal to the
+            number of elements corresponds to the end of the line).
 
         Returns
         -------
-        one_turn_matrix : np.ndarray
-            One turn matrix.
+        out : dict
+            Dictionary containing the one turn matrix under `R_matrix`
+            and, if `element_by_element` is True, the element-by-element
+            matrices under `R_matrix_ebe` together with the corresponding
+            element indices under `R_matrix_ebe_at_element`.
 
         '''
 
@@ -1485,14 +1799,63 @@ class Line:
         return compute_one_turn_matrix_finite_differences(line, particle_on_co,
                         steps_r_matrix, ele_start=ele_start, ele_stop=ele_stop,
                         element_by_element=element_by_element,
-                        only_markers=only_markers)
+                        only_markers=only_markers,
+                        at_elements=at_elements)
+
+    def compute_one_turn_matrices_finite_differences(
+            self, particles_on_co,
+            steps_r_matrix=None,
+            ele_start=None, ele_stop=None):
+
+        '''Compute the one turn matrices for several reference orbits using
+        finite differences. All the matrices are obtained from a single
+        tracking call.
+
+        Parameters
+        ----------
+        particles_on_co : Particles
+            Particles object containing N reference particles (e.g. closed
+            orbits at different momenta). Per-particle properties (e.g. chi,
+            charge_ratio) are preserved.
+        steps_r_matrix : float
+            Step size for finite differences. In not given, default step sizes
+            are used.
+        ele_start : str
+            Optional. It can be used to compute the matrices for a portion of
+            the line.
+        ele_stop : str
+            Optional. It can be used to compute the matrices for a portion of
+            the line.
+
+        Returns
+        -------
+        out : dict
+            Dictionary containing the one turn matrices under `R_matrix`
+            as an array of shape (N, 6, 6).
+
+        '''
+
+        self._check_valid_tracker()
+
+        if self.iscollective:
+            log.warning(
+                'The tracker has collective elements.\n'
+                'In the twiss computation collective elements are'
+                ' replaced by drifts')
+            line = self._get_non_collective_line()
+        else:
+            line = self
+
+        return compute_one_turn_matrices_finite_differences(line,
+                        particles_on_co, steps_r_matrix,
+                        ele_start=ele_start, ele_stop=ele_stop)
 
     def get_length(self):
 
         '''Get total length of the line'''
 
         ll = 0
-        for ee in self.elements:
+        for ee in self._get_elements(load=False):
             if _is_thick(ee):
                 ll += ee.length
 
@@ -1536,7 +1899,7 @@ class Line:
         assert mode in ["upstream", "downstream"]
         s_prev = 0
         s = []
-        for ee in self.elements:
+        for ee in self._get_elements(load=False):
             if mode == "upstream":
                 s.append(s_prev)
             if _is_thick(ee):
@@ -1736,6 +2099,229 @@ class Line:
 
         return self
 
+    def insert_elements_at_s(self, elements_to_insert, s_tol=1e-6):
+
+        """Insert several elements in the line at given s positions.
+
+        The line is rebuilt in a single pass, which is much faster than
+        inserting the elements one at a time with `insert_element` when many
+        elements are installed.
+
+        Parameters
+        ----------
+        elements_to_insert: list of tuples
+            List of `(s, [(name, element), ...])` tuples. The elements of each
+            group are installed one after the other, the first one starting at
+            position `s`. Thin elements are inserted at the given position,
+            cutting the drifts if needed. Thick elements replace the drifts
+            (and the markers and apertures) in the region they occupy. Groups
+            at the same position are inserted in the given order.
+        s_tol: float, optional
+            Tolerance for the position of the elements in the line in meters.
+
+        Examples
+        --------
+        .. code-block:: python
+
+            line.insert_elements_at_s([
+                # s      elements to insert (name, element)
+                (10.,   [('m0_at_a', xt.Marker()), ('m1_at_a', xt.Marker())]),
+                (20.,   [('q_new', xt.Quadrupole(length=1., k1=0.1))]),
+            ])
+        """
+
+        self._frozen_check()
+
+        # Positions of the elements in the line
+        element_names = self.element_names
+        n_elements = len(element_names)
+        lengths = np.array([ee.length if _is_thick(ee) else 0.
+                            for ee in self._get_elements(load=False)])
+        s_dn = np.cumsum(lengths)
+        s_up = s_dn - lengths
+        line_length = s_dn[-1] if n_elements > 0 else 0.
+
+        # Groups to be inserted, sorted by position
+        new_names = [nn for _, group in elements_to_insert for nn, _ in group]
+        if len(set(new_names)) != len(new_names):
+            raise ValueError('Names of the elements to insert must be unique')
+        for nn in new_names:
+            if nn in self.element_dict:
+                raise ValueError(f'Element `{nn}` already present in the line')
+
+        s_start = np.array([ss for ss, _ in elements_to_insert], dtype=float)
+        s_end = s_start + np.array(
+            [sum([ee.length for _, ee in group if _is_thick(ee)])
+             for _, group in elements_to_insert], dtype=float)
+        if np.any(s_start < -s_tol) or np.any(s_end > line_length + s_tol):
+            raise ValueError('Elements can only be inserted within the line')
+        i_sorted = np.argsort(s_start, kind='stable')
+        is_thin = s_end - s_start < s_tol
+
+        # Thin elements at the edge of an existing element are inserted before
+        # it, the others cut the element containing them. Thick elements
+        # replace all elements overlapping with them.
+        i_right = np.searchsorted(s_up, s_start - s_tol, side='left')
+        at_edge = is_thin & (
+            (i_right == n_elements) & (s_start > line_length - s_tol)
+            | (i_right < n_elements)
+                & (s_up[np.minimum(i_right, n_elements - 1)] < s_start + s_tol))
+        i_first = np.where(is_thin, i_right - 1, np.searchsorted(
+                            s_dn, s_start + s_tol, side='right'))
+        i_last = np.where(is_thin, i_right - 1, np.searchsorted(
+                            s_up, s_end - s_tol, side='left') - 1)
+
+        insert_before = {}
+        spans = [] # [i_first, i_last, [(s_start, s_end, names), ...]]
+        for ig in i_sorted:
+            names = [nn for nn, _ in elements_to_insert[ig][1]]
+            if at_edge[ig]:
+                insert_before.setdefault(i_right[ig], []).extend(names)
+                continue
+            interval = (s_start[ig], s_end[ig], names)
+            if spans and i_first[ig] <= spans[-1][1]:
+                spans[-1][1] = max(spans[-1][1], i_last[ig])
+                spans[-1][2].append(interval)
+            else:
+                spans.append([i_first[ig], i_last[ig], [interval]])
+
+        # All the insertions are checked before modifying the line
+        compounds = self.compound_container
+        used_names = set(new_names)
+        span_layouts = []
+        for i_span_first, i_span_last, intervals in spans:
+            for ii in range(i_span_first + 1, i_span_last + 1):
+                if ii in insert_before:
+                    raise ValueError(
+                        f'Overlapping insertions at s={s_up[ii]}')
+
+            replaced_names = element_names[i_span_first:i_span_last + 1]
+            for nn in replaced_names:
+                ee = self.element_dict[nn]
+                if (not _is_drift(ee) and not isinstance(ee, Marker)
+                        and not _is_aperture(ee)):
+                    raise ValueError(f'Cannot replace active element {nn}')
+
+            # Compound containing the inserted elements
+            cpd_names = {compounds.compound_name_for_element(nn)
+                         for nn in replaced_names}
+            if len(cpd_names) > 1:
+                raise ValueError(
+                    'Elements can only be inserted into a compound in the '
+                    'core region.')
+            cpd_name, = cpd_names
+            if cpd_name is not None:
+                cpd = compounds.compound_for_name(cpd_name)
+                if not all(nn in cpd.core for nn in replaced_names):
+                    raise ValueError(
+                        'Elements can only be inserted into a compound in '
+                        'the core region.')
+
+            # Layout of the span with the new elements and the remaining drifts
+            name_drift = replaced_names[0]
+            i_new_drift = 0
+            span_names = []
+            new_drifts = []
+            s_curr = s_up[i_span_first]
+            intervals.sort(key=lambda interval: interval[:2])
+            for s_ins_start, s_ins_end, names in intervals + [
+                    (s_dn[i_span_last], s_dn[i_span_last], [])]:
+                if s_ins_start < s_curr - s_tol:
+                    raise ValueError(
+                        f'Overlapping insertions at s={s_ins_start}')
+                if s_ins_start - s_curr > s_tol:
+                    while (f'{name_drift}_{i_new_drift}' in self.element_dict
+                           or f'{name_drift}_{i_new_drift}' in used_names):
+                        i_new_drift += 1
+                    nn = f'{name_drift}_{i_new_drift}'
+                    used_names.add(nn)
+                    new_drifts.append((nn, s_ins_start - s_curr))
+                    span_names.append(nn)
+                span_names.extend(names)
+                s_curr = max(s_curr, s_ins_end)
+
+            span_layouts.append((i_span_first, i_span_last, cpd_name,
+                                 replaced_names, span_names, new_drifts))
+
+        for ii in insert_before:
+            if ii < n_elements:
+                self._compound_for_insertion_before(element_names[ii])
+
+        # Add all elements to self.element_dict
+        for _, group in elements_to_insert:
+            for nn, ee in group:
+                self.element_dict[nn] = ee
+
+        new_element_names = []
+        i_ele = 0
+        for (i_span_first, i_span_last, cpd_name, replaced_names, span_names,
+                new_drifts) in span_layouts + [
+                    (n_elements, n_elements, None, [], [], [])]:
+            # Elements before the span are kept
+            for ii in range(i_ele, min(i_span_first + 1, n_elements)):
+                self._insert_names_before(
+                    new_element_names, insert_before.pop(ii, []),
+                    element_names[ii])
+                if ii < i_span_first:
+                    new_element_names.append(element_names[ii])
+            if i_span_first == n_elements:
+                break
+
+            drift = self.element_dict[replaced_names[0]]
+            for nn, length in new_drifts:
+                new_drift = drift.copy(_buffer=drift._buffer)
+                new_drift.length = length
+                self.element_dict[nn] = new_drift
+
+            if cpd_name is not None:
+                cpd = compounds.compound_for_name(cpd_name)
+                for nn in replaced_names:
+                    cpd.core.remove(nn)
+                    del compounds._compound_name_for_element[nn]
+                for nn in span_names:
+                    cpd.core.add(nn)
+                    compounds._compound_name_for_element[nn] = cpd_name
+
+            new_element_names.extend(span_names)
+            i_ele = i_span_last + 1
+
+        new_element_names.extend(insert_before.pop(n_elements, []))
+        assert len(insert_before) == 0
+
+        self.element_names = new_element_names
+
+        return self
+
+    def _compound_for_insertion_before(self, name_right):
+        # Thin elements inserted in front of an existing element belong to the
+        # same compound, unless placed in front of its entry
+        compounds = self.compound_container
+        cpd_name = compounds.compound_name_for_element(name_right)
+        if cpd_name is None:
+            return None
+        cpd = compounds.compound_for_name(cpd_name)
+        if name_right in cpd.entry:
+            return None
+        if not (name_right in cpd.core or name_right in cpd.exit_transform
+                or (name_right in cpd.exit and len(cpd.exit_transform) == 0)):
+            raise ValueError(f'Inconsistent insertion in compound {cpd_name}')
+        return cpd_name
+
+    def _insert_names_before(self, new_element_names, names, name_right):
+        if not names:
+            return
+
+        new_element_names.extend(names)
+
+        cpd_name = self._compound_for_insertion_before(name_right)
+        if cpd_name is None:
+            return
+        compounds = self.compound_container
+        cpd = compounds.compound_for_name(cpd_name)
+        for nn in names:
+            cpd.core.add(nn)
+            compounds._compound_name_for_element[nn] = cpd_name
+
     def get_compound_by_name(self, name) -> Optional[CompoundType]:
         """Get a compound object by its name."""
         if not self.compound_container:
@@ -2269,6 +2855,72 @@ class Line:
         self._check_valid_tracker()
         stop_internal_logging_for_elements_of_type(self.tracker, element_type)
 
+    def start_profiling(self, reset=True):
+        """
+        Start profiling the tracking. The track kernel is recompiled with
+        timers around each element (flag `XTRACK_PROFILING` in `line.config`),
+        the time spent in collective elements and the total time of the calls
+        to `line.track` are measured in python. Only available on CPU.
+
+        Parameters
+        ----------
+        reset: bool
+            If True (default), the data collected so far is discarded.
+
+        """
+        self._check_valid_tracker()
+        start_profiling(self.tracker, reset=reset)
+
+    def stop_profiling(self):
+        """
+        Stop profiling the tracking. The data collected so far is kept and
+        can still be retrieved with `line.get_profiling_table()` and
+        `line.get_profiling_summary()`.
+        """
+        self._check_valid_tracker()
+        stop_profiling(self.tracker)
+
+    def get_profiling_table(self, group_by=None):
+        """
+        Get the time spent in each element of the line since the profiling
+        was started.
+
+        Parameters
+        ----------
+        group_by: str
+            If `'element_type'`, the time is summed over the elements of the
+            same class. If None (default), one row per element is returned.
+
+        Returns
+        -------
+        table: Table
+            Table with columns `name`, `element_type`, `time` (in seconds),
+            `num_calls`, `time_per_call` and `fraction` (of the time spent in
+            the elements). With OpenMP, the times of the different threads are
+            summed and each chunk of particles counts as a separate call.
+
+        """
+        self._check_valid_tracker()
+        return get_profiling_table(self.tracker, group_by=group_by)
+
+    def get_profiling_summary(self):
+        """
+        Get a summary of the profiling of the tracking.
+
+        Returns
+        -------
+        summary: dict
+            Dictionary with the total time spent in `line.track`
+            (`total_time`), in the track kernel (`kernel_time`), in the
+            collective elements (`collective_time`) and in python
+            (`python_overhead`), together with the number of tracked
+            particle-turns (`particle_turns`) and the tracking rate
+            (`particle_turns_per_s`).
+
+        """
+        self._check_valid_tracker()
+        return get_profiling_summary(self.tracker)
+
     def remove_markers(self, inplace=True, keep=None):
         """
         Remove markers from the line
@@ -2620,29 +3272,27 @@ class Line:
         '''
 
         elements_df = self.to_pandas()
+        names = elements_df['name'].values
+        num_elements = len(names)
+        needs_aperture = set(needs_aperture)
 
-        elements_df['is_aperture'] = elements_df.name.map(
-                lambda nn: nn == '_end_point' or  _is_aperture(self.element_dict[nn]))
-
-        if not elements_df.name.values[-1] == '_end_point':
-            elements_df['is_aperture'][-1] = False
-
-        elements_df['i_aperture_upstream'] = np.nan
-        elements_df['s_aperture_upstream'] = np.nan
-        elements_df['i_aperture_downstream'] = np.nan
-        elements_df['s_aperture_downstream'] = np.nan
-        num_elements = len(self.element_names)
+        is_aperture = np.array([
+            nn == '_end_point' or _is_aperture(self.element_dict[nn])
+            for nn in names])
+        if not names[-1] == '_end_point':
+            is_aperture[-1] = False
 
         # Elements that don't need aperture
-        dont_need_aperture = {name: False for name in elements_df['name']}
-        for name in elements_df['name']:
+        dont_need_aperture = np.zeros(num_elements, dtype=bool)
+        isthick = elements_df['isthick'].values.copy()
+        for ii, name in enumerate(names):
             if name == '_end_point':
                 continue
             ee = self.element_dict[name]
             if _allow_backtrack(ee) and not name in needs_aperture:
-                dont_need_aperture[name] = True
+                dont_need_aperture[ii] = True
             if name.endswith('_entry') or name.endswith('_exit'):
-                dont_need_aperture[name] = True
+                dont_need_aperture[ii] = True
 
             # Correct isthick for elements that need aperture but have zero length.
             # Use-case example: Before collimators are installed as EverestCollimator
@@ -2653,42 +3303,68 @@ class Line:
             # at this stage just Markers (and xcoll takes care of providing the down-
             # stream aperture), so we mark them as thin.
             if name in needs_aperture and hasattr(ee, 'length') and ee.length == 0:
-                elements_df.loc[elements_df['name']==name, 'isthick'] = False
-
-        i_prev_aperture = elements_df[elements_df['is_aperture']].index[0]
-        i_next_aperture = 0
-
-        for iee in progress(range(i_prev_aperture, num_elements), desc='Checking aperture'):
-            if dont_need_aperture[elements_df.loc[iee, 'name']]:
-                continue
-
-            if elements_df.loc[iee, 'is_aperture']:
-                i_prev_aperture = iee
-                continue
-
-            if i_next_aperture < iee:
-                for ii in range(iee, num_elements):
-                    if elements_df.loc[ii, 'is_aperture']:
-                        i_next_aperture = ii
-                        break
-
-            elements_df.at[iee, 'i_aperture_upstream'] = i_prev_aperture
-            elements_df.at[iee, 'i_aperture_downstream'] = i_next_aperture
-
-            elements_df.at[iee, 's_aperture_upstream'] = elements_df.loc[i_prev_aperture, 's']
-            elements_df.at[iee, 's_aperture_downstream'] = elements_df.loc[i_next_aperture, 's']
+                isthick[ii] = False
+
+        elements_df['is_aperture'] = is_aperture
+        elements_df['isthick'] = isthick
+
+        i_elements = np.arange(num_elements)
+        i_first_aperture = np.argmax(is_aperture)
+        num_line_elements = len(self.element_names) # _end_point excluded
+
+        # Elements to be checked: the ones downstream of the first aperture
+        # that need an aperture and are not apertures themselves
+        mask_check = ((i_elements >= i_first_aperture)
+                      & (i_elements < num_line_elements)
+                      & ~dont_need_aperture & ~is_aperture)
+
+        # Closest aperture upstream (forward fill of the aperture indices).
+        # Apertures that don't need an aperture are not considered.
+        mask_upstream = is_aperture & ~dont_need_aperture
+        mask_upstream[i_first_aperture] = True
+        i_upstream = np.maximum.accumulate(
+            np.where(mask_upstream, i_elements, 0))
+
+        # Closest aperture downstream (backward fill of the aperture indices)
+        mask_downstream = is_aperture & (i_elements < num_line_elements)
+        i_downstream = np.minimum.accumulate(
+            np.where(mask_downstream, i_elements, num_elements)[::-1])[::-1]
+        # Elements without any aperture downstream are associated to the one
+        # found for the previous checked element (0 if there is none)
+        mask_found = mask_check & (i_downstream < num_elements)
+        i_last_found = np.maximum.accumulate(
+            np.where(mask_found, i_elements, -1))
+        i_downstream = np.where(i_downstream < num_elements, i_downstream,
+                                np.where(i_last_found >= 0,
+                                         i_downstream[i_last_found], 0))
+
+        s = elements_df['s'].values
+        i_aperture_upstream = np.full(num_elements, np.nan)
+        s_aperture_upstream = np.full(num_elements, np.nan)
+        i_aperture_downstream = np.full(num_elements, np.nan)
+        s_aperture_downstream = np.full(num_elements, np.nan)
+        i_aperture_upstream[mask_check] = i_upstream[mask_check]
+        s_aperture_upstream[mask_check] = s[i_upstream[mask_check]]
+        i_aperture_downstream[mask_check] = i_downstream[mask_check]
+        s_aperture_downstream[mask_check] = s[i_downstream[mask_check]]
+
+        elements_df['i_aperture_upstream'] = i_aperture_upstream
+        elements_df['s_aperture_upstream'] = s_aperture_upstream
+        elements_df['i_aperture_downstream'] = i_aperture_downstream
+        elements_df['s_aperture_downstream'] = s_aperture_downstream
 
         # Check for elements missing aperture upstream
-        elements_df['misses_aperture_upstream'] = ((elements_df['s_aperture_upstream'] != elements_df['s'])
-            & ~(np.isnan(elements_df['i_aperture_upstream'])))
-
-        # Check for elements missing aperture downstream
-        s_downstream = elements_df.s.copy()
-        df_thick_to_check = elements_df[elements_df['isthick'] & ~(elements_df.i_aperture_upstream.isna())].copy()
-        s_downstream.loc[df_thick_to_check.index] += np.array([ee.length for ee in df_thick_to_check.element])
+        elements_df['misses_aperture_upstream'] = (
+            (s_aperture_upstream != s) & mask_check)
+
+        # Check for elements missing aperture downstream (the exit of thick
+        # elements is at the position of the next element)
+        s_downstream = s.copy()
+        mask_thick_to_check = isthick & mask_check
+        s_downstream[mask_thick_to_check] = s[1:][mask_thick_to_check[:-1]]
         elements_df['misses_aperture_downstream'] = (
-            (np.abs(elements_df['s_aperture_downstream'] - s_downstream) > 1e-6)
-            & ~(np.isnan(elements_df['i_aperture_upstream'])))
+            (np.abs(s_aperture_downstream - s_downstream) > 1e-6)
+            & mask_check)
 
         # Flag problems
         elements_df['has_aperture_problem'] = (
@@ -3026,6 +3702,17 @@ class Line:
     def elements(self):
         return tuple([self.element_dict[nn] for nn in self.element_names])
 
+    def _get_elements(self, load=True):
+        '''
+        Elements of the line. With `load=False`, the elements of a line loaded
+        with `Line.from_binary(..., lazy=True)` that were never accessed are
+        returned as `_UnloadedElement` proxies, without building them.
+        '''
+        if load or not isinstance(self.element_dict, _LazyElementDict):
+            return self.elements
+        return tuple([dict.__getitem__(self.element_dict, nn)
+                      for nn in self.element_names])
+
     @property
     def skip_end_turn_actions(self):
         return self._extra_config['skip_end_turn_actions']
@@ -3214,121 +3901,11 @@ class Line:
 
         '''
 
-        s_cuts = [ee[0] for ee in elements_to_insert]
-        s_cuts = np.sort(s_cuts)
-
-        s_tol = 0.5e-6
-
-        tt_before_cut = self.get_table()
-
-        i_next = np.array([np.argmax(tt_before_cut['s'] > s_cut) for s_cut in s_cuts])
-        i_ele_containing = i_next - 1
-
-        needs_cut = np.abs(tt_before_cut['s'][i_ele_containing] - s_cuts) > s_tol
-
-        assert np.all(s_cuts[needs_cut] > tt_before_cut.s[i_ele_containing[needs_cut]])
-        assert np.all(s_cuts[needs_cut] < tt_before_cut.s[i_ele_containing[needs_cut]+1])
-        assert np.all(tt_before_cut.element_type[i_ele_containing[needs_cut]] == 'Drift')
-
-        i_drifts_to_cut = set(i_ele_containing[needs_cut])
-
-        for idr in progress(i_drifts_to_cut, desc='Cut drifts'):
-            name_drift = tt_before_cut.name[idr]
-            drift = self[name_drift]
-            assert isinstance(drift, xt.Drift)
-            _buffer = drift._buffer
-            if not isinstance(_buffer.context, xo.ContextCpu):
-                raise ValueError('Only supported on CPU') # GPU untested
-            l_drift = drift.length
-            s_start = tt_before_cut['s'][idr]
-            s_end = s_start + l_drift
-            s_cut_dr = np.sort([s_start] + list(s_cuts[i_ele_containing==idr]) + [s_end])
-
-            drifts_for_replacement = []
-            i_new_drifts = 0
-            new_drift_names = []
-            for ll in np.diff(s_cut_dr):
-                if ll > s_tol:
-                    drifts_for_replacement.append(xt.Drift(length=ll, _buffer=_buffer))
-                    new_drift_names.append(f'{name_drift}_{i_new_drifts}')
-                    assert new_drift_names[-1] not in self.element_names
-                    i_new_drifts += 1
-
-            insert_at = self.element_names.index(name_drift)
-            self.element_names.remove(name_drift)
-            cpd_name = self.compound_container.compound_name_for_element(name_drift)
-            if cpd_name is not None:
-                cpd = self.compound_container.compound_for_name(cpd_name)
-                assert name_drift in cpd.core
-                cpd.core.remove(name_drift)
-            else:
-                cpd = None
-            for nn, dd in zip(new_drift_names, drifts_for_replacement):
-                self.element_dict[nn] = dd
-                self.element_names.insert(insert_at, nn)
-                if cpd is not None:
-                    cpd.core.add(nn)
-                    self.compound_container._compound_name_for_element[nn] = cpd_name
-                insert_at += 1
-
-        tt_after_cut = self.get_table()
-
-        # Names for insertions
-        ele_name_insertions = []
-        for s_insert, ee in progress(elements_to_insert, desc="Locate insertion points"):
-            # Find element_name for insertion
-            ii_ins = np.where(tt_after_cut['s'] >= s_insert)[0][0]
-            ele_name_insertions.append(tt_after_cut['name'][ii_ins])
-            assert np.abs(s_insert - tt_after_cut['s'][ii_ins]) < s_tol
-
-        # Add all elements to self.element_dict
-        for s_insert, ee in elements_to_insert:
-            for nn, el in ee:
-                assert nn not in self.element_dict
-                self.element_dict[nn] = el
-
-        # Insert elements
-        for i_ins, (s_insert, ee) in enumerate(
-                    progress(elements_to_insert, desc="Inserting elements")):
-            ele_name_ins = ele_name_insertions[i_ins]
-            cpd_name_ins = self.compound_container.compound_name_for_element(ele_name_ins)
-            if cpd_name_ins is not None:
-                cpd_ins = self.compound_container.compound_for_name(cpd_name_ins)
-            else:
-                cpd_ins = None
-
-            if ele_name_ins not in self.element_names:
-                assert ele_name_ins == '_end_point'
-                insert_at = None
-            else:
-                insert_at = self.element_names.index(ele_name_ins)
-            for nn, el in ee:
-
+        for _, ee in elements_to_insert:
+            for _, el in ee:
                 assert el.isthick == False
-                if insert_at is None:
-                    self.element_names.append(nn)
-                else:
-                    self.element_names.insert(insert_at, nn)
-
-                if cpd_ins is None:
-                    pass # No compound
-                elif ele_name_ins in cpd_ins.core:
-                    cpd_ins.core.add(nn)
-                    self.compound_container._compound_name_for_element[nn] = cpd_name_ins
-                elif ele_name_ins in cpd_ins.entry:
-                    pass # Goes in front ot the compound but does not belong to it
-                elif ele_name_ins in cpd_ins.exit:
-                    assert len(cpd.exit_transform) == 0
-                    cpd_ins.core.add(nn)
-                    self.compound_container._compound_name_for_element[nn] = cpd_name_ins
-                elif ele_name_ins in cpd_ins.exit_transform:
-                    cpd_ins.core.add(nn)
-                    self.compound_container._compound_name_for_element[nn] = cpd_name_ins
-                else:
-                    raise ValueError(f'Inconsistent insertion in compound {cpd_name_ins}')
 
-                if insert_at is not None:
-                    insert_at += 1
+        self.insert_elements_at_s(elements_to_insert, s_tol=0.5e-6)
 
 def frac(x):
     return x % 1
@@ -3413,6 +3990,150 @@ def _deserialize_element(el, class_dict, _buffer):
         return eltype.from_dict(eldct)
 
 
+class _LazyElementDict(dict):
+
+    """
+    Dictionary of the elements of a line loaded with
+    `Line.from_binary(..., lazy=True)`. The elements are stored as
+    `_UnloadedElement` proxies, replaced by the actual element objects when
+    they are accessed for the first time.
+    """
+
+    def __getitem__(self, key):
+        ee = dict.__getitem__(self, key)
+        if type(ee) is _UnloadedElement:
+            ee = ee._element_class(_xobject=ee._xobject)
+            dict.__setitem__(self, key, ee)
+        return ee
+
+    def __iter__(self):
+        # Defined in python so that dict(...) and dict.update(...) go through
+        # __getitem__ (and never see the proxies)
+        return dict.__iter__(self)
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def values(self):
+        return [self[kk] for kk in self]
+
+    def items(self):
+        return [(kk, self[kk]) for kk in self]
+
+    def pop(self, key, *args):
+        if key in self:
+            out = self[key]
+            dict.pop(self, key)
+            return out
+        return dict.pop(self, key, *args)
+
+    def copy(self):
+        out = _LazyElementDict()
+        dict.update(out, dict.items(self))
+        return out
+
+    def __reduce__(self):
+        return (dict, (dict(self),))
+
+    @property
+    def num_loaded(self):
+        return sum(type(ee) is not _UnloadedElement
+                   for ee in dict.values(self))
+
+
+class _UnloadedElement:
+
+    """
+    Proxy for an element of a line loaded with
+    `Line.from_binary(..., lazy=True)` that was never accessed. The class
+    attributes and the scalar fields of the element are read without building
+    the element object, any other access builds it.
+    """
+
+    __slots__ = ('_element_dict', '_name', '_element_class', '_xo_buffer',
+                 '_xo_offset', '_xo')
+
+    def __init__(self, element_dict, name, element_class, buffer, offset):
+        object.__setattr__(self, '_element_dict', element_dict)
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_element_class', element_class)
+        object.__setattr__(self, '_xo_buffer', buffer)
+        object.__setattr__(self, '_xo_offset', offset)
+        object.__setattr__(self, '_xo', None)
+
+    def _loaded(self):
+        ee = dict.get(self._element_dict, self._name)
+        if ee is self or ee is None:
+            return None
+        return ee
+
+    def _load(self):
+        return self._element_dict[self._name]
+
+    @property
+    def __class__(self):
+        return self._element_class
+
+    @property
+    def _xobject(self):
+        ee = self._loaded()
+        if ee is not None:
+            return ee._xobject
+        if self._xo is None:
+            object.__setattr__(self, '_xo',
+                self._element_class._XoStruct._from_buffer(
+                    self._xo_buffer, self._xo_offset))
+        return self._xo
+
+    @property
+    def _buffer(self):
+        return self._xobject._buffer
+
+    @property
+    def _offset(self):
+        return self._xobject._offset
+
+    @property
+    def _context(self):
+        return self._xobject._buffer.context
+
+    def __getattr__(self, name):
+        key = (self._element_class, name)
+        if key not in _UNLOADED_ELEMENT_ATTR_KIND:
+            _UNLOADED_ELEMENT_ATTR_KIND[key] = _unloaded_element_attr_kind(
+                                                    self._element_class, name)
+        kind, value = _UNLOADED_ELEMENT_ATTR_KIND[key]
+        if kind == 'class':
+            return value
+        elif kind == 'field':
+            return getattr(self._xobject, name)
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+    def __repr__(self):
+        return (f'<unloaded {self._element_class.__name__} '
+                f'{self._name!r}>')
+
+
+_MISSING = object()
+_UNLOADED_ELEMENT_ATTR_KIND = {}
+
+
+def _unloaded_element_attr_kind(element_class, name):
+    static = inspect.getattr_static(element_class, name, _MISSING)
+    if isinstance(static, xo.hybrid_class._FieldOfDressed):
+        ftype = getattr(element_class._XoStruct, name).ftype
+        if isinstance(ftype, xo.scalar.NumpyScalar):
+            return 'field', None # scalar, read from the xobject
+    elif static is not _MISSING and not hasattr(static, '__get__'):
+        return 'class', static # plain class attribute (e.g. isthick)
+    return 'load', None
+
+
 def _is_simple_quadrupole(el):
     if not isinstance(el, Multipole):
         return False
@@ -3760,12 +4481,20 @@ class LineVars:
         self.line._xdeps_manager._tree_frozen = value
 
     def load_madx_optics_file(self, filename):
-        from cpymad.madx import Madx
-        mad = Madx()
-        mad.options.echo = False
-        mad.options.info = False
-        mad.options.warn = False
-        mad.call(str(filename))
+        try:
+            mad = xt.MadxParser()
+            mad.call(str(filename))
+        except NotImplementedError as err:
+            # Constructs not handled by the native parser (e.g. macros)
+            try:
+                from cpymad.madx import Madx
+            except ImportError:
+                raise err
+            mad = Madx()
+            mad.options.echo = False
+            mad.options.info = False
+            mad.options.warn = False
+            mad.call(str(filename))
 
         assert self.cache_active is False, (
             'Cannot load optics file when cache is active')
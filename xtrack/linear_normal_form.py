@@ -8,46 +8,40 @@ import numpy as np
 from .general import _print
 
 
+S = np.array([[0., 1., 0., 0., 0., 0.],
+              [-1., 0., 0., 0., 0., 0.],
+              [ 0., 0., 0., 1., 0., 0.],
+              [ 0., 0.,-1., 0., 0., 0.],
+              [ 0., 0., 0., 0., 0., 1.],
+              [ 0., 0., 0., 0.,-1., 0.]])
+
 def healy_symplectify(M):
     # https://accelconf.web.cern.ch/e06/PAPERS/WEPCH152.PDF
-    #_print("Symplectifying linear One-Turn-Map...")
+    # M can be a single 6x6 matrix or a stack of matrices with shape (..., 6, 6)
 
-    #_print("Before symplectifying: det(M) = {}".format(np.linalg.det(M)))
+    M = np.asarray(M)
     I = np.identity(6)
 
-    S = np.array(
-        [
-            [0.0, 1.0, 0.0, 0.0, 0.0, 0.0],
-            [-1.0, 0.0, 0.0, 0.0, 0.0, 0.0],
-            [0.0, 0.0, 0.0, 1.0, 0.0, 0.0],
-            [0.0, 0.0, -1.0, 0.0, 0.0, 0.0],
-            [0.0, 0.0, 0.0, 0.0, 0.0, 1.0],
-            [0.0, 0.0, 0.0, 0.0, -1.0, 0.0],
-        ]
-    )
-
-    V = np.matmul(S, np.matmul(I - M, np.linalg.inv(I + M)))
-    W = (V + V.T) / 2
-    if np.linalg.det(I - np.matmul(S, W)) != 0:
-        M_new = np.matmul(I + np.matmul(S, W),
-                          np.linalg.inv(I - np.matmul(S, W)))
-    else:
-        _print("WARNING: det(I - SW) = 0!")
-        V_else = np.matmul(S, np.matmul(I + M, np.linalg.inv(I - M)))
-        W_else = (V_else + V_else.T) / 2
-        M_new = -np.matmul(
-            I + np.matmul(S, W_else), np.linalg.det(I - np.matmul(S, W_else))
-        )
-
-    #_print("After symplectifying: det(M) = {}".format(np.linalg.det(M_new)))
+    V = S @ (I - M) @ np.linalg.inv(I + M)
+    W = (V + np.swapaxes(V, -1, -2)) / 2
+    SW = S @ W
+
+    mask_ok = np.linalg.det(I - SW) != 0
+    if np.all(mask_ok):
+        return (I + SW) @ np.linalg.inv(I - SW)
+
+    _print("WARNING: det(I - SW) = 0!")
+    M_new = np.empty_like(SW)
+    M_new[mask_ok] = ((I + SW[mask_ok])
+                      @ np.linalg.inv(I - SW[mask_ok]))
+    M_else = M[~mask_ok]
+    V_else = S @ (I + M_else) @ np.linalg.inv(I - M_else)
+    W_else = (V_else + np.swapaxes(V_else, -1, -2)) / 2
+    SW_else = S @ W_else
+    M_new[~mask_ok] = -(I + SW_else) @ np.linalg.inv(I - SW_else)
+
     return M_new
 
-S = np.array([[0., 1., 0., 0., 0., 0.],
-              [-1., 0., 0., 0., 0., 0.],
-              [ 0., 0., 0., 1., 0., 0.],
-              [ 0., 0.,-1., 0., 0., 0.],
-              [ 0., 0., 0., 0., 0., 1.],
-              [ 0., 0., 0., 0.,-1., 0.]])
 
 ######################################################
 ### Implement Normalization of fully coupled motion ##
@@ -114,85 +108,190 @@ def compute_linear_normal_form(M, symplectify=False, only_4d_block=False,
     if stability_tol is not None:
         _assert_matrix_stability(w0, stability_tol)
 
-    a0 = np.real(v0)
-    b0 = np.imag(v0)
+    W, invW, R, eigenvalues = _normal_form_from_eigen_decomposition(
+                                                        w0[None, :], v0[None, :, :])
 
-    index_list = [0,5,1,2,3,4] # we mix them up to check the algorithm
+    return W[0], invW[0], R[0], eigenvalues[0]
 
-    ##### Sort modes in pairs of conjugate modes #####
-    conj_modes = np.zeros([3,2], dtype=np.int64)
-    for j in [0,1]:
-        conj_modes[j,0] = index_list[0]
-        del index_list[0]
+def compute_linear_normal_form_batch(MM, symplectify=False,
+                        only_4d_block=False, responsiveness_tol=None,
+                        stability_tol=None):
+
+    '''
+    Compute the linear normal form of a stack of 6x6 matrices MM[i] in the
+    form:
+
+    MM[i] = W[i] x Rot[i] x W[i]^-1
 
-        min_index = 0
-        min_diff = abs(np.imag(w0[conj_modes[j,0]] + w0[index_list[min_index]]))
-        for i in range(1,len(index_list)):
-            diff = abs(np.imag(w0[conj_modes[j,0]] + w0[index_list[i]]))
-            if min_diff > diff:
-                min_diff = diff
-                min_index = i
+    Contrarily to `compute_linear_normal_form`, no exception is raised for
+    matrices failing the responsiveness or stability checks. These are
+    flagged in the returned diagnostics and their normal form is set to nan.
+
+    Parameters
+    ----------
+    MM : np.ndarray
+        Array of shape (N, 6, 6)
+    symplectify : bool
+        If True, symplectify the matrices before computing the normal form
+    only_4d_block : bool
+        If True, only use the 4x4 block of the matrices to compute the normal
+        form
+    responsiveness_tol : float
+        Tolerance for the responsiveness of the matrices
+    stability_tol : float
+        Tolerance for the stability of the matrices
 
-        conj_modes[j,1] = index_list[min_index]
-        del index_list[min_index]
+    Returns
+    -------
+    W : np.ndarray
+        Array of shape (N, 6, 6)
+    invW: np.ndarray
+        Array of shape (N, 6, 6)
+    Rot : np.ndarray
+        Array of shape (N, 6, 6)
+    eigenvalues : np.ndarray
+        Array of shape (N, 3)
+    diagnostics : dict
+        Boolean arrays of shape (N,) named `finite`, `responsive`,
+        `determinant_ok`, `stable` (True when the corresponding check is not
+        requested) and `valid` (all checks passed).
+    '''
 
-    conj_modes[2,0] = index_list[0]
-    conj_modes[2,1] = index_list[1]
+    MM = np.array(MM, dtype=np.float64)
+    if MM.ndim != 3 or MM.shape[1:] != (6, 6):
+        raise ValueError('MM must have shape (N, 6, 6)')
+    n_mat = MM.shape[0]
+
+    if only_4d_block:
+        MM[:, 4:, :] = 0
+        MM[:, :, 4:] = 0
+        muz_dummy = np.pi/10
+        MM[:, 4:, 4:] = Rot2D(muz_dummy)
+
+    responsive = np.ones(n_mat, dtype=bool)
+    determinant_ok = np.ones(n_mat, dtype=bool)
+    stable = np.ones(n_mat, dtype=bool)
+
+    if responsiveness_tol is not None:
+        n_check = 4 if only_4d_block else 6
+        mask_non_zero = np.abs(MM) > responsiveness_tol
+        mask_non_zero[:, np.arange(6), np.arange(6)] = False
+        responsive = np.all(np.any(mask_non_zero[:, :, :n_check], axis=1),
+                            axis=1)
+
+    if symplectify:
+        MM = healy_symplectify(MM)
+
+    if stability_tol is not None:
+        determinant_ok = np.abs(np.linalg.det(MM) - 1) <= stability_tol
+
+    # Matrices for which the normal form cannot be computed are replaced by a
+    # dummy rotation to keep the computation well defined
+    M_dummy = np.zeros((6, 6))
+    for kk, mu_dummy in enumerate([0.1, 0.2, 0.3]):
+        M_dummy[2*kk:2*kk+2, 2*kk:2*kk+2] = Rot2D(2 * np.pi * mu_dummy)
+
+    finite = np.all(np.isfinite(MM), axis=(1, 2))
+    MM[~finite] = M_dummy
+
+    w0, v0 = np.linalg.eig(MM)
+
+    if stability_tol is not None:
+        stable = np.all(np.abs(w0) <= 1. + stability_tol, axis=1)
+
+    valid = finite & responsive & determinant_ok & stable
+    w_dummy, v_dummy = np.linalg.eig(M_dummy)
+    w0[~valid] = w_dummy
+    v0[~valid] = v_dummy
+
+    W, invW, R, eigenvalues = _normal_form_from_eigen_decomposition(w0, v0)
+
+    W[~valid] = np.nan
+    invW[~valid] = np.nan
+    R[~valid] = np.nan
+    eigenvalues[~valid] = np.nan
+
+    diagnostics = {
+        'finite': finite,
+        'responsive': responsive,
+        'determinant_ok': determinant_ok,
+        'stable': stable,
+        'valid': valid,
+    }
+
+    return W, invW, R, eigenvalues, diagnostics
+
+def _normal_form_from_eigen_decomposition(w0, v0):
+
+    # w0 has shape (N, 6) and v0 has shape (N, 6, 6) (as from np.linalg.eig)
+
+    n_mat = w0.shape[0]
+    i_mat = np.arange(n_mat)
+
+    index_list = np.array([0,5,1,2,3,4]) # we mix them up to check the algorithm
+
+    ##### Sort modes in pairs of conjugate modes #####
+    available = np.ones((n_mat, 6), dtype=bool)
+    conj_modes = np.zeros((n_mat, 3, 2), dtype=np.int64)
+    for j in [0,1]:
+        # First available mode in index_list
+        first = index_list[np.argmax(available[:, index_list], axis=1)]
+        available[i_mat, first] = False
+        # Closest available conjugate (first one in index_list if equal)
+        diff = np.abs(np.imag(w0[i_mat, first][:, None] + w0[:, index_list]))
+        diff[~available[:, index_list]] = np.inf
+        partner = index_list[np.argmin(diff, axis=1)]
+        available[i_mat, partner] = False
+        conj_modes[:, j, 0] = first
+        conj_modes[:, j, 1] = partner
+
+    remaining = index_list[np.argsort(~available[:, index_list], axis=1,
+                                      kind='stable')[:, :2]]
+    conj_modes[:, 2, :] = remaining
 
     ##################################################
     #### Select mode from pairs with positive (real @ S @ imag) #####
 
-    modes = np.empty(3, dtype=np.int64)
-    for ii,ind in enumerate(conj_modes):
-        if np.matmul(np.matmul(a0[:,ind[0]], S), b0[:,ind[0]]) > 0:
-            modes[ii] = ind[0]
-        else:
-            modes[ii] = ind[1]
+    a0 = np.real(v0)
+    b0 = np.imag(v0)
+    a_S_b = np.einsum('nij,ik,nkj->nj', a0, S, b0)
+    first_mode = conj_modes[:, :, 0]
+    a_S_b_first = np.take_along_axis(a_S_b, first_mode, axis=1)
+    modes = np.where(a_S_b_first > 0, first_mode, conj_modes[:, :, 1])
 
     ##################################################
     #### Sort modes such that (1,2,3) is close to (x,y,zeta) ####
+    abs_v0 = np.abs(v0)
+    def _swap_if(mask, i0, i1):
+        m0 = modes[:, i0].copy()
+        modes[mask, i0] = modes[mask, i1]
+        modes[mask, i1] = m0[mask]
+
     # Identify the longitudinal mode
     for i in [0,1]:
-        if abs(v0[:,modes[2]])[5] < abs(v0[:,modes[i]])[5]:
-            modes[2], modes[i] = modes[i], modes[2]
+        _swap_if(abs_v0[i_mat, 5, modes[:, 2]] < abs_v0[i_mat, 5, modes[:, i]],
+                 2, i)
 
     # Identify the vertical mode
-    if abs(v0[:,modes[1]])[2] < abs(v0[:,modes[0]])[2]:
-        modes[0], modes[1] = modes[1], modes[0]
+    _swap_if(abs_v0[i_mat, 2, modes[:, 1]] < abs_v0[i_mat, 2, modes[:, 0]],
+             0, 1)
 
     ##################################################
     #### Rotate eigenvectors to the Courant-Snyder parameterization ####
-    phase0 = np.log(v0[0,modes[0]]).imag
-    phase1 = np.log(v0[2,modes[1]]).imag
-    phase2 = np.log(v0[4,modes[2]]).imag
-
-    v0[:,modes[0]] *= np.exp(-1.j*phase0)
-    v0[:,modes[1]] *= np.exp(-1.j*phase1)
-    v0[:,modes[2]] *= np.exp(-1.j*phase2)
+    vv = np.take_along_axis(v0, modes[:, None, :], axis=2) # (N, 6, 3)
+    phase = np.log(vv[:, [0, 2, 4], [0, 1, 2]]).imag
+    vv = vv * np.exp(-1.j*phase)[:, None, :]
 
     ##################################################
     #### Construct W #################################
 
-    a1 = v0[:,modes[0]].real
-    a2 = v0[:,modes[1]].real
-    a3 = v0[:,modes[2]].real
-    b1 = v0[:,modes[0]].imag
-    b2 = v0[:,modes[1]].imag
-    b3 = v0[:,modes[2]].imag
-
-    n1 = 1./np.sqrt(np.matmul(np.matmul(a1, S), b1))
-    n2 = 1./np.sqrt(np.matmul(np.matmul(a2, S), b2))
-    n3 = 1./np.sqrt(np.matmul(np.matmul(a3, S), b3))
+    aa = vv.real
+    bb = vv.imag
+    nn = 1./np.sqrt(np.einsum('nik,ij,njk->nk', aa, S, bb))
 
-    a1 *= n1
-    a2 *= n2
-    a3 *= n3
-
-    b1 *= n1
-    b2 *= n2
-    b3 *= n3
-
-    W = np.array([a1,b1,a2,b2,a3,b3]).T
+    W = np.zeros((n_mat, 6, 6))
+    W[:, :, 0::2] = aa * nn[:, None, :]
+    W[:, :, 1::2] = bb * nn[:, None, :]
     W[abs(W) < 1.e-14] = 0. # Set very small numbers to zero.
     #invW = np.matmul(np.matmul(S.T, W.T), S)
     invW = np.linalg.inv(W)
@@ -200,22 +299,17 @@ def compute_linear_normal_form(M, symplectify=False, only_4d_block=False,
     ##################################################
     #### Get tunes and rotation matrix in the normalized coordinates ####
 
-    mu1 = np.log(w0[modes[0]]).imag
-    mu2 = np.log(w0[modes[1]]).imag
-    mu3 = np.log(w0[modes[2]]).imag
-
-    #q1 = mu1/(2.*np.pi)
-    #q2 = mu2/(2.*np.pi)
-    #q3 = mu3/(2.*np.pi)
+    eigenvalues = np.take_along_axis(w0, modes, axis=1)
+    mu = np.log(eigenvalues).imag
 
     R = np.zeros_like(W)
-    R[0:2,0:2] = Rot2D(mu1)
-    R[2:4,2:4] = Rot2D(mu2)
-    R[4:6,4:6] = Rot2D(mu3)
+    for kk in range(3):
+        R[:, 2*kk, 2*kk] = np.cos(mu[:, kk])
+        R[:, 2*kk, 2*kk+1] = np.sin(mu[:, kk])
+        R[:, 2*kk+1, 2*kk] = -np.sin(mu[:, kk])
+        R[:, 2*kk+1, 2*kk+1] = np.cos(mu[:, kk])
     ##################################################
 
-    eigenvalues = w0[modes]
-
     return W, invW, R, eigenvalues
 
 def _assert_matrix_responsiveness(M,
@@ -0,0 +1,158 @@
+# copyright ################################# #
+# This file is part of the Xtrack Package.    #
+# Copyright (c) CERN, 2023.                   #
+# ########################################### #
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+import xobjects as xo
+import xtrack as xt
+
+from ..general import _print
+
+LOGGER = logging.getLogger(__name__)
+
+# Polygons characterized in this process, keyed by `aperture_cache_key`
+_APERTURE_POLYGONS = {}
+
+
+def get_aperture_cache_dir(cache_dir=None) -> Optional[Path]:
+    """
+    Return the directory used to store the polygons characterizing the
+    apertures in the loss location refinement, or None if the on-disk cache
+    is disabled. The on-disk cache is opt-in: it is used if `cache_dir` is
+    given or if the environment variable XSUITE_APERTURE_CACHE is set to 1
+    (otherwise the polygons are cached only within the running process). In
+    the latter case, the location can be set with the environment variable
+    XSUITE_APERTURE_CACHE_DIR (default: `~/.cache/xsuite/apertures`, or
+    `$XDG_CACHE_HOME/xsuite/apertures`).
+    """
+    if cache_dir is not None:
+        return Path(cache_dir).expanduser()
+
+    if os.environ.get('XSUITE_APERTURE_CACHE') != '1':
+        return None
+
+    cache_dir = os.environ.get('XSUITE_APERTURE_CACHE_DIR')
+    if cache_dir:
+        return Path(cache_dir).expanduser()
+
+    xdg_cache = os.environ.get('XDG_CACHE_HOME')
+    if xdg_cache:
+        return Path(xdg_cache) / 'xsuite' / 'apertures'
+
+    return Path.home() / '.cache' / 'xsuite' / 'apertures'
+
+
+def aperture_cache_key(elements, backtrack, n_theta, r_max, dr) -> str:
+    """
+    Return the content hash identifying the polygon obtained by tracking
+    test particles through `elements` (the aperture together with the thin
+    elements between it and the adjacent drift, e.g. the shifts and rotations
+    placing it). It covers the content of the elements, the tracking
+    direction and the parameters of the characterization.
+    """
+    return elements_content_hash(elements,
+                                 extra=(backtrack, n_theta, r_max, dr))
+
+
+def elements_content_hash(elements, extra=()) -> str:
+    """
+    Return a hash of the content of `elements` and of the items in `extra`
+    (and of the xtrack version).
+    """
+    hh = hashlib.sha256()
+    for ee in elements:
+        dct = ee.to_dict()
+        hh.update(json.dumps(dct, cls=xo.JEncoder, sort_keys=True).encode())
+        hh.update(b'\0')
+    for item in tuple(extra) + (xt.__version__,):
+        hh.update(str(item).encode())
+        hh.update(b'\0')
+    return hh.hexdigest()
+
+
+def _cache_file(cache_dir, key):
+    return Path(cache_dir) / f'xtrack_aperture_{key[:32]}.npz'
+
+
+def get_cached_polygon(key, cache_dir=None):
+    """
+    Return the vertices (x_vertices, y_vertices) of the polygon stored with
+    the given key, or None if it is not in the cache.
+    """
+    if key in _APERTURE_POLYGONS:
+        return _APERTURE_POLYGONS[key]
+
+    cache_dir = get_aperture_cache_dir(cache_dir)
+    if cache_dir is None:
+        return None
+
+    fname = _cache_file(cache_dir, key)
+    if not fname.exists():
+        return None
+
+    try:
+        with np.load(fname) as data:
+            if str(data['key']) != key:
+                return None
+            vertices = (data['x_vertices'].copy(), data['y_vertices'].copy())
+    except Exception as err:  # corrupted or incompatible file
+        LOGGER.warning(f'Could not load cached aperture `{fname}` ({err}).')
+        return None
+
+    _APERTURE_POLYGONS[key] = vertices
+    return vertices
+
+
+def store_polygon(key, x_vertices, y_vertices, cache_dir=None):
+    """
+    Store the vertices of a polygon in the cache (in memory and, if enabled,
+    on disk).
+    """
+    vertices = (np.array(x_vertices, dtype=np.float64),
+                np.array(y_vertices, dtype=np.float64))
+    _APERTURE_POLYGONS[key] = vertices
+
+    cache_dir = get_aperture_cache_dir(cache_dir)
+    if cache_dir is None:
+        return
+
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file and move it to the cache atomically, so
+        # that concurrent processes never see a partial file
+        with tempfile.NamedTemporaryFile(dir=cache_dir, suffix='.npz',
+                                         delete=False) as fid:
+            np.savez(fid, key=key, x_vertices=vertices[0],
+                     y_vertices=vertices[1])
+        os.replace(fid.name, _cache_file(cache_dir, key))
+    except OSError as err:
+        LOGGER.warning(f'Could not store aperture in the cache ({err}).')
+
+
+def clear_aperture_cache(cache_dir=None, verbose=False):
+    """
+    Remove all the polygons from the cache (in memory and on disk).
+    """
+    _APERTURE_POLYGONS.clear()
+
+    cache_dir = get_aperture_cache_dir(cache_dir)
+    if cache_dir is None or not Path(cache_dir).is_dir():
+        return
+
+    for ff in Path(cache_dir).iterdir():
+        if ff.is_file() and ff.name.startswith('xtrack_aperture_'):
+            try:
+                ff.unlink()
+            except OSError:
+                continue
+            if verbose:
+                _print(f'Removed `{ff}`.')
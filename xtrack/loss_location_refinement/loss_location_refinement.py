@@ -14,6 +14,8 @@ from ..beam_elements import LimitPolygon, XYShift, SRotation, Drift, Marker
 from ..line import Line, _is_thick, _behaves_like_drift, _allow_backtrack
 
 from ..general import _print
+from .aperture_cache import (aperture_cache_key, elements_content_hash,
+                             get_cached_polygon, store_polygon)
 
 import logging
 logger = logging.getLogger(__name__)
@@ -52,13 +54,23 @@ class LossLocationRefinement:
         List of element types through which the backtracking is allowed.
         Elements exposing the attribute `allow_backtrack` are automatically
         added to the list.
+    use_aperture_cache : bool
+        If True, the polygons characterizing the apertures are cached (see
+        `xtrack.loss_location_refinement.aperture_cache`) and reused for
+        apertures with identical content and placement. The polygons are
+        stored on disk only if `aperture_cache_dir` is given or if the
+        environment variable XSUITE_APERTURE_CACHE is set to 1. Defaults to
+        False.
+    aperture_cache_dir : str or pathlib.Path
+        Directory of the on-disk aperture cache.
 
     '''
 
     def __init__(self, line, backtrack_line=None,
                  n_theta=None, r_max=None, dr=None, ds=None,
                  save_refine_lines=False,
-                 allowed_backtrack_types=[]):
+                 allowed_backtrack_types=[],
+                 use_aperture_cache=False, aperture_cache_dir=None):
 
         if backtrack_line is not None:
             raise ValueError('Backtracking line not supported anymore!')
@@ -99,12 +111,24 @@ class LossLocationRefinement:
         self.dr = dr
         self.ds = ds
         self.allowed_backtrack_types = allowed_backtrack_types
+        self.use_aperture_cache = use_aperture_cache
+        self.aperture_cache_dir = aperture_cache_dir
+
+        # Interpolating lines for each pair of apertures, reused across calls
+        # (stored with the hash of the content of the elements from which
+        # they are built)
+        self._refine_data = {}
+        self._cache_params = None
+        self._cache_tracker = None
 
     def refine_loss_location(self, particles, i_apertures=None):
 
         '''
         Refine the location of the lost particles within the line.
 
+        The interpolating lines built for each pair of consecutive apertures
+        are cached and reused in the following calls.
+
         Parameters
         ----------
         particles : xpart.Particles
@@ -119,63 +143,130 @@ class LossLocationRefinement:
         if i_apertures is None:
             i_apertures = self.i_apertures
 
+        self._check_cache()
+
+        # Apertures at which particles are lost (single pass on the particles)
+        mask_lost = particles.state == 0
+        lossy_apertures = set(np.unique(particles.at_element[mask_lost]))
+
+        segments = []
         for i_ap in i_apertures:
-            if np.any((particles.at_element==i_ap) & (particles.state==0)):
-
-                if self.i_apertures.index(i_ap) == 0:
-                    logger.warning(
-                            'Unable to handle the first aperture in the line')
-                    continue
-
-                i_aper_1 = i_ap
-                i_aper_0 = self.i_apertures[self.i_apertures.index(i_ap) - 1]
-                logger.debug(f'i_aper_1={i_aper_1}, i_aper_0={i_aper_0}')
-
-                s0, s1, _ = generate_interp_aperture_locations(self.line,
-                                                   i_aper_0, i_aper_1, self.ds)
-                assert s1 >= s0
-                if s1 - s0 <= self.ds:
-                    logger.debug('s1-s0 < ds: nothing to do')
-                    continue
-
-                presence_shifts_rotations = check_for_active_shifts_and_rotations(
-                                                    self.line, i_aper_0, i_aper_1)
-                logger.debug(f'presence_shifts_rotations={presence_shifts_rotations}')
-
-                if (not(presence_shifts_rotations) and
-                   apertures_are_identical(self.line.elements[i_aper_0],
-                                           self.line.elements[i_aper_1])):
-
-                    logger.debug('Replicate mode')
-                    (interp_line, i_end_thin_0, i_start_thin_1, s0, s1
-                            ) = interp_aperture_replicate(self._context,
-                                      self.line,
-                                      i_aper_0, i_aper_1,
-                                      self.ds,
-                                      _ln_gen=self._ln_gen)
-
-                else:
-
-                    logger.debug('Polygon interpolation mode')
-                    (interp_line, i_end_thin_0, i_start_thin_1, s0, s1
-                            ) = interp_aperture_using_polygons(self._context,
-                                      self.line,
-                                      i_aper_0, i_aper_1,
-                                      self.n_theta, self.r_max, self.dr, self.ds,
-                                      _ln_gen=self._ln_gen)
-
-                interp_line._original_line = self._original_line
-                part_refine = refine_loss_location_single_aperture(
-                        particles, i_aper_1, i_end_thin_0,
-                        self.line, interp_line, inplace=True,
-                        allowed_backtrack_types=self.allowed_backtrack_types)
-
-                if self.save_refine_lines:
-                    interp_line.i_start_thin_0 = i_end_thin_0
-                    interp_line.i_start_thin_1 = i_start_thin_1
-                    interp_line.s0 = s0
-                    interp_line.s1 = s1
-                    self.refine_lines[i_ap] = interp_line
+            if i_ap not in lossy_apertures:
+                continue
+
+            if self.i_apertures.index(i_ap) == 0:
+                logger.warning(
+                        'Unable to handle the first aperture in the line')
+                continue
+
+            i_aper_1 = i_ap
+            i_aper_0 = self.i_apertures[self.i_apertures.index(i_ap) - 1]
+            logger.debug(f'i_aper_1={i_aper_1}, i_aper_0={i_aper_0}')
+
+            refine_data = self._get_refine_data(i_aper_0, i_aper_1)
+            if refine_data is None:
+                continue
+
+            if refine_data['skip']:
+                continue
+
+            segments.append((i_aper_1, refine_data))
+
+            if self.save_refine_lines:
+                interp_line = refine_data['interp_line']
+                interp_line.i_start_thin_0 = refine_data['i_end_thin_0']
+                interp_line.i_start_thin_1 = refine_data['i_start_thin_1']
+                interp_line.s0 = refine_data['s0']
+                interp_line.s1 = refine_data['s1']
+                self.refine_lines[i_ap] = interp_line
+
+        if len(segments) == 0:
+            return
+
+        refine_loss_location_multiple_apertures(particles,
+            i_apertures=[ss[0] for ss in segments],
+            i_end_thin_0=[ss[1]['i_end_thin_0'] for ss in segments],
+            line=self.line,
+            interp_lines=[ss[1]['interp_line'] for ss in segments])
+
+    def _check_cache(self):
+
+        # Cached interpolating lines are invalidated if the parameters
+        # used to build them have been changed or if the tracker has been
+        # rebuilt
+        cache_params = (self.n_theta, self.r_max, self.dr, self.ds,
+                        tuple(self.allowed_backtrack_types))
+        if (self._cache_params != cache_params
+                or self._cache_tracker is not self.line.tracker):
+            self._refine_data = {}
+            self._cache_params = cache_params
+            self._cache_tracker = self.line.tracker
+
+    def _get_refine_data(self, i_aper_0, i_aper_1):
+
+        # Changes in the apertures or in the elements between them are
+        # detected from their content
+        key = (i_aper_0, i_aper_1)
+        content_hash = elements_content_hash(
+                                self.line.elements[i_aper_0:i_aper_1 + 1])
+        if key in self._refine_data:
+            cached_hash, refine_data = self._refine_data[key]
+            if cached_hash == content_hash:
+                return refine_data
+
+        s0, s1, _ = generate_interp_aperture_locations(self.line,
+                                            i_aper_0, i_aper_1, self.ds)
+        assert s1 >= s0
+        if s1 - s0 <= self.ds:
+            logger.debug('s1-s0 < ds: nothing to do')
+            self._refine_data[key] = (content_hash, None)
+            return None
+
+        presence_shifts_rotations = check_for_active_shifts_and_rotations(
+                                            self.line, i_aper_0, i_aper_1)
+        logger.debug(f'presence_shifts_rotations={presence_shifts_rotations}')
+
+        if (not(presence_shifts_rotations) and
+           apertures_are_identical(self.line.elements[i_aper_0],
+                                   self.line.elements[i_aper_1])):
+
+            logger.debug('Replicate mode')
+            (interp_line, i_end_thin_0, i_start_thin_1, s0, s1
+                    ) = interp_aperture_replicate(self._context,
+                              self.line,
+                              i_aper_0, i_aper_1,
+                              self.ds,
+                              _ln_gen=self._ln_gen)
+
+        else:
+
+            logger.debug('Polygon interpolation mode')
+            (interp_line, i_end_thin_0, i_start_thin_1, s0, s1
+                    ) = interp_aperture_using_polygons(self._context,
+                              self.line,
+                              i_aper_0, i_aper_1,
+                              self.n_theta, self.r_max, self.dr, self.ds,
+                              _ln_gen=self._ln_gen,
+                              use_aperture_cache=self.use_aperture_cache,
+                              aperture_cache_dir=self.aperture_cache_dir)
+
+        interp_line._original_line = self._original_line
+
+        skip = not check_backtrack_allowed(self._original_line,
+                    i_start=i_end_thin_0 + 1, i_stop=i_aper_1,
+                    allowed_backtrack_types=self.allowed_backtrack_types)
+
+        refine_data = {
+            'interp_line': interp_line,
+            'i_end_thin_0': i_end_thin_0,
+            'i_start_thin_1': i_start_thin_1,
+            's0': s0,
+            's1': s1,
+            'skip': skip,
+        }
+        self._refine_data[key] = (content_hash, refine_data)
+
+        return refine_data
 
 
 def check_for_active_shifts_and_rotations(line, i_aper_0, i_aper_1):
@@ -242,17 +333,9 @@ def refine_loss_location_single_aperture(particles, i_aper_1, i_end_thin_0,
     i_start = i_end_thin_0 + 1
     i_stop = i_aper_1
 
-    # Check that we are not backtracking through element types that are not allowed
-    for nn in interp_line._original_line.element_names[i_start : i_stop]:
-        ee = interp_line._original_line.element_dict[nn]
-
-        if ((hasattr(ee, 'has_backtrack') and not ee.has_backtrack) or
-            (not _allow_backtrack(ee) and not isinstance(ee, tuple(allowed_backtrack_types)))):
-            if _skip_in_loss_location_refinement(ee):
-                return 'skipped'
-            raise TypeError(
-                f'Cannot backtrack through element {nn} of type '
-                f'{ee.__class__.__name__}')
+    if not check_backtrack_allowed(interp_line._original_line, i_start, i_stop,
+                                   allowed_backtrack_types):
+        return 'skipped'
 
     with xt.line._preserve_config(line):
         line.config.XTRACK_GLOBAL_XY_LIMIT = None
@@ -284,6 +367,85 @@ def refine_loss_location_single_aperture(particles, i_aper_1, i_end_thin_0,
 
     return part_refine
 
+_REFINED_COORDINATES = ['x', 'px', 'y', 'py', 'zeta', 's', 'delta', 'ptau',
+                        'rvv', 'rpp', 'p0c', 'gamma0', 'beta0']
+
+def refine_loss_location_multiple_apertures(particles, i_apertures,
+                    i_end_thin_0, line, interp_lines, inplace=True):
+
+    '''
+    Refine the loss location of the particles lost at several apertures.
+    The lost particles are extracted and written back in a single vectorized
+    step, each group is then backtracked to the upstream aperture and
+    tracked through the corresponding interpolating line.
+    '''
+
+    at_element = particles.at_element
+    mask_part = (particles.state == 0) & np.isin(at_element, i_apertures)
+
+    # Lost particles sorted by aperture (one contiguous block per aperture)
+    i_part = np.where(mask_part)[0]
+    i_part = i_part[np.argsort(at_element[i_part], kind='stable')]
+    aper_of_part = at_element[i_part]
+    block_start = np.searchsorted(aper_of_part, i_apertures, side='left')
+    block_end = np.searchsorted(aper_of_part, i_apertures, side='right')
+
+    coords_in = {nn: getattr(particles, nn)[i_part] for nn in
+                 ['p0c', 'x', 'px', 'y', 'py', 'zeta', 'delta', 's', 'chi',
+                  'charge_ratio']}
+    coords_out = {nn: np.zeros(len(i_part)) for nn in _REFINED_COORDINATES}
+
+    with xt.line._preserve_config(line):
+        line.config.XTRACK_GLOBAL_XY_LIMIT = None
+
+        for i_aper_1, i_thin_0, interp_line, i0, i1 in zip(
+                i_apertures, i_end_thin_0, interp_lines,
+                block_start, block_end):
+
+            if i1 == i0:
+                continue
+
+            part_refine = xp.Particles(mass0=particles.mass0,
+                    q0=particles.q0,
+                    **{nn: vv[i0:i1] for nn, vv in coords_in.items()})
+
+            line.track(part_refine, ele_start=i_thin_0 + 1, ele_stop=i_aper_1,
+                       backtrack='force')
+
+            # Track with extra apertures
+            interp_line.track(part_refine)
+
+            indx_sorted = np.argsort(part_refine.particle_id)
+            for nn in _REFINED_COORDINATES:
+                coords_out[nn][i0:i1] = getattr(part_refine, nn)[indx_sorted]
+
+    if inplace:
+        with particles._bypass_linked_vars():
+            for nn in _REFINED_COORDINATES:
+                getattr(particles, nn)[i_part] = coords_out[nn]
+
+    return coords_out
+
+def check_backtrack_allowed(line, i_start, i_stop, allowed_backtrack_types=[]):
+
+    '''
+    Check that we are not backtracking through element types that are not
+    allowed. Returns False if the refinement has to be skipped.
+    '''
+
+    for nn in line.element_names[i_start : i_stop]:
+        ee = line.element_dict[nn]
+
+        if ((hasattr(ee, 'has_backtrack') and not ee.has_backtrack) or
+            (not _allow_backtrack(ee) and not isinstance(ee, tuple(allowed_backtrack_types)))):
+            if _skip_in_loss_location_refinement(ee):
+                return False
+            raise TypeError(
+                f'Cannot backtrack through element {nn} of type '
+                f'{ee.__class__.__name__}')
+
+    return True
+
 def interp_aperture_replicate(context, line,
                               i_aper_0, i_aper_1,
                               ds, _ln_gen, mode='end',):
@@ -320,19 +482,24 @@ def interp_aperture_replicate(context, line,
 
 def interp_aperture_using_polygons(context, line,
                        i_aper_0, i_aper_1,
-                       n_theta, r_max, dr, ds, _ln_gen):
+                       n_theta, r_max, dr, ds, _ln_gen,
+                       use_aperture_cache=False, aperture_cache_dir=None):
 
     temp_buf = context.new_buffer()
 
     polygon_1, i_start_thin_1 = characterize_aperture(line,
                                  i_aper_1, n_theta, r_max, dr,
                                  buffer_for_poly=temp_buf,
-                                 coming_from='upstream')
+                                 coming_from='upstream',
+                                 use_cache=use_aperture_cache,
+                                 cache_dir=aperture_cache_dir)
 
     polygon_0, i_end_thin_0 = characterize_aperture(line, i_aper_0,
                                  n_theta, r_max, dr,
                                  buffer_for_poly=temp_buf,
-                                 coming_from='downstream')
+                                 coming_from='downstream',
+                                 use_cache=use_aperture_cache,
+                                 cache_dir=aperture_cache_dir)
 
     s0, s1, s_vect = generate_interp_aperture_locations(line,
                                                    i_aper_0, i_aper_1, ds)
@@ -462,7 +629,8 @@ def index_in_reversed_line(num_elements, ii):
 
 
 def characterize_aperture(line, i_aperture, n_theta, r_max, dr,
-                          buffer_for_poly, coming_from='upstream'):
+                          buffer_for_poly, coming_from='upstream',
+                          use_cache=False, cache_dir=None):
 
     assert coming_from in ['upstream', 'downstream']
 
@@ -480,6 +648,18 @@ def characterize_aperture(line, i_aperture, n_theta, r_max, dr,
                 line.tracker._tracker_data_base.elements[i_start:i_stop+1]])
         index_start_thin = i_stop - 1
 
+    if use_cache:
+        cache_key = aperture_cache_key(
+                line.tracker._tracker_data_base.elements[i_start:i_stop],
+                backtrack, n_theta, r_max, dr)
+        cached_vertices = get_cached_polygon(cache_key, cache_dir=cache_dir)
+        if cached_vertices is not None:
+            logger.debug(f'Polygon for aperture {i_aperture} found in cache')
+            polygon = LimitPolygon(x_vertices=cached_vertices[0],
+                                   y_vertices=cached_vertices[1],
+                                   _buffer=buffer_for_poly)
+            return polygon, index_start_thin
+
     # Get polygon
     theta_vect = np.linspace(0, 2*np.pi, n_theta+1)[:-1]
 
@@ -546,5 +726,8 @@ def characterize_aperture(line, i_aperture, n_theta, r_max, dr,
     polygon = LimitPolygon(x_vertices=res[0], y_vertices=res[1],
                               _buffer=buffer_for_poly)
 
+    if use_cache:
+        store_polygon(cache_key, res[0], res[1], cache_dir=cache_dir)
+
     return polygon, index_start_thin
 
@@ -0,0 +1,1122 @@
+"""
+Native parser for MAD-X lattice files (sequences, element definitions and
+strength files), not requiring MAD-X or cpymad.
+
+MadxParser reads the files and exposes an interface mimicking the subset of
+the cpymad `Madx` object used by MadLoader (globals, elements, sequences with
+their expanded elements, beam and options), so that a line can be built with:
+
+    mad = xt.MadxParser()
+    mad.call('lattice.seq')
+    mad.call('optics.str')
+    line = xt.Line.from_madx_sequence(mad.sequence.lhcb1,
+                                      deferred_expressions=True)
+
+Supported statements are variable assignments (`=` and `:=`), element
+definitions and attribute changes (`name->attr`), sequences (with `at`,
+`from` and `refer`, possibly placed in other sequences), `beam`, `option`,
+`call`, `return` and conditional blocks (`if`/`elseif`/`else`). Commands
+which do not affect the lattice (e.g. `twiss`, `select`, `use`) are ignored,
+while constructs that cannot be handled safely (sequence editing, macros,
+`exec`, `while` loops, beam lines) raise NotImplementedError.
+"""
+
+import logging
+import math
+import re
+from pathlib import Path
+
+from lark import Lark, Transformer, v_args
+from xdeps.madxutils import calc_grammar
+
+LOGGER = logging.getLogger(__name__)
+
+# Constants predefined in MAD-X
+MADX_CONSTANTS = {
+    'version': 50902.0,
+    'pi': math.pi,
+    'twopi': 2 * math.pi,
+    'degrad': 180 / math.pi,
+    'raddeg': math.pi / 180,
+    'e': math.e,
+    'amu0': 4e-7 * math.pi,
+    'emass': 0.00051099895,
+    'mumass': 0.1056583755,
+    'nmass': 0.93956542052,
+    'umass': 0.93149410242,
+    'pmass': 0.93827208816,
+    'clight': 299792458.0,
+    'qelect': 1.602176634e-19,
+    'hbar': 6.582119569e-25,
+    'erad': 2.8179403262e-15,
+    'prad': 2.8179403262e-15 * 0.00051099895 / 0.93827208816,
+    'twiss_tol': 1e-06,
+}
+
+# Default attributes of the MAD-X element types (those read by MadLoader,
+# the type of the default value defines how the attribute is parsed)
+_COMMON = {'at': 1e20, 'l': 0., 'slot_id': 0, 'from': '', 'type': '',
+           'comments': '', 'kmax': 0., 'kmin': 0., 'calib': 0.,
+           'polarity': 0., 'mech_sep': 0., 'v_pos': 0., 'assembly_id': 0}
+_ALIGN = {'dx': 0., 'dy': 0., 'ds': 0., 'dtheta': 0., 'dphi': 0., 'dpsi': 0.}
+_APER = {'aperture': [0.], 'aper_offset': [0.], 'aper_tol': [0., 0., 0.],
+         'aper_vx': [-1.], 'aper_vy': [-1.], 'apertype': 'circle',
+         'aper_tilt': 0.}
+_EDGES = {'e1': 0., 'e2': 0., 'h1': 0., 'h2': 0., 'hgap': 0., 'fint': 0.,
+          'fintx': -1.}
+_THIN_MULT = {'lrad': 0., 'knl': [0.], 'ksl': [0.]}
+_KICK = {'lrad': 0., 'chkick': 0., 'cvkick': 0., 'chflag': 1, 'cvflag': 1}
+_RF = {'volt': 0., 'lag': 0., 'freq': 0., 'harmon': 0}
+_MATRIX = {**{f'kick{ii}': 0. for ii in range(1, 7)},
+           **{f'rm{ii}{jj}': float(ii == jj)
+              for ii in range(1, 7) for jj in range(1, 7)},
+           **{f'tm{ii}{jj}{kk}': 0. for ii in range(1, 7)
+              for jj in range(1, 7) for kk in range(1, 7)}}
+
+MADX_BASE_TYPES = {
+    'drift': {'tilt': 0., 'aper_tilt': 0.},
+    'marker': {**_APER},
+    'rbend': {'angle': 0., 'tilt': 0., 'k0': 0., 'k0s': 0., 'k1': 0.,
+              'k1s': 0., 'k2': 0., 'k2s': 0., 'k3': 0., 'k3s': 0.,
+              'knl': [0.], 'ksl': [0.], **_EDGES, **_APER, 'fringe': 1,
+              'thick': False},
+    'sbend': {'angle': 0., 'tilt': 0., 'k0': 0., 'k0s': 0., 'k1': 0.,
+              'k1s': 0., 'k2': 0., 'k2s': 0., 'k3': 0., 'k3s': 0.,
+              'knl': [0.], 'ksl': [0.], **_EDGES, **_APER, 'fringe': 1,
+              'thick': False},
+    'quadrupole': {'tilt': 0., 'k0': 0., 'k1': 0., 'k1s': 0., 'knl': [0.],
+                   'ksl': [0.], **_EDGES, **_APER, 'thick': False},
+    'sextupole': {'tilt': 0., 'k2': 0., 'k2s': 0., 'knl': [0.], 'ksl': [0.],
+                  **_EDGES, **_APER},
+    'octupole': {'tilt': 0., 'k3': 0., 'k3s': 0., 'knl': [0.], 'ksl': [0.],
+                 **_EDGES, **_APER},
+    'multipole': {'tilt': 0., 'angle': 0., 'ksi': 0., **_THIN_MULT, **_APER},
+    'solenoid': {'ks': 0., 'ksi': 0., 'xtilt': 0., 'rot_start': 0.,
+                 'fint': 0., 'fintx': -1., 'hgap': 0., **_THIN_MULT,
+                 **_APER},
+    'rfcavity': {**_RF, 'lagtap': 0., 'n_bessel': 0, **_APER},
+    'twcavity': {**_RF, 'psi': 0., 'delta_lag': 0., **_APER},
+    'crabcavity': {**_RF, 'tilt': 0., 'lagf': 0., **_APER},
+    'rfmultipole': {**_RF, 'tilt': 0., 'pnl': [0.], 'psl': [0.],
+                    **_THIN_MULT, **_APER},
+    'hacdipole': {**_RF, **_APER},
+    'vacdipole': {**_RF, **_APER},
+    'elseparator': {'tilt': 0., 'ex': 0., 'ey': 0., 'ex_l': 0., 'ey_l': 0.,
+                    'lrad': 0., **_APER},
+    'srotation': {'angle': 0., **_APER},
+    'xrotation': {'angle': 0., **_APER},
+    'yrotation': {'angle': 0., **_APER},
+    'translation': {},
+    'kicker': {'tilt': 0., 'hkick': 0., 'vkick': 0., **_KICK, **_APER},
+    'tkicker': {'tilt': 0., 'hkick': 0., 'vkick': 0., **_KICK, **_APER},
+    'hkicker': {'tilt': 0., 'kick': 0., 'hkick': 0., **_KICK, **_APER},
+    'vkicker': {'tilt': 0., 'kick': 0., 'vkick': 0., **_KICK, **_APER},
+    'dipedge': {'tilt': 0., 'e1': 0., 'h': 0., 'he': 0., 'hgap': 0.,
+                'fint': 0., **_APER},
+    'monitor': {'tilt': 0., 'lrad': 0., **_APER},
+    'hmonitor': {'tilt': 0., 'lrad': 0., **_APER},
+    'vmonitor': {'tilt': 0., 'lrad': 0., **_APER},
+    'instrument': {'tilt': 0., 'lrad': 0., **_APER},
+    'placeholder': {'tilt': 0., 'lrad': 0., **_APER},
+    'collimator': {'tilt': 0., 'lrad': 0., **_APER},
+    'ecollimator': {'tilt': 0., 'lrad': 0., 'xsize': 0., 'ysize': 0.,
+                    **_APER},
+    'rcollimator': {'tilt': 0., 'lrad': 0., 'xsize': 0., 'ysize': 0.,
+                    **_APER},
+    'slmonitor': {**_APER},
+    'blmonitor': {**_APER},
+    'imonitor': {**_APER},
+    'beambeam': {'bbshape': 1, 'sigx': 0., 'sigy': 0., 'xma': 0., 'yma': 0.,
+                 'width': 0., 'charge': 1., 'angle': 0., 'bbdir': -1,
+                 'aper_tilt': 0.},
+    'matrix': {**_MATRIX, 'aper_tilt': 0.},
+    'nllens': {'knll': 0., 'cnll': 0., 'tilt': 0., 'lrad': 0., **_APER},
+    'wire': {'lrad': 0., 'xma': [0.], 'yma': [0.], 'current': [0.],
+             'l_int': [0.], 'l_phy': [0.], 'closed_orbit': -1, **_APER},
+    'thinwire': {'xma': [0.], 'yma': [0.], 'ilnorm': [0.], **_APER},
+    'changeref': {'patch_ang': [0., 0., 0.], 'patch_trans': [0., 0., 0.],
+                  **_APER},
+}
+
+for _name, _attrs in MADX_BASE_TYPES.items():
+    MADX_BASE_TYPES[_name] = {**_COMMON, **_ALIGN, **_attrs}
+
+# Attributes that take names (possibly unquoted) instead of expressions
+_STRING_ATTRIBUTES = {'apertype', 'from', 'type', 'refer', 'particle',
+                      'sequence', 'file', 'refpos', 'comments', 'fieldmap'}
+
+# Particles known to the MAD-X beam command: (mass in GeV, charge)
+_BEAM_PARTICLES = {
+    'positron': ('emass', 1.), 'electron': ('emass', -1.),
+    'proton': ('pmass', 1.), 'antiproton': ('pmass', -1.),
+    'posmuon': ('mumass', 1.), 'negmuon': ('mumass', -1.),
+    'ion': ('nmass', 1.),
+}
+
+# Commands not affecting the lattice description
+_IGNORED_COMMANDS = {
+    'use', 'title', 'set', 'show', 'value', 'print', 'printf', 'system',
+    'assign', 'help', 'select', 'twiss', 'survey', 'esave', 'save',
+    'savebeta', 'emit', 'resbeam', 'coguess', 'delete', 'write', 'plot',
+    'setplot', 'resplot', 'track', 'endtrack', 'start', 'observe', 'run',
+    'makethin', 'ptc_create_universe', 'ptc_create_layout', 'ptc_twiss',
+    'ptc_end', 'match', 'endmatch', 'vary', 'constraint', 'lmdif',
+    'jacobian', 'simplex', 'migrad', 'global', 'weight', 'readtable',
+    'readmytable', 'create', 'fill', 'setvars', 'setvars_lin', 'fill_knob',
+    'shrink', 'eoption', 'ealign', 'efcomp', 'seterr', 'etable',
+    'usemonitor', 'usekick', 'correct', 'csave', 'aperture',
+    'dynap', 'sodd', 'touschek', 'ibs',
+}
+
+# Commands that cannot be ignored without producing a wrong lattice
+_UNSUPPORTED_COMMANDS = {
+    'seqedit', 'install', 'move', 'remove', 'cycle', 'reflect', 'flatten',
+    'endedit', 'replace', 'extract', 'macro', 'exec', 'while', 'line',
+}
+
+_NAME = r'[a-z_][a-z0-9_\.\$]*'
+_RE_ASSIGN = re.compile(
+    r'^(?:(?:real|const|int|shared)\s+)*(' + _NAME + r')\s*(:?=)\s*(.+)$', re.S)
+_RE_ELEM_ATTR_ASSIGN = re.compile(
+    r'^(' + _NAME + r')\s*->\s*(' + _NAME + r')\s*(:?=)\s*(.+)$', re.S)
+_RE_LABELLED = re.compile(
+    r'^(?:shared\s+)?(' + _NAME + r')\s*:\s*(' + _NAME + r')\s*(?:,(.*))?$',
+    re.S)
+_RE_LINE_DEFINITION = re.compile(
+    r'^' + _NAME + r'\s*(\(.*\))?\s*:\s*line\s*=', re.S)
+_RE_COMMAND = re.compile(r'^(' + _NAME + r')\s*(?:,(.*))?$', re.S)
+_RE_NUMBER = re.compile(r'^[+-]?(\d+\.?\d*|\.\d+)(e[+-]?\d+)?$')
+
+
+@v_args(inline=True)
+class _ExprToPython(Transformer):
+    '''
+    Translate a MAD-X expression, following the grammar used by xdeps to
+    build the deferred expressions, into Python source code.
+    '''
+
+    def number(self, tok):
+        return repr(float(tok))
+
+    def var(self, name):
+        return f'_v[{name.value!r}]'
+
+    def getitem(self, name, key):
+        return f'_e({name.value!r}, {key.value!r})'
+
+    def call(self, name, *args):
+        return f"_f[{name.value!r}]({', '.join(args)})"
+
+    def add(self, a, b):
+        return f'({a} + {b})'
+
+    def sub(self, a, b):
+        return f'({a} - {b})'
+
+    def mul(self, a, b):
+        return f'({a} * {b})'
+
+    def div(self, a, b):
+        return f'({a} / {b})'
+
+    def pow(self, a, b):
+        return f'({a} ** {b})'
+
+    def neg(self, a):
+        return f'(-{a})'
+
+    def pos(self, a):
+        return a
+
+
+_expr_parser = None
+_compiled_expressions = {}
+
+
+def compile_madx_expression(expr):
+    '''
+    Compile a MAD-X expression into a Python code object, evaluated with the
+    names `_v` (variables), `_f` (functions) and `_e` (element attributes).
+    The compiled expressions are cached.
+    '''
+    global _expr_parser
+    code = _compiled_expressions.get(expr)
+    if code is None:
+        if _expr_parser is None:
+            _expr_parser = Lark(calc_grammar, parser='lalr',
+                                transformer=_ExprToPython())
+        try:
+            source = _expr_parser.parse(expr)
+        except Exception as err:
+            raise ValueError(f'Cannot parse expression `{expr}`') from err
+        code = compile(source, '<madx>', 'eval')
+        _compiled_expressions[expr] = code
+    return code
+
+
+class MadxParameter:
+    '''
+    Attribute of an element or global variable, with its value and, if
+    deferred, its expression (as cpymad's Parameter). For list attributes,
+    `value` and `expr` are lists.
+    '''
+
+    __slots__ = ('name', '_value', 'expr', '_parser', 'inform')
+
+    def __init__(self, name, value, expr=None, parser=None, inform=True):
+        self.name = name
+        self._value = value
+        self.expr = expr
+        self._parser = parser
+        self.inform = inform
+
+    @property
+    def value(self):
+        if self.expr is None:
+            return self._value
+        if isinstance(self._value, list):
+            return [self._parser.eval(ee) if ee is not None else vv
+                    for vv, ee in zip(self._value, self.expr)]
+        value = self._parser.eval(self.expr)
+        if isinstance(self._value, int) and not isinstance(self._value, bool):
+            value = int(value)
+        return value
+
+    def copy(self):
+        value = (list(self._value) if isinstance(self._value, list)
+                 else self._value)
+        expr = list(self.expr) if isinstance(self.expr, list) else self.expr
+        return MadxParameter(self.name, value, expr, self._parser,
+                             inform=False)
+
+    def __repr__(self):
+        return f'<{self.name}={self.value!r} expr={self.expr!r}>'
+
+
+class MadxElement:
+    '''
+    Element defined in MAD-X, with its parent (the element or base type it
+    is derived from) and its attributes in `cmdpar`.
+    '''
+
+    def __init__(self, name, parent, cmdpar):
+        self.name = name
+        self.parent = parent if parent is not None else self
+        self.cmdpar = cmdpar
+        self.field_errors = None
+        self.align_errors = None
+        self.phase_errors = None
+
+    @property
+    def base_type(self):
+        elem = self
+        while elem.parent is not elem:
+            elem = elem.parent
+        return elem
+
+    def __getattr__(self, name):
+        if name.startswith('__') or name == 'cmdpar':
+            raise AttributeError(name)
+        par = self.cmdpar.get(name.lower())
+        if par is None:
+            raise AttributeError(
+                f'Element `{self.name}` has no attribute `{name}`')
+        return par.value
+
+    def __repr__(self):
+        return f'<MadxElement {self.name}: {self.base_type.name}>'
+
+
+class MadxBeam:
+    '''
+    Beam attached to a sequence (subset of the MAD-X beam command).
+    '''
+
+    def __init__(self, parser, particle='positron', mass=None, charge=None,
+                 energy=None, pc=None, gamma=None, beta=None, brho=None,
+                 **kwargs):
+
+        if particle not in _BEAM_PARTICLES and mass is None:
+            raise ValueError(f'Mass must be provided for particle `{particle}`')
+        default_mass, default_charge = _BEAM_PARTICLES.get(
+                                            particle, ('nmass', 1.))
+        if mass is None:
+            mass = MADX_CONSTANTS[default_mass]
+        if charge is None:
+            charge = default_charge
+
+        if energy is not None:
+            pass
+        elif pc is not None:
+            energy = math.sqrt(pc**2 + mass**2)
+        elif gamma is not None:
+            energy = gamma * mass
+        elif beta is not None:
+            energy = mass / math.sqrt(1 - beta**2)
+        elif brho is not None:
+            pc = brho * abs(charge) * MADX_CONSTANTS['clight'] * 1e-9
+            energy = math.sqrt(pc**2 + mass**2)
+        else:
+            energy = 1.
+
+        self.particle = particle
+        self.mass = mass
+        self.charge = charge
+        self.energy = energy
+        self.pc = math.sqrt(energy**2 - mass**2)
+        self.gamma = energy / mass
+        self.beta = self.pc / energy
+        self.brho = self.pc / abs(charge) / MADX_CONSTANTS['clight'] * 1e9
+        for kk, vv in kwargs.items():
+            setattr(self, kk, vv)
+
+    def __repr__(self):
+        return (f'MadxBeam(particle={self.particle}, mass={self.mass}, '
+                f'charge={self.charge}, energy={self.energy})')
+
+
+class MadxSequence:
+    '''
+    Sequence defined in MAD-X. The element positions are evaluated and the
+    drifts generated when `expanded_elements` is accessed.
+    '''
+
+    def __init__(self, name, parser, length, refer='centre'):
+        self.name = name
+        self._madx = parser
+        self._length = length
+        self.refer = refer
+        self.refpos = None
+        self.placements = []  # (element, at, from)
+        self._expanded = None
+
+    @property
+    def length(self):
+        return self._length.value
+
+    @property
+    def beam(self):
+        return self._madx.beams.get(self.name, self._madx.beam)
+
+    @property
+    def elements(self):
+        return [elem for elem, _, _ in self.placements]
+
+    @property
+    def expanded_elements(self):
+        if self._expanded is None:
+            self._expanded = self._expand()
+        return self._expanded
+
+    def _element_length(self, elem):
+        if isinstance(elem, MadxSequence):
+            return elem.length
+        length = elem.l
+        if (elem.base_type.name == 'rbend' and self._madx.options.rbarc
+                and elem.angle):
+            # Position along the sequence is the arc length
+            length = 0.5 * length * elem.angle / math.sin(0.5 * elem.angle)
+        return length
+
+    def _positions(self):
+        '''
+        Return the position of the reference point of each placed element,
+        resolving the `from` references.
+        '''
+        at_values = [at.value for _, at, _ in self.placements]
+        index_by_name = {}
+        for ii, (elem, _, _) in enumerate(self.placements):
+            index_by_name.setdefault(elem.name, ii)
+
+        positions = [None] * len(self.placements)
+
+        def _position(ii, visiting=()):
+            if positions[ii] is not None:
+                return positions[ii]
+            _, _, from_ = self.placements[ii]
+            pos = at_values[ii]
+            if from_ == '#e':
+                pos += self.length
+            elif from_ and from_ != '#s':
+                if from_ not in index_by_name:
+                    raise ValueError(
+                        f'Element `{from_}` used in `from` is not in '
+                        f'sequence `{self.name}`')
+                jj = index_by_name[from_]
+                if jj in visiting:
+                    raise ValueError(
+                        f'Circular `from` references in sequence '
+                        f'`{self.name}`')
+                pos += _position(jj, visiting + (ii,))
+            positions[ii] = pos
+            return pos
+
+        return [_position(ii) for ii in range(len(self.placements))]
+
+    def _flatten(self, s_start):
+        '''
+        Return (element, s_entry, length) for the elements of the sequence
+        (including the start and end markers and the elements of the
+        sequences placed in it), with the sequence starting at `s_start`.
+        '''
+        refer_factor = {'entry': 0., 'centre': 0.5, 'center': 0.5,
+                        'exit': 1.}[self.refer]
+        marker_type = self._madx.base_types['marker']
+
+        out = [(MadxElement(f'{self.name}$start', marker_type,
+                            self._madx._default_cmdpar('marker')), s_start, 0.)]
+        for (elem, _, _), pos in zip(self.placements, self._positions()):
+            length = self._element_length(elem)
+            if isinstance(elem, MadxSequence):
+                if elem.refpos:
+                    sub_positions = dict(zip(
+                        [ee.name for ee, _, _ in elem.placements],
+                        elem._positions()))
+                    offset = sub_positions[elem.refpos]
+                else:
+                    offset = refer_factor * length
+                out += elem._flatten(s_start + pos - offset)
+            else:
+                out.append((elem, s_start + pos - refer_factor * length,
+                            length))
+        out.append((MadxElement(f'{self.name}$end', marker_type,
+                                self._madx._default_cmdpar('marker')),
+                    s_start + self.length, 0.))
+        return out
+
+    def _expand(self):
+
+        tol = 1e-6
+        drift_type = self._madx.base_types['drift']
+
+        out = []
+        s_prev = 0.
+        for elem, s_entry, length in self._flatten(0.):
+            gap = s_entry - s_prev
+            if gap < -tol:
+                raise ValueError(
+                    f'Negative drift of {gap} m in sequence `{self.name}` '
+                    f'before element `{elem.name}`')
+            if gap > tol:
+                out.append(self._madx._new_drift(drift_type, gap))
+            out.append(elem)
+            s_prev = s_entry + length
+        return out
+
+    def __repr__(self):
+        return f'<MadxSequence {self.name}>'
+
+
+class _Namespace(dict):
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class MadxGlobals:
+    '''
+    Global variables, as cpymad's `Madx.globals`.
+    '''
+
+    def __init__(self, parser):
+        self._parser = parser
+        self.cmdpar = {}
+
+    def __getitem__(self, name):
+        return self._parser._values[name.lower()]
+
+    def __setitem__(self, name, value):
+        self._parser._set_global(name.lower(), value)
+
+    def __contains__(self, name):
+        return name.lower() in self.cmdpar
+
+    def __len__(self):
+        return len(self.cmdpar)
+
+    def __iter__(self):
+        return iter(self.cmdpar)
+
+    def keys(self):
+        return self.cmdpar.keys()
+
+    def items(self):
+        return ((kk, self[kk]) for kk in self.cmdpar)
+
+
+class _Values:
+    '''
+    Values of the global variables, evaluating the deferred expressions
+    (cached until the next assignment).
+    '''
+
+    def __init__(self, parser):
+        self._parser = parser
+        self._cache = {}
+        self._evaluating = set()
+        self._warned = set()
+
+    def clear(self):
+        self._cache.clear()
+
+    def __getitem__(self, name):
+        try:
+            return self._cache[name]
+        except KeyError:
+            pass
+
+        par = self._parser.globals.cmdpar.get(name)
+        if par is None:
+            if name not in self._warned:
+                self._warned.add(name)
+                LOGGER.debug(f'Undefined variable `{name}` set to 0.')
+            return 0.
+        if par.expr is None:
+            return par._value
+
+        if name in self._evaluating:
+            raise ValueError(f'Circular definition of variable `{name}`')
+        self._evaluating.add(name)
+        try:
+            value = self._parser.eval(par.expr)
+        finally:
+            self._evaluating.discard(name)
+        self._cache[name] = value
+        return value
+
+
+class MadxParser:
+    '''
+    Native parser for MAD-X lattice and strength files.
+
+    Parameters
+    ----------
+    filenames : str or list of str, optional
+        Files to be parsed (in the given order).
+
+    Attributes
+    ----------
+    globals : MadxGlobals
+        Global variables, with their values and deferred expressions in
+        `globals.cmdpar`.
+    elements : dict
+        Elements defined in the parsed files.
+    sequence : dict
+        Sequences defined in the parsed files (also accessible as
+        attributes), to be passed to `Line.from_madx_sequence`.
+    beam : MadxBeam
+        Default beam (beams attached to a sequence are in `beams`).
+    options : dict
+        Options (only `rbarc` is used).
+    '''
+
+    def __init__(self, filenames=None):
+
+        self.globals = MadxGlobals(self)
+        self._values = _Values(self)
+        self.base_types = {}
+        for name, attrs in MADX_BASE_TYPES.items():
+            self.base_types[name] = MadxElement(
+                                name, None, self._default_cmdpar(name, attrs))
+        self.elements = {}
+        self.sequence = _Namespace()
+        self.beams = {}
+        self.beam = MadxBeam(self)
+        self.options = _Namespace(rbarc=True)
+        self._functions = dict(_math_functions())
+        self._current_sequence = None
+        self._n_drifts = 0
+        self._warned_commands = set()
+
+        for name, value in MADX_CONSTANTS.items():
+            self.globals.cmdpar[name] = MadxParameter(name, value, None, self)
+
+        if filenames is not None:
+            if isinstance(filenames, (str, Path)):
+                filenames = [filenames]
+            for ff in filenames:
+                self.call(ff)
+
+    # Evaluation
+
+    def eval(self, expr):
+        '''
+        Evaluate a MAD-X expression with the current values of the variables.
+        As in MAD-X, a division by zero evaluates to zero.
+        '''
+        if isinstance(expr, (int, float)):
+            return expr
+        try:
+            return float(expr)
+        except ValueError:
+            pass
+        try:
+            return eval(compile_madx_expression(expr.lower()),
+                        {'__builtins__': {}},
+                        {'_v': self._values, '_f': self._functions,
+                         '_e': self._element_attribute})
+        except ZeroDivisionError:
+            LOGGER.debug(f'Division by zero in `{expr}`, set to zero.')
+            return 0.
+
+    def _element_attribute(self, name, attr):
+        elem = self.elements.get(name) or self.base_types.get(name)
+        if elem is None:
+            raise ValueError(f'Unknown element `{name}`')
+        return getattr(elem, attr)
+
+    def _set_global(self, name, value, expr=None):
+        self.globals.cmdpar[name] = MadxParameter(name, value, expr, self)
+        self._values.clear()
+        for seq in self.sequence.values():
+            seq._expanded = None
+
+    # Input
+
+    def call(self, filename):
+        '''
+        Parse a MAD-X file. Relative paths of files called from it are
+        resolved with respect to the current working directory, falling back
+        to the directory of the calling file.
+        '''
+        filename = Path(filename)
+        with open(filename, 'r') as fid:
+            text = fid.read()
+        self._input(text, base_dir=filename.parent)
+
+    def input(self, text):
+        '''
+        Parse MAD-X statements from a string.
+        '''
+        self._input(text, base_dir=Path('.'))
+
+    def _input(self, text, base_dir):
+        return self._run(_split_statements(_strip_comments(text)), base_dir)
+
+    def _run(self, statements, base_dir):
+        # Whether a branch of the current if/elseif/else chain was taken
+        branch_taken = None
+        for statement in statements:
+            try:
+                block = _parse_conditional(statement)
+                if block is not None:
+                    keyword, condition, body = block
+                    if keyword == 'if':
+                        branch_taken = False
+                    elif branch_taken is None:
+                        raise ValueError(f'`{keyword}` without `if`')
+                    if branch_taken or (condition is not None
+                            and not self._eval_condition(condition)):
+                        continue
+                    branch_taken = True
+                    stop = self._run(_split_statements(body), base_dir)
+                else:
+                    branch_taken = None
+                    stop = self._execute(statement, base_dir)
+            except NotImplementedError:
+                raise
+            except Exception as err:
+                raise ValueError(
+                    f'Error in MAD-X statement `{statement}`: {err}') from err
+            if stop in ('return', 'exit'):
+                return stop
+        return None
+
+    def _eval_condition(self, condition):
+        condition = _lower_outside_strings(condition)
+        if '||' in condition:
+            return any(self._eval_condition(cc)
+                       for cc in condition.split('||'))
+        if '&&' in condition:
+            return all(self._eval_condition(cc)
+                       for cc in condition.split('&&'))
+        mm = re.match(r'^(.*?)(>=|<=|==|<>|!=|>|<)(.*)$', condition)
+        if mm is None:
+            return bool(self.eval(condition.strip()))
+        lhs, op, rhs = mm.groups()
+        lhs, rhs = self.eval(lhs.strip()), self.eval(rhs.strip())
+        return {'>=': lhs >= rhs, '<=': lhs <= rhs, '==': lhs == rhs,
+                '<>': lhs != rhs, '!=': lhs != rhs, '>': lhs > rhs,
+                '<': lhs < rhs}[op]
+
+    def _execute(self, statement, base_dir):
+
+        statement = _lower_outside_strings(statement)
+        head = re.match(r'^(' + _NAME + r')', statement)
+        if head is not None and head.group(1) in _UNSUPPORTED_COMMANDS:
+            raise NotImplementedError(
+                f'MAD-X command `{head.group(1)}` is not supported by the '
+                f'native parser')
+        if _RE_MACRO_DEFINITION.match(statement):
+            raise NotImplementedError(
+                'MAD-X macros are not supported by the native parser')
+        if _RE_LINE_DEFINITION.match(statement):
+            raise NotImplementedError(
+                'MAD-X beam lines are not supported by the native parser')
+
+        mm = _RE_ELEM_ATTR_ASSIGN.match(statement)
+        if mm is not None:
+            elem_name, attr, op, rhs = mm.groups()
+            elem = self.elements.get(elem_name)
+            if elem is None:
+                raise ValueError(f'Unknown element `{elem_name}`')
+            self._set_attribute(elem, attr, rhs.strip(), deferred=(op == ':='))
+            return None
+
+        mm = _RE_ASSIGN.match(statement)
+        if mm is not None:
+            name, op, rhs = mm.groups()
+            rhs = rhs.strip()
+            if op == ':=' and not _RE_NUMBER.match(rhs):
+                self._set_global(name, 0., rhs)
+            else:
+                self._set_global(name, float(self.eval(rhs)))
+            return None
+
+        mm = _RE_LABELLED.match(statement)
+        if mm is not None:
+            label, class_name, args = mm.groups()
+            self._define(label, class_name, _split_args(args))
+            return None
+
+        mm = _RE_COMMAND.match(statement)
+        if mm is not None:
+            name, args = mm.groups()
+            return self._command(name, _split_args(args), base_dir)
+
+        raise ValueError('Cannot parse statement')
+
+    def _command(self, name, args, base_dir):
+
+        if name == 'call':
+            filename = _unquote(dict(args)['file'])
+            path = Path(filename)
+            if not path.is_absolute() and not path.exists():
+                path = base_dir / filename
+            with open(path, 'r') as fid:
+                text = fid.read()
+            if self._input(text, base_dir=path.parent) == 'exit':
+                return 'exit'
+            return None
+        if name == 'return':
+            return 'return'
+        if name in ('exit', 'stop', 'quit'):
+            return 'exit'
+        if name == 'endsequence':
+            if self._current_sequence is None:
+                raise ValueError('`endsequence` outside of a sequence')
+            self._current_sequence = None
+            return None
+        if name == 'option':
+            for kk, vv in args:
+                if kk.startswith('-'):
+                    self.options[kk[1:]] = False
+                elif vv is None:
+                    self.options[kk] = True
+                else:
+                    self.options[kk] = vv[1].strip() not in ('false', '0')
+            return None
+        if name == 'beam':
+            self._beam(args)
+            return None
+
+        if self._current_sequence is not None:
+            # Placement of an existing element or sequence
+            if name in self.elements:
+                self._place(self.elements[name], args)
+            elif name in self.sequence:
+                self._place(self.sequence[name], args)
+            else:
+                raise ValueError(f'Unknown element `{name}`')
+            return None
+
+        if name in self.elements:
+            # Change of attributes of an existing element
+            elem = self.elements[name]
+            for kk, vv in args:
+                if vv is not None:
+                    self._set_attribute(elem, kk, vv[1], deferred=vv[0])
+            return None
+
+        if name not in self._warned_commands and name not in _IGNORED_COMMANDS:
+            LOGGER.warning(f'MAD-X command `{name}` ignored.')
+        self._warned_commands.add(name)
+        return None
+
+    def _beam(self, args):
+        kwargs = {}
+        for kk, vv in args:
+            if vv is None:
+                kwargs[kk] = True
+            elif kk in _STRING_ATTRIBUTES:
+                kwargs[kk] = _unquote(vv[1])
+            else:
+                kwargs[kk] = float(self.eval(vv[1]))
+        sequence = kwargs.pop('sequence', None)
+        beam = MadxBeam(self, **kwargs)
+        if sequence is None:
+            self.beam = beam
+        else:
+            self.beams[sequence] = beam
+
+    def _define(self, label, class_name, args):
+
+        if class_name == 'sequence':
+            if self._current_sequence is not None:
+                raise ValueError('Sequence definitions cannot be nested')
+            seq = MadxSequence(label, self, length=MadxParameter('l', 0.))
+            for kk, vv in args:
+                if kk == 'l':
+                    seq._length = self._make_parameter('l', 0., vv[1], vv[0])
+                elif kk == 'refer':
+                    seq.refer = _unquote(vv[1])
+                elif kk == 'refpos':
+                    seq.refpos = _unquote(vv[1])
+            self.sequence[label] = seq
+            self._current_sequence = seq
+            return
+
+        if class_name in self.sequence:
+            raise NotImplementedError(
+                'Sequences can be placed in another sequence only by name')
+
+        if self._current_sequence is not None and label in self.elements:
+            # MAD-X ignores implicit re-definitions in sequences
+            LOGGER.debug(f'Implicit re-definition of `{label}` ignored.')
+            self._place(self.elements[label], args)
+            return
+
+        if class_name in self.elements:
+            parent = self.elements[class_name]
+        elif class_name in self.base_types:
+            parent = self.base_types[class_name]
+        else:
+            raise ValueError(f'Unknown element class `{class_name}`')
+
+        elem = MadxElement(label, parent,
+                           {kk: pp.copy() for kk, pp in parent.cmdpar.items()})
+        self.elements[label] = elem
+        for kk, vv in args:
+            if kk in ('at', 'from') and self._current_sequence is not None:
+                continue
+            if vv is None:
+                self._set_flag(elem, kk)
+            else:
+                self._set_attribute(elem, kk, vv[1], deferred=vv[0])
+
+        if self._current_sequence is not None:
+            self._place(elem, args)
+
+    def _place(self, elem, args):
+        seq = self._current_sequence
+        at = MadxParameter('at', 0.)
+        from_ = None
+        for kk, vv in args:
+            if kk == 'at':
+                at = self._make_parameter('at', 0., vv[1], vv[0])
+            elif kk == 'from':
+                from_ = _unquote(vv[1])
+        if isinstance(elem, MadxElement):
+            elem.cmdpar['at'] = at.copy()
+            elem.cmdpar['at'].inform = True
+        seq.placements.append((elem, at, from_))
+        seq._expanded = None
+
+    def _set_flag(self, elem, name):
+        if name.startswith('-'):
+            self._set_attribute(elem, name[1:], 'false', False)
+        else:
+            self._set_attribute(elem, name, 'true', False)
+
+    def _set_attribute(self, elem, name, rhs, deferred):
+        default = elem.cmdpar[name]._value if name in elem.cmdpar else None
+        if default is None and rhs.startswith('{'):
+            default = [0.]
+        elem.cmdpar[name] = self._make_parameter(name, default, rhs, deferred)
+
+    def _make_parameter(self, name, default, rhs, deferred):
+        rhs = rhs.strip()
+
+        if isinstance(default, list) or rhs.startswith('{'):
+            items = [ii.strip() for ii in _split_top_level(
+                                        rhs.strip()[1:-1]
+                                        if rhs.startswith('{') else rhs)]
+            items = [ii for ii in items if ii]
+            values, exprs = [], []
+            for item in items:
+                if deferred and not _RE_NUMBER.match(item):
+                    values.append(0.)
+                    exprs.append(item)
+                else:
+                    values.append(float(self.eval(item)))
+                    exprs.append(None)
+            if not values:
+                values, exprs = [0.], [None]
+            return MadxParameter(name, values, exprs, self)
+
+        if (isinstance(default, str) or name in _STRING_ATTRIBUTES
+                or rhs.startswith('"') or rhs.startswith("'")):
+            return MadxParameter(name, _unquote(rhs), None, self)
+
+        if isinstance(default, bool) or rhs in ('true', 'false'):
+            value = rhs == 'true' or (
+                rhs != 'false' and bool(self.eval(rhs)))
+            return MadxParameter(name, value, None, self)
+
+        if deferred and not _RE_NUMBER.match(rhs):
+            if isinstance(default, int):
+                return MadxParameter(name, default, rhs, self)
+            return MadxParameter(name, 0., rhs, self)
+
+        value = self.eval(rhs)
+        if isinstance(default, int):
+            value = int(value)
+        else:
+            value = float(value)
+        return MadxParameter(name, value, None, self)
+
+    def _default_cmdpar(self, type_name, attrs=None):
+        if attrs is None:
+            attrs = MADX_BASE_TYPES[type_name]
+        return {kk: MadxParameter(kk, (list(vv) if isinstance(vv, list)
+                                       else vv),
+                                  [None] * len(vv) if isinstance(vv, list)
+                                  else None,
+                                  self, inform=False)
+                for kk, vv in attrs.items()}
+
+    def _new_drift(self, drift_type, length):
+        cmdpar = self._default_cmdpar('drift')
+        cmdpar['l'] = MadxParameter('l', length, None, self)
+        drift = MadxElement(f'drift_{self._n_drifts}', drift_type, cmdpar)
+        self._n_drifts += 1
+        return drift
+
+
+def _math_functions():
+    from .line import Functions
+    return Functions._mathfunctions.items()
+
+
+_RE_COMMENT = re.compile(r'("[^"]*"|\'[^\']*\')|(?:!|//)[^\n]*|/\*.*?\*/',
+                         re.S)
+_RE_STATEMENT_TOKEN = re.compile(r'"[^"]*"|\'[^\']*\'|[;{}]')
+_RE_MACRO_DEFINITION = re.compile(r'^[\w.]+\s*(\(.*\))?\s*:\s*macro\b')
+_RE_BLOCK_STATEMENT = re.compile(
+    r'^(if|elseif|else|while)\b|^[\w.]+\s*(\(.*\))?\s*:\s*macro\b', re.I)
+
+
+def _strip_comments(text):
+    return _RE_COMMENT.sub(lambda mm: mm.group(1) or '', text)
+
+
+def _split_statements(text):
+    '''
+    Split the text at the semicolons, keeping the blocks in braces of
+    control statements (macros, conditionals, loops) together.
+    '''
+    statements = []
+    start = 0
+    depth = 0
+    for mm in _RE_STATEMENT_TOKEN.finditer(text):
+        cc = mm.group()
+        if cc == '{':
+            depth += 1
+        elif cc == '}':
+            depth -= 1
+            if depth == 0:
+                statement = text[start:mm.end()].strip()
+                if _RE_BLOCK_STATEMENT.match(statement):
+                    statements.append(statement)
+                    start = mm.end()
+        elif cc == ';' and depth == 0:
+            statements.append(text[start:mm.start()].strip())
+            start = mm.end()
+    statements.append(text[start:].strip())
+    return [' '.join(ss.split()) if '"' not in ss and "'" not in ss else ss
+            for ss in statements if ss]
+
+
+def _parse_conditional(statement):
+    '''
+    Return (keyword, condition, body) for if/elseif/else blocks, None for
+    other statements.
+    '''
+    mm = re.match(r'^(if|elseif|else)\b', statement, re.I)
+    if mm is None:
+        return None
+    keyword = mm.group(1).lower()
+    i_open = statement.find('{')
+    if i_open < 0 or not statement.endswith('}'):
+        raise ValueError(f'Cannot parse `{keyword}` block')
+    condition = statement[len(keyword):i_open].strip()
+    if keyword == 'else':
+        condition = None
+    else:
+        if not (condition.startswith('(') and condition.endswith(')')):
+            raise ValueError(f'Cannot parse `{keyword}` condition')
+        condition = condition[1:-1]
+    return keyword, condition, statement[i_open + 1:-1]
+
+
+def _lower_outside_strings(text):
+    parts = re.split(r'("[^"]*"|\'[^\']*\')', text)
+    return ''.join(pp if pp[:1] in ('"', "'") else pp.lower() for pp in parts)
+
+
+def _split_top_level(text):
+    '''Split at the commas not enclosed in braces, parentheses or quotes.'''
+    out = []
+    current = []
+    depth = 0
+    quote = None
+    for cc in text:
+        if quote is not None:
+            current.append(cc)
+            if cc == quote:
+                quote = None
+            continue
+        if cc in ('"', "'"):
+            quote = cc
+        elif cc in '({':
+            depth += 1
+        elif cc in ')}':
+            depth -= 1
+        if cc == ',' and depth == 0:
+            out.append(''.join(current))
+            current = []
+        else:
+            current.append(cc)
+    out.append(''.join(current))
+    return out
+
+
+def _split_args(args):
+    '''
+    Parse the arguments of a command into a list of (name, value) where value
+    is (deferred, rhs) or None for flags.
+    '''
+    if args is None:
+        return []
+    out = []
+    for item in _split_top_level(args):
+        item = item.strip()
+        if not item:
+            continue
+        mm = re.match(r'^(-?' + _NAME + r')\s*(:?=)\s*(.*)$', item, re.S)
+        if mm is None:
+            out.append((item, None))
+        else:
+            name, op, rhs = mm.groups()
+            out.append((name, (op == ':=', rhs.strip())))
+    return out
+
+
+def _unquote(text):
+    text = text.strip()
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in ('"', "'"):
+        return text[1:-1]
+    return text
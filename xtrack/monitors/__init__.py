@@ -1,6 +1,8 @@
 
 from .particles_monitor import *
+from .memmap_particles_monitor import *
 from .last_turns_monitor import *
 from .beam_position_monitor import *
 from .beam_size_monitor import *
 from .beam_profile_monitor import *
+from .tune_monitor import *
@@ -0,0 +1,206 @@
+# copyright ############################### #
+# This file is part of the Xtrack Package.  #
+# Copyright (c) CERN, 2023.                 #
+# ######################################### #
+
+import json
+from pathlib import Path
+
+import numpy as np
+
+import xtrack as xt
+
+DEFAULT_MEMMAP_MONITOR_QUANTITIES = (
+    'x', 'px', 'y', 'py', 'zeta', 'delta', 's', 'at_turn', 'particle_id',
+    'state')
+
+_METADATA_FILE = 'monitor.json'
+
+
+class MemmapParticlesMonitor:
+
+    def __init__(self, path, start_at_turn=None, stop_at_turn=None,
+                 num_particles=None, particle_id_range=None,
+                 turns_per_block=100, quantities=None, _mode='w+'):
+
+        '''
+        Turn-by-turn monitor storing the data in memory-mapped files on disk.
+
+        The data is recorded in the context buffer in blocks of
+        `turns_per_block` turns, which are written to disk between the calls to
+        the track kernel, so that the memory footprint does not depend on the
+        number of recorded turns. The monitor is passed to `line.track` through
+        the `turn_by_turn_monitor` argument.
+
+        Parameters
+        ----------
+        path: str or Path
+            Directory in which the data is stored (one `.npy` file per
+            quantity, which can be read back lazily with `numpy.load` using
+            `mmap_mode`).
+        start_at_turn: int
+            Turn at which the monitor starts logging the particles coordinates.
+        stop_at_turn: int
+            Turn at which the monitor stops logging the particles coordinates.
+        num_particles: int
+            Number of particles to be logged.
+        particle_id_range: tuple of int
+            Range of particle ids to be logged.
+        turns_per_block: int
+            Number of turns kept in memory before writing them to disk.
+        quantities: list of str
+            Quantities to be stored on disk (default: x, px, y, py, zeta, delta,
+            s, at_turn, particle_id, state).
+
+        Examples
+        --------
+
+        .. code-block:: python
+
+            mon = xt.MemmapParticlesMonitor('tbt_data', start_at_turn=0,
+                        stop_at_turn=100000, num_particles=10000,
+                        turns_per_block=1000)
+            line.track(particles, num_turns=100000, turn_by_turn_monitor=mon)
+            mon.x[12, 5000:6000] # read only this part from disk
+
+            # The data can be opened again later with
+            mon = xt.MemmapParticlesMonitor.from_path('tbt_data')
+
+        '''
+
+        self.path = Path(path)
+
+        if _mode == 'r':
+            with open(self.path / _METADATA_FILE, 'r') as fid:
+                meta = json.load(fid)
+            start_at_turn = meta['start_at_turn']
+            stop_at_turn = meta['stop_at_turn']
+            particle_id_range = meta['particle_id_range']
+            turns_per_block = meta['turns_per_block']
+            quantities = meta['quantities']
+        else:
+            if particle_id_range is not None:
+                assert num_particles is None
+            else:
+                assert num_particles is not None
+                particle_id_range = (0, num_particles)
+
+        assert start_at_turn is not None and stop_at_turn is not None
+        assert stop_at_turn >= start_at_turn
+        assert turns_per_block > 0
+
+        self.start_at_turn = int(start_at_turn)
+        self.stop_at_turn = int(stop_at_turn)
+        self.part_id_start = int(particle_id_range[0])
+        self.part_id_end = int(particle_id_range[1])
+        self.turns_per_block = int(turns_per_block)
+        self.quantities = tuple(quantities or DEFAULT_MEMMAP_MONITOR_QUANTITIES)
+
+        n_turns = self.stop_at_turn - self.start_at_turn
+        n_part_ids = self.part_id_end - self.part_id_start
+        assert n_part_ids >= 0
+
+        self._data = {}
+        if _mode == 'r':
+            for nn in self.quantities:
+                self._data[nn] = np.load(self.path / f'{nn}.npy', mmap_mode='r')
+        else:
+            self.path.mkdir(parents=True, exist_ok=True)
+            for nn in self.quantities:
+                dtype = _dtype_of_particles_quantity(nn)
+                self._data[nn] = np.lib.format.open_memmap(
+                    self.path / f'{nn}.npy', mode='w+', dtype=dtype,
+                    shape=(n_part_ids, n_turns))
+            with open(self.path / _METADATA_FILE, 'w') as fid:
+                json.dump({
+                    'start_at_turn': self.start_at_turn,
+                    'stop_at_turn': self.stop_at_turn,
+                    'particle_id_range': [self.part_id_start, self.part_id_end],
+                    'turns_per_block': self.turns_per_block,
+                    'quantities': list(self.quantities),
+                }, fid)
+
+        self._block_monitor = None
+        self._block_start = None
+
+    @classmethod
+    def from_path(cls, path):
+        '''
+        Open (read-only) the data stored by a monitor in the given directory.
+        '''
+        return cls(path=path, _mode='r')
+
+    def __getattr__(self, name):
+        data = self.__dict__.get('_data', {})
+        if name in data:
+            return data[name]
+        raise AttributeError(
+            f"'{type(self).__name__}' object has no attribute '{name}'")
+
+    def __getitem__(self, name):
+        return self._data[name]
+
+    def _get_block_monitor(self, monitor_class, context):
+        if self._block_monitor is None:
+            self._block_monitor = monitor_class(
+                _context=context,
+                start_at_turn=self.start_at_turn,
+                stop_at_turn=self.start_at_turn + self.turns_per_block,
+                particle_id_range=(self.part_id_start, self.part_id_end))
+            self._block_start = self.start_at_turn
+        return self._block_monitor
+
+    def _prepare_block(self, turn, num_turns):
+        '''
+        Select the block containing `turn` and return the number of turns (at
+        most `num_turns`) that can be tracked before reaching the next block.
+        '''
+        if turn < self.start_at_turn:
+            # Nothing to record before the start of the monitor
+            return min(num_turns, self.start_at_turn - turn)
+        if turn >= self.stop_at_turn:
+            return num_turns
+
+        block_start = (self.start_at_turn
+            + (turn - self.start_at_turn) // self.turns_per_block
+            * self.turns_per_block)
+        if block_start != self._block_start:
+            self.flush()
+            self._block_start = block_start
+            mon = self._block_monitor
+            mon.start_at_turn = block_start
+            mon.stop_at_turn = block_start + self.turns_per_block
+            with mon.data._bypass_linked_vars():
+                for tt, nn in mon._ParticlesClass.per_particle_vars:
+                    getattr(mon.data, nn)[:] = 0
+
+        return min(num_turns, block_start + self.turns_per_block - turn)
+
+    def flush(self):
+        '''
+        Write the data of the block presently in memory to disk.
+        '''
+        mon = self._block_monitor
+        if mon is None or self._block_start is None:
+            return
+
+        i_start = self._block_start - self.start_at_turn
+        i_stop = min(i_start + self.turns_per_block,
+                     self.stop_at_turn - self.start_at_turn)
+        n_turns_block = i_stop - i_start
+
+        for nn in self.quantities:
+            vv = getattr(mon, nn)
+            if not isinstance(vv, np.ndarray):
+                vv = mon._buffer.context.nparray_from_context_array(vv)
+            self._data[nn][:, i_start:i_stop] = vv[:, :n_turns_block]
+            self._data[nn].flush()
+
+
+def _dtype_of_particles_quantity(name):
+    if name == 'pzeta':
+        return np.float64
+    for tt, nn in xt.ParticlesMonitor._ParticlesClass.per_particle_vars:
+        if nn == name:
+            return tt._dtype
+    raise ValueError(f'Unknown quantity `{name}`')
@@ -17,13 +17,22 @@ void ParticlesMonitor_track_local_particle(ParticlesMonitorData el,
     int64_t const ebe_mode = ParticlesMonitorData_get_ebe_mode(el);
     int64_t const n_repetitions = ParticlesMonitorData_get_n_repetitions(el);
     int64_t const repetition_period = ParticlesMonitorData_get_repetition_period(el);
+    int64_t const n_ebe_record_index = ParticlesMonitorData_len_ebe_record_index(el);
     ParticlesData data = ParticlesMonitorData_getp_data(el);
 
     int64_t n_turns_record = stop_at_turn - start_at_turn;
 
     //start_per_particle_block (part0->part)
     int64_t at_turn;
-    if (ebe_mode){
+    if (ebe_mode == 2){
+        // Sparse element-by-element mode: record only at selected elements
+        int64_t const at_element = LocalParticle_get_at_element(part);
+        at_turn = -1; // not recorded
+        if (at_element >= 0 && at_element < n_ebe_record_index){
+            at_turn = ParticlesMonitorData_get_ebe_record_index(el, at_element);
+        }
+    }
+    else if (ebe_mode){
         at_turn = LocalParticle_get_at_element(part);
     }
     else{
@@ -3,6 +3,8 @@
 # Copyright (c) CERN, 2021.                 #
 # ######################################### #
 
+import numpy as np
+
 import xobjects as xo
 import xtrack as xt
 
@@ -24,6 +26,7 @@ def _monitor_init(
     repetition_period=None,
     num_particles=None,
     particle_id_range=None,
+    ebe_record_at=None,
     auto_to_numpy=True,
 ):
 
@@ -44,6 +47,12 @@ def _monitor_init(
         Number of particles to be logged.
     particle_id_range: tuple of int
         Range of particle ids to be logged.
+    ebe_record_at: array of int
+        If provided, the monitor works in element-by-element mode and logs
+        the particles coordinates only at the entrance of the elements with
+        the given indices (the index equal to the number of elements
+        corresponds to the end of the line). `start_at_turn` and
+        `stop_at_turn` must not be provided.
     auto_to_numpy: bool
         If True, the data is automatically converted to numpy arrays when
         accessed.
@@ -65,6 +74,21 @@ def _monitor_init(
         n_part_ids = part_id_end - part_id_start
         assert n_part_ids >= 0
 
+        if ebe_record_at is not None:
+            assert start_at_turn is None and stop_at_turn is None
+            ebe_record_at = np.array(ebe_record_at, dtype=np.int64)
+            assert np.all(np.diff(ebe_record_at) > 0), (
+                'ebe_record_at must be sorted and unique')
+            start_at_turn = 0
+            stop_at_turn = len(ebe_record_at)
+            n_index = (ebe_record_at[-1] + 1) if len(ebe_record_at) else 0
+            ebe_record_index = -np.ones(n_index, dtype=np.int64)
+            ebe_record_index[ebe_record_at] = np.arange(len(ebe_record_at))
+            ebe_mode = 2
+        else:
+            ebe_record_index = []
+            ebe_mode = 0
+
         n_turns = int(stop_at_turn) - int(start_at_turn)
 
         if repetition_period is not None:
@@ -93,6 +117,8 @@ def _monitor_init(
             n_records=n_records,
             n_repetitions=n_repetitions,
             repetition_period=repetition_period,
+            ebe_mode=ebe_mode,
+            ebe_record_index=ebe_record_index,
             data=data_init,
         )
 
@@ -155,6 +181,7 @@ class ParticlesMonitor(BeamElement):
         "n_repetitions": xo.Int64,
         "repetition_period": xo.Int64,
         "flag_auto_to_numpy": xo.Int64,
+        "ebe_record_index": xo.Int64[:],
         "data": xp.Particles,
     }
 
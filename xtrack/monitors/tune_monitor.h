@@ -0,0 +1,143 @@
+// ##################################
+// Tune Monitor
+// ##################################
+
+
+#ifndef XTRACK_TUNE_MONITOR_H
+#define XTRACK_TUNE_MONITOR_H
+
+#if !defined( PI )
+    #define   PI (3.1415926535897932384626433832795028841971693993751)
+#endif /* !defined( PI ) */
+
+/*gpufun*/
+double TuneMonitor_window_weight(int64_t k, int64_t n){
+    // Smooth bump function vanishing with all its derivatives at the window
+    // edges, used for the weighted (Birkhoff) average of the phase advances
+    if (k <= 0 || k >= n){
+        return 0.;
+    }
+    double const t = ((double) k) / ((double) n);
+    return exp(-1. / (t * (1. - t)));
+}
+
+/*gpufun*/
+void TuneMonitor_accumulate(TuneMonitorRecord record, int64_t index,
+                            double weight, double dphi_x, double dphi_y,
+                            double jx, double jy){
+    TuneMonitorRecord_set_weight_sum(record, index,
+        TuneMonitorRecord_get_weight_sum(record, index) + weight);
+    TuneMonitorRecord_set_phase_x_sum(record, index,
+        TuneMonitorRecord_get_phase_x_sum(record, index) + weight * dphi_x);
+    TuneMonitorRecord_set_phase_y_sum(record, index,
+        TuneMonitorRecord_get_phase_y_sum(record, index) + weight * dphi_y);
+    TuneMonitorRecord_set_jx_sum(record, index,
+        TuneMonitorRecord_get_jx_sum(record, index) + weight * jx);
+    TuneMonitorRecord_set_jy_sum(record, index,
+        TuneMonitorRecord_get_jy_sum(record, index) + weight * jy);
+}
+
+/*gpufun*/
+void TuneMonitor_track_local_particle(TuneMonitorData el, LocalParticle* part0){
+
+    // get parameters
+    int64_t const start_at_turn = TuneMonitorData_get_start_at_turn(el);
+    int64_t const stop_at_turn = TuneMonitorData_get_stop_at_turn(el);
+    int64_t const particle_id_start = TuneMonitorData_get_particle_id_start(el);
+    int64_t const num_particles = TuneMonitorData_get_num_particles(el);
+
+    double const betx = TuneMonitorData_get_betx(el);
+    double const bety = TuneMonitorData_get_bety(el);
+    double const alfx = TuneMonitorData_get_alfx(el);
+    double const alfy = TuneMonitorData_get_alfy(el);
+    double const x_co = TuneMonitorData_get_x_co(el);
+    double const px_co = TuneMonitorData_get_px_co(el);
+    double const y_co = TuneMonitorData_get_y_co(el);
+    double const py_co = TuneMonitorData_get_py_co(el);
+    double const dx = TuneMonitorData_get_dx(el);
+    double const dpx = TuneMonitorData_get_dpx(el);
+    double const dy = TuneMonitorData_get_dy(el);
+    double const dpy = TuneMonitorData_get_dpy(el);
+
+    double const sqrt_betx = sqrt(betx);
+    double const sqrt_bety = sqrt(bety);
+
+    // Full window and its two halves
+    int64_t const n_turns = stop_at_turn - start_at_turn;
+    int64_t const n_half_1 = n_turns / 2;
+    int64_t const n_half_2 = n_turns - n_half_1;
+
+    TuneMonitorRecord record = TuneMonitorData_getp_data(el);
+
+    //start_per_particle_block(part0->part)
+
+        int64_t const particle_id = LocalParticle_get_particle_id(part);
+        int64_t const at_turn = LocalParticle_get_at_turn(part);
+        int64_t const slot = particle_id - particle_id_start;
+
+        if (slot >= 0 && slot < num_particles
+                && at_turn >= start_at_turn && at_turn < stop_at_turn){
+
+            double const delta = LocalParticle_get_delta(part);
+
+            // Normalized coordinates (uncoupled Courant-Snyder)
+            double const x = LocalParticle_get_x(part) - x_co - dx * delta;
+            double const px = LocalParticle_get_px(part) - px_co - dpx * delta;
+            double const y = LocalParticle_get_y(part) - y_co - dy * delta;
+            double const py = LocalParticle_get_py(part) - py_co - dpy * delta;
+
+            double const x_norm = x / sqrt_betx;
+            double const px_norm = (alfx * x + betx * px) / sqrt_betx;
+            double const y_norm = y / sqrt_bety;
+            double const py_norm = (alfy * y + bety * py) / sqrt_bety;
+
+            double const phase_x = atan2(-px_norm, x_norm);
+            double const phase_y = atan2(-py_norm, y_norm);
+            double const jx = 0.5 * (x_norm * x_norm + px_norm * px_norm);
+            double const jy = 0.5 * (y_norm * y_norm + py_norm * py_norm);
+
+            int64_t const last_turn = TuneMonitorRecord_get_last_turn(record, slot);
+
+            if (at_turn > start_at_turn && last_turn == at_turn - 1){
+
+                // Phase advance over the last turn, taken within pi of the
+                // one of the previous turn (so that it does not jump between
+                // 0 and 2 pi for tunes close to an integer)
+                double dphi_x = phase_x - TuneMonitorRecord_get_last_phase_x(record, slot);
+                double dphi_y = phase_y - TuneMonitorRecord_get_last_phase_y(record, slot);
+                double const last_dphi_x = TuneMonitorRecord_get_last_dphi_x(record, slot);
+                double const last_dphi_y = TuneMonitorRecord_get_last_dphi_y(record, slot);
+                dphi_x -= 2 * PI * floor((dphi_x - last_dphi_x + PI) / (2 * PI));
+                dphi_y -= 2 * PI * floor((dphi_y - last_dphi_y + PI) / (2 * PI));
+                TuneMonitorRecord_set_last_dphi_x(record, slot, dphi_x);
+                TuneMonitorRecord_set_last_dphi_y(record, slot, dphi_y);
+
+                int64_t const k = at_turn - start_at_turn;
+
+                // Full window
+                TuneMonitor_accumulate(record, slot,
+                    TuneMonitor_window_weight(k, n_turns),
+                    dphi_x, dphi_y, jx, jy);
+
+                // First and second half of the window
+                if (k < n_half_1){
+                    TuneMonitor_accumulate(record, num_particles + slot,
+                        TuneMonitor_window_weight(k, n_half_1),
+                        dphi_x, dphi_y, jx, jy);
+                }
+                else if (k > n_half_1){
+                    TuneMonitor_accumulate(record, 2 * num_particles + slot,
+                        TuneMonitor_window_weight(k - n_half_1, n_half_2),
+                        dphi_x, dphi_y, jx, jy);
+                }
+            }
+
+            TuneMonitorRecord_set_last_phase_x(record, slot, phase_x);
+            TuneMonitorRecord_set_last_phase_y(record, slot, phase_y);
+            TuneMonitorRecord_set_last_turn(record, slot, at_turn);
+        }
+
+	//end_per_particle_block
+}
+
+#endif
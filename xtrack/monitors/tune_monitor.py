@@ -0,0 +1,214 @@
+"""
+Tune Monitor
+
+Accumulates, turn by turn and per particle, the phase advances and actions
+needed to obtain the tunes at the end of tracking, without storing the
+turn-by-turn coordinates.
+"""
+
+import numpy as np
+
+import xobjects as xo
+
+from ..base_element import BeamElement
+from ..beam_elements import Marker
+from ..general import _pkg_root
+
+# Windows over which the sums are accumulated: the full window and its two
+# halves (used for the tune diffusion)
+_WINDOWS = ('full', 'first_half', 'second_half')
+
+
+class TuneMonitorRecord(xo.Struct):
+    last_phase_x = xo.Float64[:]
+    last_phase_y = xo.Float64[:]
+    last_dphi_x = xo.Float64[:]
+    last_dphi_y = xo.Float64[:]
+    last_turn = xo.Int64[:]
+    weight_sum = xo.Float64[:]
+    phase_x_sum = xo.Float64[:]
+    phase_y_sum = xo.Float64[:]
+    jx_sum = xo.Float64[:]
+    jy_sum = xo.Float64[:]
+
+
+class TuneMonitor(BeamElement):
+
+    _xofields={
+        'particle_id_start': xo.Int64,
+        'num_particles': xo.Int64,
+        'start_at_turn': xo.Int64,
+        'stop_at_turn': xo.Int64,
+        'betx': xo.Float64,
+        'bety': xo.Float64,
+        'alfx': xo.Float64,
+        'alfy': xo.Float64,
+        'x_co': xo.Float64,
+        'px_co': xo.Float64,
+        'y_co': xo.Float64,
+        'py_co': xo.Float64,
+        'dx': xo.Float64,
+        'dpx': xo.Float64,
+        'dy': xo.Float64,
+        'dpy': xo.Float64,
+        'data': TuneMonitorRecord,
+    }
+
+    behaves_like_drift = True
+    allow_backtrack = True
+
+    properties = [field.name for field in TuneMonitorRecord._fields]
+
+    _extra_c_sources = [
+        _pkg_root.joinpath('monitors/tune_monitor.h')
+    ]
+
+    def __init__(self, *, particle_id_range=None, particle_id_start=None,
+                 num_particles=None, start_at_turn=None, stop_at_turn=None,
+                 betx=None, bety=None, alfx=0, alfy=0, x_co=0, px_co=0,
+                 y_co=0, py_co=0, dx=0, dpx=0, dy=0, dpy=0,
+                 twiss=None, at_element=None, _xobject=None, **kwargs):
+        """
+        Monitor accumulating, for each particle, the phase advance per turn
+        and the action in normalized coordinates, from which the tunes are
+        obtained at the end of tracking. The memory used is proportional to
+        the number of particles and independent of the number of turns.
+
+        The coordinates are normalized using the uncoupled optics at the
+        monitor (beta and alpha functions, closed orbit and dispersion).
+        The phase advances are averaged with a smooth window vanishing at
+        the edges of the monitored range (weighted Birkhoff average), which
+        converges much faster than a plain average of the phase advances
+        for regular orbits. Each phase advance is taken within pi of the one
+        of the previous turn, so that the average is not biased for tunes
+        close to an integer. The sums are accumulated over the full range of
+        turns and separately over its two halves, to provide the tune
+        diffusion.
+
+        The monitor provides the following data, as arrays of size
+        `num_particles` (NaN for particles not observed for enough turns):
+        - `qx`, `qy` Fractional tunes (in [0, 1)) over the full range
+        - `qx1`, `qy1`, `qx2`, `qy2` Fractional tunes over the first and
+          second half of the range
+        - `tune_diffusion` Distance in the tune diagram between the tunes of
+          the two halves of the range
+        - `jx`, `jy` Average actions in m (J = (x_norm^2 + px_norm^2)/2)
+
+        Args:
+            num_particles (int): Number of particles to monitor.
+            particle_id_start (int, optional): First particle id to monitor.
+                Defaults to 0.
+            particle_id_range (tuple, optional): Range of particle ids to
+                monitor (start, stop). Stop is exclusive.
+            start_at_turn (int): First turn of reference particle (inclusive)
+                at which to monitor.
+            stop_at_turn (int): Last turn of reference particle (exclusive)
+                at which to monitor.
+            betx, bety (float): Beta functions at the monitor in m.
+            alfx, alfy (float, optional): Alpha functions at the monitor.
+            x_co, px_co, y_co, py_co (float, optional): Closed orbit at the
+                monitor.
+            dx, dpx, dy, dpy (float, optional): Dispersion at the monitor.
+            twiss (TwissTable, optional): Twiss table from which the optics
+                parameters are taken at `at_element`, in place of the above.
+            at_element (str, optional): Name of the element at which the
+                optics is taken from `twiss`.
+
+        """
+        if _xobject is not None:
+            super().__init__(_xobject=_xobject)
+            return
+
+        if particle_id_range is None:
+            if particle_id_start is None:
+                particle_id_start = 0
+        elif particle_id_start is None and num_particles is None:
+            particle_id_start = particle_id_range[0]
+            num_particles = particle_id_range[1] - particle_id_range[0]
+        else:
+            raise ValueError("Parameter `particle_id_range` must not be used together with `num_particles` and/or `particle_id_start`")
+        if num_particles is None or num_particles < 0:
+            raise ValueError("The number of particles to monitor must be specified")
+        if start_at_turn is None:
+            start_at_turn = 0
+        if stop_at_turn is None:
+            stop_at_turn = 0
+
+        if twiss is not None:
+            if at_element is None:
+                raise ValueError("`at_element` must be provided together with `twiss`")
+            row = twiss.rows[at_element]
+            betx, bety, alfx, alfy = (row.betx[0], row.bety[0],
+                                      row.alfx[0], row.alfy[0])
+            x_co, px_co, y_co, py_co = (row.x[0], row.px[0],
+                                        row.y[0], row.py[0])
+            dx, dpx, dy, dpy = row.dx[0], row.dpx[0], row.dy[0], row.dpy[0]
+
+        if betx is None or bety is None:
+            raise ValueError("The beta functions at the monitor must be provided")
+
+        if "data" not in kwargs:
+            # explicitely init to have consistent initial values
+            num_windows = len(_WINDOWS)
+            kwargs["data"] = {
+                'last_phase_x': np.zeros(num_particles),
+                'last_phase_y': np.zeros(num_particles),
+                # First phase advances taken in [0, 2 pi)
+                'last_dphi_x': np.full(num_particles, np.pi),
+                'last_dphi_y': np.full(num_particles, np.pi),
+                'last_turn': np.full(num_particles, -1, dtype=np.int64),
+                **{prop: np.zeros(num_windows * num_particles)
+                   for prop in ('weight_sum', 'phase_x_sum', 'phase_y_sum',
+                                'jx_sum', 'jy_sum')},
+            }
+
+        super().__init__(particle_id_start=particle_id_start,
+                         num_particles=num_particles,
+                         start_at_turn=start_at_turn, stop_at_turn=stop_at_turn,
+                         betx=betx, bety=bety, alfx=alfx, alfy=alfy,
+                         x_co=x_co, px_co=px_co, y_co=y_co, py_co=py_co,
+                         dx=dx, dpx=dpx, dy=dy, dpy=dpy, **kwargs)
+
+    def __repr__(self):
+        return (
+            f"{type(self).__qualname__}(start_at_turn={self.start_at_turn}, stop_at_turn={self.stop_at_turn}, "
+            f"particle_id_start={self.particle_id_start}, num_particles={self.num_particles}) at {hex(id(self))}"
+        )
+
+    def _window_average(self, quantity, window):
+        ii = _WINDOWS.index(window)
+        sl = slice(ii * self.num_particles, (ii + 1) * self.num_particles)
+        weight_sum = self.weight_sum[sl]
+        with np.errstate(invalid='ignore'):  # NaN for particles not observed is expected behaviour
+            return np.where(weight_sum > 0,
+                            getattr(self, quantity + '_sum')[sl] / weight_sum,
+                            np.nan)
+
+    def __getattr__(self, attr):
+        if attr in self.properties:
+            return getattr(self.data, attr).to_nparray()
+
+        tunes = {'qx': ('phase_x', 'full'), 'qy': ('phase_y', 'full'),
+                 'qx1': ('phase_x', 'first_half'), 'qy1': ('phase_y', 'first_half'),
+                 'qx2': ('phase_x', 'second_half'), 'qy2': ('phase_y', 'second_half')}
+        if attr in tunes:
+            # The averaged phase advances can be outside [0, 2 pi) for
+            # tunes close to an integer
+            return (self._window_average(*tunes[attr]) / (2 * np.pi)) % 1
+
+        if attr in ('jx', 'jy'):
+            return self._window_average(attr, 'full')
+
+        if attr == 'tune_diffusion':
+            # From the averages before reduction to [0, 1), consistent
+            # between the two halves
+            dmu_x = (self._window_average('phase_x', 'second_half')
+                     - self._window_average('phase_x', 'first_half'))
+            dmu_y = (self._window_average('phase_y', 'second_half')
+                     - self._window_average('phase_y', 'first_half'))
+            return np.sqrt(dmu_x**2 + dmu_y**2) / (2 * np.pi)
+
+        return getattr(super(), attr)
+
+    def get_backtrack_element(self, _context=None, _buffer=None, _offset=None):
+        return Marker(_context=_context, _buffer=_buffer, _offset=_offset)
@@ -0,0 +1,183 @@
+# copyright ############################### #
+# This file is part of the Xtrack Package.  #
+# Copyright (c) CERN, 2023.                 #
+# ######################################### #
+
+import numpy as np
+import xobjects as xo
+import xdeps as xd
+
+
+_TrackProfilingRecord_source = r'''
+#include <time.h>
+
+/*gpufun*/
+int64_t TrackProfiling_now_ns(void){
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return ((int64_t) ts.tv_sec) * 1000000000 + (int64_t) ts.tv_nsec;
+}
+
+/*gpufun*/
+void TrackProfiling_add_element_time(/*gpuglmem*/ int8_t* io_buffer,
+                                     int64_t elem_idx, int64_t t_start_ns){
+
+    int64_t const dt_ns = TrackProfiling_now_ns() - t_start_ns;
+
+    TrackProfilingRecord record =
+        (TrackProfilingRecord) (io_buffer + XTRACK_PROFILING_RECORD_OFFSET);
+    /*gpuglmem*/ int64_t* elapsed_ns =
+        TrackProfilingRecord_getp1_elapsed_ns(record, elem_idx);
+    /*gpuglmem*/ int64_t* num_calls =
+        TrackProfilingRecord_getp1_num_calls(record, elem_idx);
+
+    #pragma omp atomic //only_for_context cpu_openmp
+    *elapsed_ns += dt_ns;
+    #pragma omp atomic //only_for_context cpu_openmp
+    *num_calls += 1;
+}
+'''
+
+
+class TrackProfilingRecord(xo.Struct):
+    '''
+    Time spent in the track kernel by each element of the line (accumulated
+    over all the calls to the kernel). Stored in the io_buffer of the tracker.
+    '''
+    elapsed_ns = xo.Int64[:]
+    num_calls = xo.Int64[:]
+
+    _extra_c_sources = [_TrackProfilingRecord_source]
+
+
+class TrackProfiler:
+
+    '''
+    Collects the profiling data of a tracker: time spent in the track kernel
+    by each element (measured inside the kernel), time spent in the collective
+    elements (measured in python), total time spent in the tracking calls
+    (excluding the compilation of the kernels) and number of tracked
+    particle-turns.
+    '''
+
+    def __init__(self, tracker):
+        num_elements = len(tracker.line.element_names)
+        self.record = TrackProfilingRecord(_buffer=tracker.io_buffer,
+                                           elapsed_ns=num_elements,
+                                           num_calls=num_elements)
+        self.collective_time = np.zeros(num_elements, dtype=np.float64)
+        self.collective_calls = np.zeros(num_elements, dtype=np.int64)
+        self.reset()
+
+    def reset(self):
+        self.record.elapsed_ns.to_nplike()[:] = 0
+        self.record.num_calls.to_nplike()[:] = 0
+        self.collective_time[:] = 0
+        self.collective_calls[:] = 0
+        self.total_time = 0.
+        self.kernel_time = 0.
+        self.build_time = 0.
+        self.particle_turns = 0
+        self.num_track_calls = 0
+
+    def element_times(self):
+        ctx2np = self.record._buffer.context.nparray_from_context_array
+        kernel_time = ctx2np(self.record.elapsed_ns.to_nplike()) * 1e-9
+        kernel_calls = ctx2np(self.record.num_calls.to_nplike())
+        return (kernel_time + self.collective_time,
+                kernel_calls + self.collective_calls)
+
+
+def start_profiling(tracker, reset=True):
+
+    if not isinstance(tracker._context, xo.ContextCpu):
+        raise NotImplementedError(
+            'Profiling is only available on CPU contexts.')
+
+    profiler = tracker._profiler
+    if profiler is None or profiler.record._buffer is not tracker.io_buffer:
+        profiler = TrackProfiler(tracker)
+        tracker._profiler = profiler
+    elif reset:
+        profiler.reset()
+
+    tracker.config.XTRACK_PROFILING = True
+    tracker.config.XTRACK_PROFILING_RECORD_OFFSET = profiler.record._offset
+
+    return profiler
+
+
+def stop_profiling(tracker):
+
+    tracker.config.pop('XTRACK_PROFILING', None)
+    tracker.config.pop('XTRACK_PROFILING_RECORD_OFFSET', None)
+
+
+def get_profiling_table(tracker, group_by=None):
+
+    profiler = tracker._profiler
+    if profiler is None:
+        raise RuntimeError('No profiling data available, please call '
+                           '`line.start_profiling()` before tracking.')
+
+    element_names = np.array(tracker.line.element_names)
+    element_type = np.array([tracker.line.element_dict[nn].__class__.__name__
+                             for nn in element_names])
+    time, num_calls = profiler.element_times()
+
+    if group_by is None:
+        name = element_names
+    elif group_by == 'element_type':
+        name, inverse = np.unique(element_type, return_inverse=True)
+        element_type = name
+        time = np.bincount(inverse, weights=time, minlength=len(name))
+        num_calls = np.bincount(inverse, weights=num_calls,
+                                minlength=len(name)).astype(np.int64)
+    else:
+        raise ValueError(f'Invalid value for group_by: {group_by}')
+
+    time_total_elements = np.sum(time)
+    fraction = time / (time_total_elements if time_total_elements > 0 else 1.)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        time_per_call = np.where(num_calls > 0, time / num_calls, 0.)
+
+    return xd.Table({
+        'name': name,
+        'element_type': element_type,
+        'time': time,
+        'num_calls': num_calls,
+        'time_per_call': time_per_call,
+        'fraction': fraction,
+    })
+
+
+def get_profiling_summary(tracker):
+
+    profiler = tracker._profiler
+    if profiler is None:
+        raise RuntimeError('No profiling data available, please call '
+                           '`line.start_profiling()` before tracking.')
+
+    collective_time = float(np.sum(profiler.collective_time))
+    total_time = profiler.total_time - profiler.build_time
+    if total_time > 0:
+        particle_turns_per_s = profiler.particle_turns / total_time
+    else:
+        particle_turns_per_s = 0.
+
+    return {
+        'total_time': total_time,
+        'kernel_time': profiler.kernel_time,
+        'collective_time': collective_time,
+        'python_overhead': total_time - profiler.kernel_time - collective_time,
+        'kernel_build_time': profiler.build_time,
+        'particle_turns': profiler.particle_turns,
+        'particle_turns_per_s': particle_turns_per_s,
+        'num_track_calls': profiler.num_track_calls,
+    }
+
+
+def _num_completed_turns(particles):
+    ctx2np = particles._context.nparray_from_context_array
+    return int(np.sum(ctx2np(particles.at_turn)[ctx2np(particles.state) > -999999999]))
@@ -46,14 +46,16 @@ def get_angles_from_w(w, reverse_xs=False):
     # w[1, 0]/w[1, 1] = (cosphi * sinpsi)/(cosphi * cospsi)
     # w[1, 2]/w[1, 1] = (sinphi)/(cosphi * cospsi)
 
+    # Works also on a stack of matrices (shape (..., 3, 3))
+
     if reverse_xs:
         w = w.copy()
-        w[:, 0] *= -1
-        w[:, 2] *= -1
+        w[..., :, 0] *= -1
+        w[..., :, 2] *= -1
 
-    theta = np.arctan2(w[0, 2], w[2, 2])
-    psi = np.arctan2(w[1, 0], w[1, 1])
-    phi = np.arctan2(w[1, 2], w[1, 1] / np.cos(psi))
+    theta = np.arctan2(w[..., 0, 2], w[..., 2, 2])
+    psi = np.arctan2(w[..., 1, 0], w[..., 1, 1])
+    phi = np.arctan2(w[..., 1, 2], w[..., 1, 1] / np.cos(psi))
 
     # TODO: arctan2 returns angle between [-pi,pi]. Hence theta ends up not at 2pi after a full survey
     return theta, phi, psi
@@ -104,6 +106,67 @@ def advance_element(v, w, length=0, angle=0, tilt=0):
         return advance_bend(v, w, np.dot(T, R), np.dot(T, np.dot(S, Tinv)))
 
 
+def get_r_s_batch(length, angle, tilt):
+    """Vectorized version of the R vectors and S matrices used in
+    advance_element(), for arrays of elements. Returns R with shape (n, 3)
+    and S with shape (n, 3, 3) (S is the identity for elements with zero
+    angle)."""
+
+    length = np.asarray(length, dtype=np.float64)
+    angle = np.asarray(angle, dtype=np.float64)
+    tilt = np.asarray(tilt, dtype=np.float64)
+    n = len(length)
+
+    R = np.zeros((n, 3))
+    S = np.zeros((n, 3, 3))
+    R[:, 2] = length
+    S[:, 0, 0] = 1.
+    S[:, 1, 1] = 1.
+    S[:, 2, 2] = 1.
+
+    mask = angle != 0
+    if not np.any(mask):
+        return R, S
+
+    aa = angle[mask]
+    ca = np.cos(aa)
+    sa = np.sin(aa)
+    ct = np.cos(tilt[mask])
+    st = np.sin(tilt[mask])
+    rho = length[mask] / aa
+
+    # R and S of the untilted bend rotated by the tilt: T.R and T.S.Tinv
+    rx = rho * (ca - 1)
+    R[mask, 0] = ct * rx
+    R[mask, 1] = st * rx
+    R[mask, 2] = rho * sa
+
+    S[mask, 0, 0] = ct * ct * ca + st * st
+    S[mask, 0, 1] = ct * st * (ca - 1)
+    S[mask, 0, 2] = -ct * sa
+    S[mask, 1, 0] = ct * st * (ca - 1)
+    S[mask, 1, 1] = st * st * ca + ct * ct
+    S[mask, 1, 2] = -st * sa
+    S[mask, 2, 0] = ct * sa
+    S[mask, 2, 1] = st * sa
+    S[mask, 2, 2] = ca
+
+    return R, S
+
+
+def prefix_matmul(mats):
+    """Inclusive prefix product of a stack of matrices (shape (n, m, m)):
+    out[i] = mats[0] @ mats[1] @ ... @ mats[i]. Computed with a parallel
+    (Hillis-Steele) scan, i.e. log2(n) batched matrix products."""
+
+    out = np.array(mats, dtype=np.float64)
+    step = 1
+    while step < len(out):
+        out[step:] = np.matmul(out[:-step], out[step:])
+        step *= 2
+    return out
+
+
 class SurveyTable(Table):
 
     _error_on_row_not_found = True
@@ -176,6 +239,58 @@ def _get_s_increments(elements):
             lengths.append(0.0)
     return lengths
 
+def _get_lengths_and_bending_angles(line, elements):
+    """Drift lengths and bending angles (hxl, hyl) of all the elements. If
+    the line has a tracker, these are gathered with `line.attr` (one
+    vectorized access per field) instead of reading each element."""
+
+    if not line._has_valid_tracker():
+        drift_length = np.array(_get_s_increments(elements), dtype=np.float64)
+        hxl = np.zeros(len(elements))
+        hyl = np.zeros(len(elements))
+        for ii, ee in enumerate(elements):
+            if hasattr(ee, "hxl"):
+                hxl[ii] = ee.hxl
+                hyl[ii] = ee.hyl
+        return drift_length, hxl, hyl
+
+    isthick = np.array(list(map(xt.line._is_thick, elements)), dtype=bool)
+    drift_length = np.where(isthick, line.attr['length'], 0.)
+    # angle_x includes the bends (hxl = h * length)
+    hxl = line.attr['angle_x'].copy()
+    hyl = line.attr['hyl'].copy()
+
+    # Elements not described by an xobject are not covered by line.attr
+    for ii, ee in enumerate(elements):
+        if hasattr(ee, '_xobject'):
+            continue
+        if isthick[ii]:
+            drift_length[ii] = ee.length
+        if hasattr(ee, 'hxl'):
+            hxl[ii] = ee.hxl
+            hyl[ii] = ee.hyl
+
+    return drift_length, hxl, hyl
+
+def _get_angle_and_tilt(hxl, hyl):
+    """Bending angle and tilt of a bend deflecting the reference trajectory
+    by hxl in the horizontal plane and by hyl in the vertical plane (a
+    positive hyl bends the reference trajectory towards positive y, i.e. it
+    corresponds to a tilt of -pi/2). Flat bends keep tilt=0 and the sign of
+    the angle."""
+
+    hxl = np.asarray(hxl, dtype=np.float64)
+    hyl = np.asarray(hyl, dtype=np.float64)
+
+    angle = hxl.copy()
+    tilt = np.zeros_like(hxl)
+
+    mask = hyl != 0
+    angle[mask] = np.sqrt(hxl[mask]**2 + hyl[mask]**2)
+    tilt[mask] = np.arctan2(-hyl[mask], hxl[mask])
+
+    return angle, tilt
+
 # ==================================================
 
 # Main function
@@ -199,22 +314,11 @@ def survey_from_line(line, X0=0, Y0=0, Z0=0, theta0=0, phi0=0, psi0=0,
 
     assert not values_at_element_exit, "Not implemented yet"
 
-    # Extract drift lengths
-    drift_length = _get_s_increments(line.elements)
+    elements = line._get_elements(load=False)
 
-    # Extract angle and tilt from elements
-    angle = []
-    tilt = []
-    for nn in line.element_names:
-        ee = line[nn]
-        hxl, hyl = (ee.hxl, ee.hyl) if hasattr(ee, "hxl") else (0, 0)
-        assert hyl == 0, ("Survey of machines with tilt not yet implemented, "
-                          f"{nn} has hyl={hyl} ")
-        this_angle = hxl  # TODO: generalize for non-flat lines
-        this_tilt = 0     # TODO: generalize for non-flat lines
-
-        angle.append(this_angle)
-        tilt.append(this_tilt)
+    # Extract drift lengths and angle and tilt from elements
+    drift_length, hxl, hyl = _get_lengths_and_bending_angles(line, elements)
+    angle, tilt = _get_angle_and_tilt(hxl, hyl)
 
     if type(element0) == str:
         element0 = line.element_names.index(element0)
@@ -234,11 +338,11 @@ def survey_from_line(line, X0=0, Y0=0, Z0=0, theta0=0, phi0=0, psi0=0,
     out_columns["psi"] = np.unwrap(psi)
 
     out_columns["name"] = np.array(list(line.element_names) + ["_end_point"])
-    out_columns["s"] = np.array(line.get_s_elements() + [line.get_length()])
+    out_columns["s"] = np.concatenate([[0.], np.cumsum(drift_length)])
 
-    out_columns['drift_length'] = np.array(drift_length + [0.])
-    out_columns['angle'] = np.array(angle + [0.])
-    out_columns['tilt'] = np.array(tilt + [0.])
+    out_columns['drift_length'] = np.append(drift_length, 0.)
+    out_columns['angle'] = np.append(angle, 0.)
+    out_columns['tilt'] = np.append(tilt, 0.)
 
     out_scalars['element0'] = element0
 
@@ -268,46 +372,39 @@ def compute_survey(X0, Y0, Z0, theta0, phi0, psi0, drift_length, angle, tilt,
                                     drift_backward, angle_backward, tilt_backward,
                                     reverse_xs=True)
 
-        X = np.array(X_backward[::-1][:-1] + X_forward)
-        Y = np.array(Y_backward[::-1][:-1] + Y_forward)
-        Z = np.array(Z_backward[::-1][:-1] + Z_forward)
-        theta = np.array(theta_backward[::-1][:-1] + theta_forward)
-        phi = np.array(phi_backward[::-1][:-1] + phi_forward)
-        psi = np.array(psi_backward[::-1][:-1]+ psi_forward)
+        X = np.concatenate([X_backward[::-1][:-1], X_forward])
+        Y = np.concatenate([Y_backward[::-1][:-1], Y_forward])
+        Z = np.concatenate([Z_backward[::-1][:-1], Z_forward])
+        theta = np.concatenate([theta_backward[::-1][:-1], theta_forward])
+        phi = np.concatenate([phi_backward[::-1][:-1], phi_forward])
+        psi = np.concatenate([psi_backward[::-1][:-1], psi_forward])
         return X, Y, Z, theta, phi, psi
 
-    X = []
-    Y = []
-    Z = []
-    theta = []
-    phi = []
-    psi = []
-    v = np.array([X0, Y0, Z0])
-    w = get_w_from_angles(theta=theta0, phi=phi0, psi=psi0,
-                          reverse_xs=reverse_xs)
-    # Advancing element by element
-    for ll, aa, tt in zip(drift_length, angle, tilt):
-
-        th, ph, ps = get_angles_from_w(w, reverse_xs=reverse_xs)
-
-        X.append(v[0])
-        Y.append(v[1])
-        Z.append(v[2])
-        theta.append(th)
-        phi.append(ph)
-        psi.append(ps)
-
-        # Advancing
-        v, w = advance_element(v, w, length=ll, angle=aa, tilt=tt)
-
-    # Last marker
-    th, ph, ps = get_angles_from_w(w, reverse_xs=reverse_xs)
-    X.append(v[0])
-    Y.append(v[1])
-    Z.append(v[2])
-    theta.append(th)
-    phi.append(ph)
-    psi.append(ps)
-
-    # Returns as SurveyTable object
-    return X, Y, Z, theta, phi, psi
+    drift_length = np.asarray(drift_length, dtype=np.float64)
+    angle = np.asarray(angle, dtype=np.float64)
+    tilt = np.asarray(tilt, dtype=np.float64)
+
+    v0 = np.array([X0, Y0, Z0], dtype=np.float64)
+    w0 = get_w_from_angles(theta=theta0, phi=phi0, psi=psi0,
+                           reverse_xs=reverse_xs)
+
+    R, S = get_r_s_batch(drift_length, angle, tilt)
+
+    # Orientation at the entry of each element (and at the end point):
+    # w_i = w0 @ S_0 @ ... @ S_(i-1). Only the bending elements contribute,
+    # so the scan is done on those only and broadcast to the other ones.
+    is_bend = angle != 0
+    w_bends = prefix_matmul(np.concatenate([w0[None, :, :], S[is_bend]]))
+    n_bends_before = np.concatenate([[0], np.cumsum(is_bend)])
+    w = w_bends[n_bends_before]
+
+    # Position at the entry of each element (and at the end point):
+    # v_i = v0 + sum_(j<i) w_j @ R_j
+    dv = np.einsum('nij,nj->ni', w[:-1], R)
+    v = np.zeros((len(drift_length) + 1, 3))
+    v[0] = v0
+    v[1:] = v0 + np.cumsum(dv, axis=0)
+
+    theta, phi, psi = get_angles_from_w(w, reverse_xs=reverse_xs)
+
+    return v[:, 0], v[:, 1], v[:, 2], theta, phi, psi
@@ -9,7 +9,6 @@ import xobjects as xo
 def compensate_radiation_energy_loss(line, delta0=0, rtol_eneloss=1e-12,
                                      max_iter=100, verbose=True, **kwargs):
 
-    assert isinstance(line._context, xo.ContextCpu), "Only CPU context is supported"
     assert line.particle_ref is not None, "Particle reference is not set"
     assert np.abs(line.particle_ref.q0) == 1, "Only |q0| = 1 is supported (for now)"
 
@@ -27,15 +26,13 @@ def compensate_radiation_energy_loss(line, delta0=0, rtol_eneloss=1e-12,
         particle_on_co = line.find_closed_orbit()
     line.config.XTRACK_MULTIPOLE_NO_SYNRAD = False
 
+    ctx2np = line._context.nparray_from_context_array
     beta0 = float(particle_on_co._xobject.beta0[0])
+    energy0 = float(ctx2np(particle_on_co.energy0)[0])
 
     # Check whether compensation is needed
-    p_test = particle_on_co.copy()
-    p_test.delta = delta0
-    line.track(p_test, turn_by_turn_monitor='ONE_TURN_EBE')
-    mon = line.record_last_track
-    eloss = -(mon.ptau[0, -1] - mon.ptau[0, 0]) * p_test.p0c[0]
-    if p_test.state[0] > 0 and abs(eloss) < p_test.energy0[0] * rtol_eneloss:
+    eloss, alive, _ = _track_for_energy_loss(line, particle_on_co, delta0)
+    if alive and abs(eloss) < energy0 * rtol_eneloss:
         if verbose: _print("  - No compensation needed")
         return
 
@@ -61,41 +58,70 @@ def compensate_radiation_energy_loss(line, delta0=0, rtol_eneloss=1e-12,
         line.config.XTRACK_MULTIPOLE_TAPER = True
         line.config.XTRACK_DIPOLEEDGE_TAPER = True
 
+        # The total voltage is found with secant (Newton-like) iterations on
+        # the energy loss over one turn, which depends on the voltage through
+        # the tapering. Only the coordinates at the end of the turn are
+        # needed, hence no element-by-element monitor is used.
+        v_tot = 0.
+        v_tot_prev = None
+        eloss_prev = None
         i_iter = 0
         while True:
-            p_test = particle_on_co.copy()
-            p_test.delta = delta0
-            line.track(p_test, turn_by_turn_monitor='ONE_TURN_EBE')
-            mon = line.record_last_track
+            v_setter.set_values(v_tot * eneloss_partitioning)
+            eloss, _, mon = _track_for_energy_loss(line, particle_on_co, delta0,
+                                            ebe_monitor=record_iterations)
 
             if record_iterations:
                 line._tapering_iterations.append(mon)
 
-            eloss = -(mon.ptau[0, -1] - mon.ptau[0, 0]) * p_test.p0c[0]
             if verbose: _print(f"Energy loss: {eloss:.3f} eV             ")#, end='\r', flush=True)
 
-            if eloss < p_test.energy0[0] * rtol_eneloss:
+            if abs(eloss) < energy0 * rtol_eneloss:
                 break
 
-            v_setter.set_values(v_setter.get_values()
-                                + eloss * eneloss_partitioning)
+            # Residual eloss(v_tot) has slope -1 if the energy loss does not
+            # depend on the voltage (used for the first step)
+            slope = -1.
+            if eloss_prev is not None and eloss != eloss_prev:
+                slope = (eloss - eloss_prev) / (v_tot - v_tot_prev)
+                if slope >= 0:
+                    slope = -1.
+            v_tot_prev, eloss_prev = v_tot, eloss
+            v_tot = v_tot - eloss / slope
 
             i_iter += 1
             if i_iter > max_iter:
                 raise RuntimeError("Maximum number of iterations reached")
+
+        # Elements at which the coordinates are needed: entry and exit of the
+        # tapered elements (delta) and cavities (zeta)
+        i_taper = np.where(line.attr._cache['delta_taper'].mask)[0]
+        i_cav = np.where(line.attr._cache['voltage'].mask)[0]
+
+        if record_iterations:
+            # The monitor of the last iteration covers all elements
+            i_mon = np.arange(len(line.element_names) + 1)
+        else:
+            # Single pass on the converged orbit, recording only at the
+            # needed elements
+            i_mon = np.unique(np.concatenate([i_taper, i_taper + 1, i_cav]))
+            _, _, mon = _track_for_energy_loss(line, particle_on_co, delta0,
+                                               ebe_monitor=i_mon)
+
     if verbose: _print()
-    delta_taper_full = 0.5*(mon.delta[0, :-1] + mon.delta[0, 1:]) # last point is added by the monitor
+    mon_delta = ctx2np(mon.delta)[0, :]
+    mon_zeta = ctx2np(mon.zeta)[0, :]
+    delta_taper = 0.5*(mon_delta[np.searchsorted(i_mon, i_taper)]
+                       + mon_delta[np.searchsorted(i_mon, i_taper + 1)])
 
     if verbose: _print("  - Set delta_taper")
-    delta_taper_mask = line.attr._cache['delta_taper'].mask
     delta_taper_setter = line.attr._cache['delta_taper'].multisetter
-    delta_taper_setter.set_values(delta_taper_full[delta_taper_mask])
+    delta_taper_setter.set_values(delta_taper)
 
     if verbose: _print("  - Restore cavity voltage and frequency. Set cavity lag")
     v_synchronous = v_setter.get_values()
 
-    mask_cav = line.attr._cache['voltage'].mask
-    zeta_at_cav = np.atleast_1d(np.squeeze(mon.zeta[0, :-1]))[mask_cav]
+    zeta_at_cav = mon_zeta[np.searchsorted(i_mon, i_cav)]
     mask_active_cav = np.abs(v0) > 0
     v_ratio = v0 * 0
     v_ratio[mask_active_cav] = v_synchronous[mask_active_cav] / v0[mask_active_cav]
@@ -111,3 +137,36 @@ def compensate_radiation_energy_loss(line, delta0=0, rtol_eneloss=1e-12,
     f_setter.set_values(f0)
     lag_taper_setter.set_values(lag_taper)
 
+
+def _track_for_energy_loss(line, particle_on_co, delta0, ebe_monitor=False):
+
+    """
+    Track a copy of the particle on the closed orbit (with the given delta)
+    over one turn and return the energy loss in eV, whether the particle
+    survived and the element-by-element monitor. `ebe_monitor` can be True
+    (record at all elements), an array of element indices (record only at
+    these elements) or False (no monitor).
+    """
+
+    p_test = particle_on_co.copy()
+    p_test.delta = delta0
+    ptau_start = float(p_test._xobject.ptau[0])
+
+    if ebe_monitor is False:
+        line.track(p_test)
+        mon = None
+    else:
+        if ebe_monitor is True:
+            monitor_setting = 'ONE_TURN_EBE'
+        else:
+            monitor_setting = line.tracker.particles_monitor_class(
+                _context=line._context,
+                ebe_record_at=ebe_monitor,
+                particle_id_range=p_test.get_active_particle_id_range())
+        line.track(p_test, turn_by_turn_monitor=monitor_setting)
+        mon = line.record_last_track
+
+    eloss = -(float(p_test._xobject.ptau[0]) - ptau_start) * float(p_test._xobject.p0c[0])
+    alive = int(p_test._xobject.state[0]) > 0
+
+    return eloss, alive, mon
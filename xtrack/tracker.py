@@ -7,6 +7,8 @@ from time import perf_counter
 from typing import Literal, Union
 from contextlib import contextmanager
 import logging
+import os
+import threading
 from functools import partial
 from collections import UserDict, defaultdict
 
@@ -23,11 +25,18 @@ from .base_element import _handle_per_particle_blocks
 from .beam_elements import Drift
 from .general import _pkg_root
 from .internal_record import new_io_buffer
+from .monitors import (ParticlesMonitor, LastTurnsMonitor,
+                       BeamPositionMonitor, BeamSizeMonitor,
+                       BeamProfileMonitor, TuneMonitor)
 from .line import Line, _is_thick, freeze_longitudinal as _freeze_longitudinal
 from .pipeline import PipelineStatus
+from .profiling import (TrackProfilingRecord, start_profiling,
+                        _num_completed_turns)
 from .progress_indicator import progress
 from .tracker_data import TrackerData
 from .prebuild_kernels import get_suitable_kernel, XT_PREBUILT_KERNELS_LOCATION
+from .kernel_cache import (get_kernel_cache_dir, kernel_cache_enabled,
+                           build_kernels_with_cache)
 
 logger = logging.getLogger(__name__)
 
@@ -43,6 +52,10 @@ class Tracker:
     Xsuite tracker class. It is the core of the xsuite package, allows tracking
     particles in a given beam line. Methods to match particle distributions
     and to compute twiss parameters are also available.
+
+    Compiled kernels are written to the user-level kernel cache only if
+    `use_kernel_cache` is True, or if it is None and the environment variable
+    XSUITE_KERNEL_CACHE is set to 1 (see `Line.build_tracker`).
     '''
 
     def __init__(
@@ -53,6 +66,7 @@ class Tracker:
         compile=True,
         io_buffer=None,
         use_prebuilt_kernels=True,
+        use_kernel_cache=None,
         enable_pipeline_hold=False,
         track_kernel=None,
         particles_class=xp.Particles,
@@ -63,7 +77,7 @@ class Tracker:
 
         # Check if there are collective elements
         self.iscollective = False
-        for ee in line.elements:
+        for ee in line._get_elements(load=False):
             if _check_is_collective(ee):
                 self.iscollective = True
                 break
@@ -92,6 +106,7 @@ class Tracker:
         self.local_particle_src = local_particle_src
         self._enable_pipeline_hold = enable_pipeline_hold
         self.use_prebuilt_kernels = use_prebuilt_kernels
+        self.use_kernel_cache = use_kernel_cache
 
         # Some data for collective mode prepared also for non-collective lines
         # to allow collective actions by the tracker (e.g. time-functions on knobs)
@@ -107,6 +122,7 @@ class Tracker:
         self._part_names = part_names
         self._element_part = _element_part
         self._element_index_in_part = _element_index_in_part
+        self._part_element_index = _part_element_index
 
         if self.iscollective:
             # Build tracker for all non-collective elements
@@ -137,7 +153,9 @@ class Tracker:
             self._zerodrift = Drift(_context=_buffer.context, length=0)
 
         self._track_kernel = track_kernel or {}
+        self._profiler = None
         self._tracker_data_cache = {}
+        self._co_search_cache = {}
         self._tracker_data_cache[None] = tracker_data_base
 
         self._get_twiss_mask_markers() # to cache it
@@ -167,7 +185,7 @@ class Tracker:
         ii_in_part = 0
         i_part = 0
         idx = 0
-        for nn, ee in zip(line.element_names, line.elements):
+        for nn, ee in zip(line.element_names, line._get_elements(load=False)):
             if not _check_is_collective(ee):
                 this_part.append_element(ee, nn)
                 _element_part.append(i_part)
@@ -283,16 +301,35 @@ class Tracker:
                 "Please rebuild the tracker, for example using `line.build_tracker(...)`.")
 
     def _track(self, particles, *args, with_progress: Union[bool, int]=False,
-               time=False, **kwargs):
+               time=False, num_threads=None, **kwargs):
+
+        if num_threads is not None:
+            with _omp_num_threads(self._context, num_threads):
+                return self._track(particles, *args,
+                                   with_progress=with_progress, time=time,
+                                   **kwargs)
 
         out = None
 
         if time:
             t0 = perf_counter()
 
+        if self.config.get('XTRACK_PROFILING', False):
+            profiler = start_profiling(self, reset=False)
+            t0_profiling = perf_counter()
+            turns_before = _num_completed_turns(particles)
+        else:
+            profiler = None
+
         assert self.iscollective in (True, False)
         if self.iscollective or self.line.enable_time_dependent_vars:
             tracking_func = self._track_with_collective
+            if kwargs.get('compact_every_n_turns'):
+                raise ValueError('Compaction of lost particles '
+                                 '(`compact_every_n_turns`) is only supported '
+                                 'for non-collective tracking (lines without '
+                                 'collective elements and time-dependent '
+                                 'vars).')
         else:
             tracking_func = self._track_no_collective
 
@@ -335,8 +372,161 @@ class Tracker:
         else:
             self.time_last_track = None
 
+        if profiler is not None:
+            self._context.synchronize()
+            profiler.total_time += perf_counter() - t0_profiling
+            profiler.particle_turns += (_num_completed_turns(particles)
+                                        - turns_before)
+            profiler.num_track_calls += 1
+
         return out
 
+    def _track_chunked(self, particles, chunk_size, num_workers=1,
+                       ele_start=None, ele_stop=None, num_elements=None,
+                       num_turns=None, turn_by_turn_monitor=None,
+                       freeze_longitudinal=False):
+
+        """
+        Track a large set of particles in chunks of at most `chunk_size`
+        particles, so that only `chunk_size * num_workers` particles are
+        present at the same time in the context of the tracker. See
+        `Line.track_chunked` for the description of the arguments.
+        """
+
+        self._check_invalidated()
+
+        if freeze_longitudinal:
+            with _freeze_longitudinal(self.line):
+                return self._track_chunked(particles, chunk_size=chunk_size,
+                    num_workers=num_workers, ele_start=ele_start,
+                    ele_stop=ele_stop, num_elements=num_elements,
+                    num_turns=num_turns,
+                    turn_by_turn_monitor=turn_by_turn_monitor)
+
+        assert chunk_size > 0
+        assert num_workers >= 1
+
+        if num_workers > 1:
+            if (self.iscollective
+                    or not isinstance(self._context, xo.ContextCpu)):
+                raise ValueError('Concurrent tracking of the chunks is only '
+                                 'available for non-collective lines on CPU.')
+            self._check_concurrent_chunk_tracking()
+
+        in_place = isinstance(particles, xp.Particles)
+        if in_place:
+            if not isinstance(particles._context, xo.ContextCpu):
+                raise ValueError('The particles to be tracked in chunks must be '
+                                 'on a CPU context.')
+            chunks = _particle_chunks(particles, chunk_size)
+        else:
+            chunks = ((None, pp) for pp in particles)
+
+        if turn_by_turn_monitor is not None and turn_by_turn_monitor is not False:
+            if turn_by_turn_monitor is not True:
+                raise ValueError('Only `turn_by_turn_monitor=True` is supported '
+                                 'for chunked tracking.')
+            if not in_place:
+                raise ValueError('A turn-by-turn monitor can be used only when '
+                                 'tracking an `xpart.Particles` object.')
+            if ele_start not in (None, 0) or ele_stop is not None:
+                raise NotImplementedError('Turn-by-turn monitor is supported '
+                                          'only for full turns.')
+            turn_by_turn_monitor = self.particles_monitor_class(
+                _context=particles._context,
+                start_at_turn=0,
+                stop_at_turn=(num_turns or 1),
+                particle_id_range=particles.get_active_particle_id_range())
+        else:
+            turn_by_turn_monitor = None
+
+        monitor_lock = threading.Lock()
+
+        def _track_one_chunk(chunk):
+            i_chunk, chunk_particles = chunk
+            pp = chunk_particles.copy(_context=self._context)
+            if turn_by_turn_monitor is not None:
+                chunk_monitor = self.particles_monitor_class(
+                    _context=self._context,
+                    start_at_turn=0,
+                    stop_at_turn=turn_by_turn_monitor.stop_at_turn,
+                    particle_id_range=pp.get_active_particle_id_range())
+            else:
+                chunk_monitor = None
+            self._track(pp, ele_start=ele_start, ele_stop=ele_stop,
+                        num_elements=num_elements, num_turns=num_turns,
+                        turn_by_turn_monitor=chunk_monitor)
+            pp = pp.copy(_context=xo.context_default)
+            if chunk_monitor is not None:
+                with monitor_lock:
+                    _copy_monitor_data(chunk_monitor, turn_by_turn_monitor,
+                                       particle_ids=pp.particle_id)
+            return i_chunk, pp
+
+        # In-place tracking: each chunk is written back as soon as it is
+        # tracked, so that only the chunks being tracked are kept in memory.
+        # Otherwise the chunks are collected to be merged at the end.
+        results = []
+        def _collect(result):
+            i_chunk, pp = result
+            if in_place:
+                _write_back_particles(particles, pp, *i_chunk)
+            else:
+                results.append(pp)
+
+        chunks = iter(chunks)
+        first_chunk = next(chunks, None)
+        if first_chunk is not None:
+            # First chunk tracked alone to build the kernel
+            _collect(_track_one_chunk(first_chunk))
+
+            if num_workers > 1:
+                from concurrent.futures import ThreadPoolExecutor
+                with ThreadPoolExecutor(max_workers=num_workers) as executor:
+                    # Chunks are submitted progressively to limit memory usage
+                    futures = []
+                    for chunk in chunks:
+                        futures.append(executor.submit(_track_one_chunk, chunk))
+                        if len(futures) >= 2 * num_workers:
+                            _collect(futures.pop(0).result())
+                    while futures:
+                        _collect(futures.pop(0).result())
+            else:
+                for chunk in chunks:
+                    _collect(_track_one_chunk(chunk))
+
+        self.record_last_track = turn_by_turn_monitor
+
+        if in_place:
+            particles.reorganize()
+            return particles
+        else:
+            if len(results) == 0:
+                return None
+            return xp.Particles.merge(results)
+
+    def _check_concurrent_chunk_tracking(self):
+
+        # The chunks tracked concurrently share the element data (the kernel
+        # call releases the GIL), which is only safe if the elements do not
+        # accumulate data over the tracked particles
+        if self._profiler is not None:
+            raise ValueError('Concurrent tracking of the chunks is not '
+                             'available while profiling is enabled.')
+
+        for nn in self.line.element_names:
+            ee = self.line.element_dict[nn]
+            if isinstance(ee, _STATEFUL_ELEMENT_CLASSES):
+                raise ValueError(
+                    f'Concurrent tracking of the chunks is not available for '
+                    f'lines containing monitors (element `{nn}` is a '
+                    f'{type(ee).__name__}). Use `num_workers=1`.')
+            if getattr(ee, 'io_buffer', None) is not None:
+                raise ValueError(
+                    f'Concurrent tracking of the chunks is not available when '
+                    f'internal logging is enabled (element `{nn}`). '
+                    f'Use `num_workers=1`.')
+
     @property
     def particle_ref(self) -> xp.Particles:
         self._check_invalidated()
@@ -436,10 +626,26 @@ class Tracker:
                 /*gpuglmem*/ int8_t* io_buffer){
 
             const int64_t capacity = ParticlesData_get__capacity(particles);               //only_for_context cpu_openmp
+            #if defined(XTRACK_OMP_SCHEDULE_DYNAMIC) || defined(XTRACK_OMP_SCHEDULE_GUIDED)  //only_for_context cpu_openmp
+            // Chunks of XTRACK_OMP_CHUNK_SIZE particles given to the threads on demand   //only_for_context cpu_openmp
+            #ifndef XTRACK_OMP_CHUNK_SIZE                                                  //only_for_context cpu_openmp
+            #define XTRACK_OMP_CHUNK_SIZE 64                                               //only_for_context cpu_openmp
+            #endif                                                                         //only_for_context cpu_openmp
+            const int64_t chunk_size = XTRACK_OMP_CHUNK_SIZE;                              //only_for_context cpu_openmp
+            const int num_chunks = (int)((capacity + chunk_size - 1)/chunk_size);         //only_for_context cpu_openmp
+            #else                                                                          //only_for_context cpu_openmp
             const int num_threads = omp_get_max_threads();                                 //only_for_context cpu_openmp
             const int64_t chunk_size = (capacity + num_threads - 1)/num_threads; // ceil division  //only_for_context cpu_openmp
+            const int num_chunks = num_threads;                                            //only_for_context cpu_openmp
+            #endif                                                                         //only_for_context cpu_openmp
+            #if defined(XTRACK_OMP_SCHEDULE_DYNAMIC)                                       //only_for_context cpu_openmp
+            #pragma omp parallel for schedule(dynamic, 1)                                  //only_for_context cpu_openmp
+            #elif defined(XTRACK_OMP_SCHEDULE_GUIDED)                                      //only_for_context cpu_openmp
+            #pragma omp parallel for schedule(guided, 1)                                   //only_for_context cpu_openmp
+            #else                                                                          //only_for_context cpu_openmp
             #pragma omp parallel for                                                       //only_for_context cpu_openmp
-            for (int chunk = 0; chunk < num_threads; chunk++) {                            //only_for_context cpu_openmp
+            #endif                                                                         //only_for_context cpu_openmp
+            for (int chunk = 0; chunk < num_chunks; chunk++) {                             //only_for_context cpu_openmp
             int64_t part_id = chunk * chunk_size;                                          //only_for_context cpu_openmp
             int64_t end_id = (chunk + 1) * chunk_size;                                     //only_for_context cpu_openmp
             if (end_id > capacity) end_id = capacity;                                      //only_for_context cpu_openmp
@@ -496,6 +702,10 @@ class Tracker:
                         /*gpuglmem*/ void* el = ElementRefData_member_elements(elem_ref_data, elem_idx);
                         int64_t elem_type = ElementRefData_typeid_elements(elem_ref_data, elem_idx);
 
+                        #ifdef XTRACK_PROFILING
+                        int64_t const t_start_ns = TrackProfiling_now_ns();
+                        #endif
+
                         switch(elem_type){
         """
         )
@@ -526,6 +736,10 @@ class Tracker:
             r"""
                         } //switch
 
+                    #ifdef XTRACK_PROFILING
+                    TrackProfiling_add_element_time(io_buffer, elem_idx, t_start_ns);
+                    #endif
+
                     // Setting the below flag will break particle losses
                     #ifndef DANGER_SKIP_ACTIVE_CHECK_AND_SWAPS
 
@@ -588,6 +802,33 @@ class Tracker:
 
         kernels = self.get_kernel_descriptions(kernel_element_classes)
 
+        extra_classes = list(kernel_element_classes)
+        if self.config.get('XTRACK_PROFILING', False):
+            extra_classes.append(TrackProfilingRecord)
+
+        build_kwargs = dict(
+            sources=[source_track],
+            kernel_descriptions=kernels,
+            extra_headers=self._config_to_headers() + headers,
+            extra_classes=extra_classes,
+            apply_to_source=[
+                partial(_handle_per_particle_blocks,
+                        local_particle_src=self.local_particle_src)],
+            specialize=True,
+        )
+
+        if (compile is True and module_name is None
+                and kernel_cache_enabled(self.use_kernel_cache)
+                and isinstance(self._context, xo.ContextCpu)):
+            out_kernels = build_kernels_with_cache(
+                context=context,
+                cache_dir=get_kernel_cache_dir(),
+                particles_class=self.particles_class,
+                **build_kwargs,
+            )
+            classes = (self.particles_class._XoStruct,)
+            return out_kernels[('track_line', classes)]
+
         # Compile!
         if isinstance(self._context, xo.ContextCpu):
             kwargs = {
@@ -599,16 +840,9 @@ class Tracker:
             kwargs = {}
 
         out_kernels = context.build_kernels(
-            sources=[source_track],
-            kernel_descriptions=kernels,
-            extra_headers=self._config_to_headers() + headers,
-            extra_classes=kernel_element_classes,
-            apply_to_source=[
-                partial(_handle_per_particle_blocks,
-                        local_particle_src=self.local_particle_src)],
-            specialize=True,
             compile=compile,
             save_source_as=f'{module_name}.c' if module_name else None,
+            **build_kwargs,
             **kwargs,
         )
 
@@ -700,6 +934,10 @@ class Tracker:
 
         assert num_turns >= 1
 
+        if isinstance(turn_by_turn_monitor, xt.MemmapParticlesMonitor):
+            raise NotImplementedError(
+                'MemmapParticlesMonitor is not supported for collective lines')
+
         (flag_monitor, monitor, buffer_monitor, offset_monitor
             ) = self._get_monitor(particles, turn_by_turn_monitor, num_turns)
 
@@ -935,15 +1173,29 @@ class Tracker:
                                             moveback_to_buffer, moveback_to_offset,
                                             _context_needs_clean_active_lost_state)
 
-                if monitor is not None and monitor.ebe_mode == 1:
+                if monitor is not None and monitor.ebe_mode >= 1:
                     monitor_part = monitor
                 else:
                     monitor_part = None
 
+                # Time spent in collective elements (the non-collective parts
+                # are profiled in the track kernel)
+                profile_part = (self._profiler is not None
+                                and self.config.get('XTRACK_PROFILING', False)
+                                and not isinstance(pp, TrackerPartNonCollective))
+                if profile_part:
+                    t0_part = perf_counter()
+
                 # Track!
                 stop_tracking, skip, returned_by_track = self._track_part(
                         particles, pp, tt, ipp, ele_start, ele_stop, num_turns, monitor_part)
 
+                if profile_part and not skip:
+                    self._context.synchronize()
+                    i_ele = self._part_element_index[ipp][0]
+                    self._profiler.collective_time[i_ele] += perf_counter() - t0_part
+                    self._profiler.collective_calls[i_ele] += 1
+
                 if returned_by_track is not None:
                     if returned_by_track.on_hold:
 
@@ -1024,6 +1276,7 @@ class Tracker:
         turn_by_turn_monitor=None,
         freeze_longitudinal=False,
         backtrack=False,
+        compact_every_n_turns=None,
         _force_no_end_turn_actions=False,
     ):
 
@@ -1171,39 +1424,32 @@ class Tracker:
         if self.line._needs_rng and not particles._has_valid_rng_state():
             particles._init_random_number_generator()
 
+        if self.config.get('XTRACK_PROFILING', False):
+            profiler = start_profiling(self, reset=False)
+        else:
+            profiler = None
+
+        if profiler is not None:
+            t0_build = perf_counter()
         track_kernel, tracker_data = self.get_track_kernel_and_data_for_present_config()
         track_kernel.description.n_threads = particles._capacity
-
-        # First turn
-        assert num_elements_first_turn >= 0
-        track_kernel(
-            buffer=tracker_data._buffer.buffer,
-            tracker_data=tracker_data._element_ref_data,
-            particles=particles._xobject,
-            num_turns=1,
-            ele_start=ele_start,
-            num_ele_track=num_elements_first_turn,
-            flag_end_turn_actions=flag_end_first_turn_actions,
-            flag_reset_s_at_end_turn=self.reset_s_at_end_turn,
-            flag_monitor=flag_monitor,
-            num_ele_line=len(tracker_data.element_names),
-            line_length=tracker_data.line_length,
-            buffer_tbt_monitor=buffer_monitor,
-            offset_tbt_monitor=offset_monitor,
-            io_buffer=self.io_buffer.buffer,
-        )
-
-        # Middle turns
-        if num_middle_turns > 0:
-            assert self.num_elements > 0
+        if profiler is not None:
+            # Compilation is not counted as tracking time
+            profiler.build_time += perf_counter() - t0_build
+
+        def _call_track_kernel(num_turns, ele_start, num_ele_track,
+                               flag_end_turn_actions):
+            if profiler is not None:
+                t0_kernel = perf_counter()
+            track_kernel.description.n_threads = particles._capacity
             track_kernel(
                 buffer=tracker_data._buffer.buffer,
                 tracker_data=tracker_data._element_ref_data,
                 particles=particles._xobject,
-                num_turns=num_middle_turns,
-                ele_start=0, # always full turn
-                num_ele_track=self.num_elements, # always full turn
-                flag_end_turn_actions=flag_end_middle_turn_actions,
+                num_turns=num_turns,
+                ele_start=ele_start,
+                num_ele_track=num_ele_track,
+                flag_end_turn_actions=flag_end_turn_actions,
                 flag_reset_s_at_end_turn=self.reset_s_at_end_turn,
                 flag_monitor=flag_monitor,
                 num_ele_line=len(tracker_data.element_names),
@@ -1212,26 +1458,78 @@ class Tracker:
                 offset_tbt_monitor=offset_monitor,
                 io_buffer=self.io_buffer.buffer,
             )
+            if profiler is not None:
+                self._context.synchronize()
+                profiler.kernel_time += perf_counter() - t0_kernel
+
+        # Monitor writing the data to disk between kernel calls
+        memmap_monitor = (monitor if isinstance(monitor, xt.MemmapParticlesMonitor)
+                          else None)
+        if memmap_monitor is not None:
+            ctx2np = particles._context.nparray_from_context_array
+            mask_active = ctx2np(particles.state) > 0
+            if np.any(mask_active):
+                turn = int(ctx2np(particles.at_turn)[mask_active].min())
+            else:
+                memmap_monitor = None # nothing to record
+
+        # First turn
+        assert num_elements_first_turn >= 0
+        if memmap_monitor is not None:
+            memmap_monitor._prepare_block(turn, 1)
+        _call_track_kernel(num_turns=1, ele_start=ele_start,
+                           num_ele_track=num_elements_first_turn,
+                           flag_end_turn_actions=flag_end_first_turn_actions)
+        if memmap_monitor is not None:
+            turn += int(flag_end_first_turn_actions)
+
+        # Middle turns
+        if num_middle_turns > 0:
+            assert self.num_elements > 0
+            if memmap_monitor is None and not compact_every_n_turns:
+                _call_track_kernel(num_turns=num_middle_turns, ele_start=0,
+                                   num_ele_track=self.num_elements, # always full turn
+                                   flag_end_turn_actions=flag_end_middle_turn_actions)
+            else:
+                turns_to_track = num_middle_turns
+                while turns_to_track > 0:
+                    num_turns_block = turns_to_track
+                    if compact_every_n_turns:
+                        num_turns_block = min(num_turns_block, compact_every_n_turns)
+                    if memmap_monitor is not None:
+                        # Split the kernel call at the boundaries of the blocks
+                        # of the monitor
+                        num_turns_block = memmap_monitor._prepare_block(
+                                                        turn, num_turns_block)
+                    if compact_every_n_turns:
+                        with _only_active_particles_in_kernel(particles) as n_active:
+                            if n_active > 0:
+                                _call_track_kernel(num_turns=num_turns_block,
+                                    ele_start=0,
+                                    num_ele_track=self.num_elements, # always full turn
+                                    flag_end_turn_actions=flag_end_middle_turn_actions)
+                    else:
+                        _call_track_kernel(num_turns=num_turns_block, ele_start=0,
+                                num_ele_track=self.num_elements, # always full turn
+                                flag_end_turn_actions=flag_end_middle_turn_actions)
+                    turns_to_track -= num_turns_block
+                    if memmap_monitor is not None:
+                        turn += num_turns_block * int(flag_end_middle_turn_actions)
+
+                if compact_every_n_turns:
+                    particles.reorganize()
 
         # Last turn, only if incomplete
         if num_elements_last_turn > 0:
             assert num_elements_last_turn > 0
-            track_kernel(
-                buffer=tracker_data._buffer.buffer,
-                tracker_data=tracker_data._element_ref_data,
-                particles=particles._xobject,
-                num_turns=1,
-                ele_start=0,
-                num_ele_track=num_elements_last_turn,
-                flag_end_turn_actions=False,
-                flag_reset_s_at_end_turn=self.reset_s_at_end_turn,
-                flag_monitor=flag_monitor,
-                num_ele_line=len(tracker_data.element_names),
-                line_length=tracker_data.line_length,
-                buffer_tbt_monitor=buffer_monitor,
-                offset_tbt_monitor=offset_monitor,
-                io_buffer=self.io_buffer.buffer,
-            )
+            if memmap_monitor is not None:
+                memmap_monitor._prepare_block(turn, 1)
+            _call_track_kernel(num_turns=1, ele_start=0,
+                               num_ele_track=num_elements_last_turn,
+                               flag_end_turn_actions=False)
+
+        if memmap_monitor is not None:
+            memmap_monitor.flush()
 
         self.record_last_track = monitor
 
@@ -1263,8 +1561,16 @@ class Tracker:
                                       num_turns=len(self.line.element_names)+1)
             monitor.ebe_mode = 1
             flag_monitor = 2
+        elif isinstance(turn_by_turn_monitor, xt.MemmapParticlesMonitor):
+            flag_monitor = 1
+            monitor = turn_by_turn_monitor
+            block_monitor = monitor._get_block_monitor(
+                monitor_class=self.particles_monitor_class,
+                context=particles._buffer.context)
+            buffer_monitor = block_monitor._buffer.buffer
+            offset_monitor = block_monitor._offset
         elif isinstance(turn_by_turn_monitor, self.particles_monitor_class):
-            if turn_by_turn_monitor.ebe_mode == 1:
+            if turn_by_turn_monitor.ebe_mode >= 1:
                 flag_monitor = 2
             else:
                 flag_monitor = 1
@@ -1454,6 +1760,106 @@ class TrackerPartNonCollective:
                 f'{self.ele_stop_in_tracker})')
 
 
+
+def _default_omp_num_threads():
+    try:
+        return int(os.environ['OMP_NUM_THREADS'])
+    except (KeyError, ValueError):
+        pass
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError: # not available on all platforms
+        return os.cpu_count()
+
+
+@contextmanager
+def _omp_num_threads(context, num_threads):
+    # Temporarily change the number of threads used by the kernels of an
+    # OpenMP context
+    if not (isinstance(context, xo.ContextCpu) and context.openmp_enabled):
+        raise ValueError('`num_threads` can be specified only for a CPU '
+                         'context with OpenMP enabled.')
+    assert num_threads > 0
+    original = context.omp_num_threads
+    context.omp_num_threads = int(num_threads)
+    try:
+        yield
+    finally:
+        context.omp_num_threads = original
+        if original == 'auto' and hasattr(context, 'omp_set_num_threads'):
+            # The number of threads is not set again by the kernel call
+            context.omp_set_num_threads(_default_omp_num_threads())
+
+
+@contextmanager
+def _only_active_particles_in_kernel(particles):
+    # Move the lost particles to the end of the arrays and reduce the capacity
+    # seen by the kernel, so that only the active particles are processed (and
+    # distributed among the OpenMP threads or GPU threads)
+    n_active, _ = particles.reorganize()
+    capacity = particles._capacity
+    particles._xobject._capacity = n_active
+    try:
+        yield n_active
+    finally:
+        particles._xobject._capacity = capacity
+
+
+_STATEFUL_ELEMENT_CLASSES = (
+    ParticlesMonitor,
+    LastTurnsMonitor,
+    BeamPositionMonitor,
+    BeamSizeMonitor,
+    BeamProfileMonitor,
+    TuneMonitor,
+)
+
+
+def _particle_chunks(particles, chunk_size):
+    n_part = particles._capacity
+    for i_start in range(0, n_part, chunk_size):
+        i_stop = min(i_start + chunk_size, n_part)
+        yield (i_start, i_stop), _slice_particles(particles, i_start, i_stop)
+
+
+def _slice_particles(particles, i_start, i_stop):
+    # Copy of the particles in the index range [i_start, i_stop)
+    out = particles.__class__(_context=particles._context,
+                              _capacity=i_stop - i_start)
+    with out._bypass_linked_vars():
+        for tt, nn in particles.scalar_vars:
+            setattr(out, nn, getattr(particles, nn))
+        for tt, nn in particles.per_particle_vars:
+            getattr(out, nn)[:] = getattr(particles, nn)[i_start:i_stop]
+    # Set the number of active and lost particles from the copied state
+    out.reorganize()
+    return out
+
+
+def _write_back_particles(particles, chunk_particles, i_start, i_stop):
+    with particles._bypass_linked_vars():
+        for tt, nn in particles.per_particle_vars:
+            getattr(particles, nn)[i_start:i_stop] = getattr(chunk_particles, nn)
+
+
+def _copy_monitor_data(monitor_source, monitor_target, particle_ids):
+    # Copy the records of the given particles (rows of the monitor arrays)
+    n_turns = monitor_source.stop_at_turn - monitor_source.start_at_turn
+    assert n_turns == monitor_target.stop_at_turn - monitor_target.start_at_turn
+    ctx2np = monitor_source._buffer.context.nparray_from_context_array
+    particle_ids = np.asarray(particle_ids)
+    for mon in [monitor_source, monitor_target]:
+        particle_ids = particle_ids[(particle_ids >= mon.part_id_start)
+                                    & (particle_ids < mon.part_id_end)]
+    rows_source = particle_ids - monitor_source.part_id_start
+    rows_target = particle_ids - monitor_target.part_id_start
+    with monitor_target.data._bypass_linked_vars():
+        for tt, nn in monitor_target.data.per_particle_vars:
+            vv_source = ctx2np(getattr(monitor_source.data, nn)).reshape(-1, n_turns)
+            vv_target = getattr(monitor_target.data, nn).reshape(-1, n_turns)
+            vv_target[rows_target, :] = vv_source[rows_source, :]
+
+
 def _element_classes_from_track_kernel(kernel):
     assert kernel.description.args[1].name == 'tracker_data'
     kernel_tracker_data_type = kernel.description.args[1].atype
@@ -73,7 +73,9 @@ class TrackerData:
 
         self._element_dict = element_dict
         self._element_names = tuple(element_names)
-        self._elements = tuple([element_dict[ee] for ee in element_names])
+        # (dict.__getitem__ does not build the elements of lazily loaded lines)
+        self._elements = tuple([dict.__getitem__(element_dict, ee)
+                                for ee in element_names])
         self._is_backtrackable = np.all([ee.has_backtrack for ee in self._elements])
         self.extra_element_classes = extra_element_classes
 
@@ -187,9 +189,7 @@ class TrackerData:
             _buffer=buffer,
         )
 
-        element_ref_data.elements = [
-            self._element_dict[name]._xobject for name in self.element_names
-        ]
+        element_ref_data.elements = [ee._xobject for ee in self._elements]
 
         return element_ref_data
 
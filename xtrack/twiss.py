@@ -35,6 +35,7 @@ DEFAULT_MATRIX_RESPONSIVENESS_TOL = 1e-15
 DEFAULT_MATRIX_STABILITY_TOL = 2e-3
 
 AT_TURN_FOR_TWISS = -10 # # To avoid writing in monitors installed in the line
+N_PARTICLES_FOR_TWISS = 13 # closed orbit and +/- the six eigenvectors
 
 log = logging.getLogger(__name__)
 
@@ -67,6 +68,7 @@ def twiss_line(line, particle_ref=None, method=None,
         compute_R_element_by_element=None,
         compute_lattice_functions=None,
         compute_chromatic_properties=None,
+        incremental=None,
         ele_init=None,
         x=None, px=None, y=None, py=None, zeta=None, delta=None,
         betx=None, alfx=None, bety=None, alfy=None, bets=None,
@@ -225,7 +227,9 @@ def twiss_line(line, particle_ref=None, method=None,
             Initial guess for the closed orbit. If not provided, zero is assumed.
         - co_search_settings : dict, optional
             Settings to be used for the closed orbit search.
-            If not provided, the default values are used.
+            If not provided, the default values are used. The key `method`
+            can be set to 'newton' to use the vectorised Newton search
+            (default is 'fsolve').
         - continue_on_closed_orbit_error : bool, optional
             If True, the computation is continued even if the closed orbit
             search fails.
@@ -250,6 +254,11 @@ def twiss_line(line, particle_ref=None, method=None,
         - nemitt_y : float, optional
             Vertical emittance assumed for the comutation of the deviation
             used for the propagation of the W matrix.
+        - incremental : bool, optional
+            If True, the element-by-element tracking of the open twiss is
+            restarted from the first element modified since the previous call
+            with the same initial conditions, reusing the results upstream of
+            it. Useful when matching knobs acting on a small part of the line.
 
     """
 
@@ -278,6 +287,7 @@ def twiss_line(line, particle_ref=None, method=None,
                         if compute_lattice_functions is not None else True)
     compute_chromatic_properties=(compute_chromatic_properties
                         if compute_chromatic_properties is not None else None)
+    incremental=(incremental or False)
 
     if only_orbit:
         raise NotImplementedError # Tested only experimentally
@@ -317,7 +327,7 @@ def twiss_line(line, particle_ref=None, method=None,
         (auxtracker, names_inserted_markers
             ) = _build_auxiliary_tracker_with_extra_markers(
             tracker=line.tracker, at_s=at_s, marker_prefix='inserted_twiss_marker',
-            algorithm='insert')
+            algorithm='auto')
         kwargs.pop('line')
         kwargs.pop('at_s')
         kwargs.pop('at_elements')
@@ -579,6 +589,28 @@ def twiss_line(line, particle_ref=None, method=None,
 
 
 
+    compute_chromatic_functions = (not only_orbit and (
+        (compute_chromatic_properties is True)
+        or (compute_chromatic_properties is None and periodic)))
+
+    # The off-momentum particles for the chromatic functions are tracked
+    # together with the on-momentum ones, unless the tracking is customized
+    fuse_chromatic_twiss = (compute_chromatic_functions
+        and _initial_particles is None and _ebe_monitor is None
+        and not _keep_tracking_data and not _keep_initial_particles
+        and not _continue_if_lost)
+
+    if fuse_chromatic_twiss:
+        tw_init_chrom_list = _twiss_inits_for_chromatic_functions(
+            line=line, twiss_init=twiss_init, delta_chrom=delta_chrom,
+            steps_r_matrix=steps_r_matrix,
+            matrix_responsiveness_tol=matrix_responsiveness_tol,
+            matrix_stability_tol=matrix_stability_tol,
+            symplectify=symplectify, method=method,
+            nemitt_x=nemitt_x, nemitt_y=nemitt_y, periodic=periodic)
+    else:
+        tw_init_chrom_list = None
+
     twiss_res = _twiss_open(
         line=line,
         twiss_init=twiss_init,
@@ -598,7 +630,12 @@ def twiss_line(line, particle_ref=None, method=None,
         _keep_tracking_data=_keep_tracking_data,
         _keep_initial_particles=_keep_initial_particles,
         _initial_particles=_initial_particles,
-        _ebe_monitor=_ebe_monitor)
+        _ebe_monitor=_ebe_monitor,
+        _incremental=incremental,
+        _chromatic_twiss_inits=tw_init_chrom_list)
+
+    if fuse_chromatic_twiss:
+        twiss_res, tw_chrom_res = twiss_res
 
     if not skip_global_quantities and not only_orbit:
         twiss_res._data['R_matrix'] = R_matrix
@@ -611,9 +648,13 @@ def twiss_line(line, particle_ref=None, method=None,
         twiss_res._data['eigenvalues'] = eigenvalues.copy()
         twiss_res._data['rotation_matrix'] = Rot.copy()
 
-    if (not only_orbit and (
-        (compute_chromatic_properties is True)
-        or (compute_chromatic_properties is None and periodic))):
+    if fuse_chromatic_twiss:
+        cols_chrom, scalars_chrom = _chromatic_functions_from_twiss(
+                                                tw_chrom_res, delta_chrom)
+        twiss_res._data.update(cols_chrom)
+        twiss_res._data.update(scalars_chrom)
+        twiss_res._col_names += list(cols_chrom.keys())
+    elif compute_chromatic_functions:
 
         cols_chrom, scalars_chrom = _compute_chromatic_functions(
             line=line,
@@ -635,7 +676,8 @@ def twiss_line(line, particle_ref=None, method=None,
             hide_thin_groups=hide_thin_groups,
             group_compound_elements=group_compound_elements,
             only_markers=only_markers,
-            periodic=periodic)
+            periodic=periodic,
+            incremental=incremental)
         twiss_res._data.update(cols_chrom)
         twiss_res._data.update(scalars_chrom)
         twiss_res._col_names += list(cols_chrom.keys())
@@ -760,7 +802,16 @@ def _twiss_open(line, twiss_init,
                       _keep_tracking_data=False,
                       _keep_initial_particles=False,
                       _initial_particles=None,
-                      _ebe_monitor=None):
+                      _ebe_monitor=None,
+                      _incremental=False,
+                      _chromatic_twiss_inits=None):
+
+    """
+    Twiss from the given initial conditions. If `_chromatic_twiss_inits` is
+    given, the particles for the twiss from these initial conditions (used
+    for the chromatic functions) are tracked together with the on-momentum
+    ones and the function returns `(twiss_res, twiss_res_chromatic)`.
+    """
 
     if twiss_init.reference_frame == 'reverse':
         twiss_init = twiss_init.reverse()
@@ -802,17 +853,23 @@ def _twiss_open(line, twiss_init,
 
     context = line._context
     if _initial_particles is not None: # used in match
+        assert _chromatic_twiss_inits is None
         part_for_twiss = _initial_particles.copy()
     else:
-        part_for_twiss = xp.build_particles(_context=context,
-            particle_ref=particle_on_co, mode='shift',
-            x     = [0] + list(W_matrix[0, :] * -scale_eigen) + list(W_matrix[0, :] * scale_eigen),
-            px    = [0] + list(W_matrix[1, :] * -scale_eigen) + list(W_matrix[1, :] * scale_eigen),
-            y     = [0] + list(W_matrix[2, :] * -scale_eigen) + list(W_matrix[2, :] * scale_eigen),
-            py    = [0] + list(W_matrix[3, :] * -scale_eigen) + list(W_matrix[3, :] * scale_eigen),
-            zeta  = [0] + list(W_matrix[4, :] * -scale_eigen) + list(W_matrix[4, :] * scale_eigen),
-            pzeta = [0] + list(W_matrix[5, :] * -scale_eigen) + list(W_matrix[5, :] * scale_eigen),
-            )
+        part_for_twiss = _build_particles_for_twiss(
+            context, particle_on_co, W_matrix, scale_eigen)
+
+        if _chromatic_twiss_inits is not None:
+            _chromatic_twiss_inits = [
+                tt.reverse() if tt.reference_frame == 'reverse' else tt
+                for tt in _chromatic_twiss_inits]
+            # All particles are tracked in a single pass
+            part_for_twiss = xp.Particles.merge(
+                [part_for_twiss] + [
+                    _build_particles_for_twiss(context, tt.particle_on_co,
+                                               tt.W_matrix, scale_eigen)
+                    for tt in _chromatic_twiss_inits],
+                _context=context)
 
         if twiss_orientation == 'forward':
             part_for_twiss.at_element = ele_start
@@ -828,26 +885,37 @@ def _twiss_open(line, twiss_init,
     if _keep_initial_particles:
         part_for_twiss0 = part_for_twiss.copy()
 
-    if _ebe_monitor is not None:
-        _monitor = _ebe_monitor
-    elif hasattr(line.tracker._tracker_data_base, '_reusable_ebe_monitor_for_twiss'):
-        _monitor = line.tracker._tracker_data_base._reusable_ebe_monitor_for_twiss
-    else:
-        _monitor = 'ONE_TURN_EBE'
-
     if ele_stop is None:
         ele_stop_track = None
     else:
         ele_stop_track = ele_stop + 1 # to include the last element
 
-    line.track(part_for_twiss, turn_by_turn_monitor=_monitor,
-                ele_start=ele_start,
-                ele_stop=ele_stop_track,
-                backtrack=(twiss_orientation == 'backward'))
+    if (_incremental and _ebe_monitor is None
+            and twiss_orientation == 'forward'
+            and isinstance(context, xo.ContextCpu)):
+        part_for_twiss = _track_twiss_incremental(line, part_for_twiss,
+                            ele_start=ele_start, ele_stop_track=ele_stop_track)
+    else:
+        # We keep the monitors to speed up future calls (attached to tracker
+        # data so that they are trashed if number of elements changes), one
+        # for each number of tracked particles
+        tracker_data = line.tracker._tracker_data_base
+        if not hasattr(tracker_data, '_reusable_ebe_monitors_for_twiss'):
+            tracker_data._reusable_ebe_monitors_for_twiss = {}
+        reusable_monitors = tracker_data._reusable_ebe_monitors_for_twiss
+        n_part = part_for_twiss._capacity
+
+        if _ebe_monitor is not None:
+            _monitor = _ebe_monitor
+        else:
+            _monitor = reusable_monitors.get(n_part, 'ONE_TURN_EBE')
 
-    # We keep the monitor to speed up future calls (attached to tracker data
-    # so that it is trashed if number of elements changes)
-    line.tracker._tracker_data_base._reusable_ebe_monitor_for_twiss = line.record_last_track
+        line.track(part_for_twiss, turn_by_turn_monitor=_monitor,
+                    ele_start=ele_start,
+                    ele_stop=ele_stop_track,
+                    backtrack=(twiss_orientation == 'backward'))
+
+        reusable_monitors[n_part] = line.record_last_track
 
     if not _continue_if_lost:
         assert np.all(ctx2np(part_for_twiss.state) == 1), (
@@ -874,34 +942,92 @@ def _twiss_open(line, twiss_init,
           + f'(state {np.unique(recorded_state)}, '
           + f'at element {np.unique(line.record_last_track.at_element[:, i_start:i_stop+1].copy())})')
 
-    x_co = line.record_last_track.x[0, i_start:i_stop+1].copy()
-    y_co = line.record_last_track.y[0, i_start:i_stop+1].copy()
-    px_co = line.record_last_track.px[0, i_start:i_stop+1].copy()
-    py_co = line.record_last_track.py[0, i_start:i_stop+1].copy()
-    zeta_co = line.record_last_track.zeta[0, i_start:i_stop+1].copy()
-    delta_co = np.array(line.record_last_track.delta[0, i_start:i_stop+1].copy())
-    ptau_co = np.array(line.record_last_track.ptau[0, i_start:i_stop+1].copy())
-    s_co = line.record_last_track.s[0, i_start:i_stop+1].copy()
+    twiss_res = _twiss_table_from_tracking(
+        line=line, i_part=0, particle_on_co=particle_on_co,
+        scale_eigen=scale_eigen, i_start=i_start, i_stop=i_stop,
+        twiss_orientation=twiss_orientation,
+        use_full_inverse=use_full_inverse,
+        hide_thin_groups=hide_thin_groups,
+        group_compound_elements=group_compound_elements,
+        only_markers=only_markers, only_orbit=only_orbit,
+        compute_lattice_functions=compute_lattice_functions)
+
+    if _keep_tracking_data:
+        twiss_res._data['tracking_data'] = line.record_last_track.copy()
+
+    if _keep_initial_particles:
+        twiss_res._data['_initial_particles'] = part_for_twiss0.copy()
+
+    if _chromatic_twiss_inits is None:
+        return twiss_res
+
+    twiss_res_chromatic = []
+    for ii, tt in enumerate(_chromatic_twiss_inits):
+        twiss_res_chromatic.append(_twiss_table_from_tracking(
+            line=line, i_part=N_PARTICLES_FOR_TWISS * (ii + 1),
+            particle_on_co=tt.particle_on_co,
+            scale_eigen=scale_eigen, i_start=i_start, i_stop=i_stop,
+            twiss_orientation=twiss_orientation,
+            use_full_inverse=use_full_inverse,
+            hide_thin_groups=hide_thin_groups,
+            group_compound_elements=group_compound_elements,
+            only_markers=only_markers))
+
+    return twiss_res, twiss_res_chromatic
+
+
+def _build_particles_for_twiss(context, particle_on_co, W_matrix, scale_eigen):
+    return xp.build_particles(_context=context,
+        particle_ref=particle_on_co, mode='shift',
+        x     = [0] + list(W_matrix[0, :] * -scale_eigen) + list(W_matrix[0, :] * scale_eigen),
+        px    = [0] + list(W_matrix[1, :] * -scale_eigen) + list(W_matrix[1, :] * scale_eigen),
+        y     = [0] + list(W_matrix[2, :] * -scale_eigen) + list(W_matrix[2, :] * scale_eigen),
+        py    = [0] + list(W_matrix[3, :] * -scale_eigen) + list(W_matrix[3, :] * scale_eigen),
+        zeta  = [0] + list(W_matrix[4, :] * -scale_eigen) + list(W_matrix[4, :] * scale_eigen),
+        pzeta = [0] + list(W_matrix[5, :] * -scale_eigen) + list(W_matrix[5, :] * scale_eigen),
+        )
+
+
+def _twiss_table_from_tracking(line, i_part, particle_on_co, scale_eigen,
+                               i_start, i_stop, twiss_orientation,
+                               use_full_inverse, hide_thin_groups,
+                               group_compound_elements, only_markers,
+                               only_orbit=False,
+                               compute_lattice_functions=True):
+
+    # Twiss table from the data recorded in `line.record_last_track` for the
+    # particles i_part, ..., i_part + 12 (closed orbit and +/- eigenvectors)
+    i_plus = slice(i_part + 1, i_part + 7)
+    i_minus = slice(i_part + 7, i_part + 13)
+
+    x_co = line.record_last_track.x[i_part, i_start:i_stop+1].copy()
+    y_co = line.record_last_track.y[i_part, i_start:i_stop+1].copy()
+    px_co = line.record_last_track.px[i_part, i_start:i_stop+1].copy()
+    py_co = line.record_last_track.py[i_part, i_start:i_stop+1].copy()
+    zeta_co = line.record_last_track.zeta[i_part, i_start:i_stop+1].copy()
+    delta_co = np.array(line.record_last_track.delta[i_part, i_start:i_stop+1].copy())
+    ptau_co = np.array(line.record_last_track.ptau[i_part, i_start:i_stop+1].copy())
+    s_co = line.record_last_track.s[i_part, i_start:i_stop+1].copy()
 
     Ws = np.zeros(shape=(len(s_co), 6, 6), dtype=np.float64)
-    Ws[:, 0, :] = 0.5 * (line.record_last_track.x[1:7, i_start:i_stop+1] - x_co).T / scale_eigen
-    Ws[:, 1, :] = 0.5 * (line.record_last_track.px[1:7, i_start:i_stop+1] - px_co).T / scale_eigen
-    Ws[:, 2, :] = 0.5 * (line.record_last_track.y[1:7, i_start:i_stop+1] - y_co).T / scale_eigen
-    Ws[:, 3, :] = 0.5 * (line.record_last_track.py[1:7, i_start:i_stop+1] - py_co).T / scale_eigen
-    Ws[:, 4, :] = 0.5 * (line.record_last_track.zeta[1:7, i_start:i_stop+1] - zeta_co).T / scale_eigen
-    Ws[:, 5, :] = 0.5 * (line.record_last_track.ptau[1:7, i_start:i_stop+1] - ptau_co).T / particle_on_co._xobject.beta0[0] / scale_eigen
-
-    Ws[:, 0, :] -= 0.5 * (line.record_last_track.x[7:13, i_start:i_stop+1] - x_co).T / scale_eigen
-    Ws[:, 1, :] -= 0.5 * (line.record_last_track.px[7:13, i_start:i_stop+1] - px_co).T / scale_eigen
-    Ws[:, 2, :] -= 0.5 * (line.record_last_track.y[7:13, i_start:i_stop+1] - y_co).T / scale_eigen
-    Ws[:, 3, :] -= 0.5 * (line.record_last_track.py[7:13, i_start:i_stop+1] - py_co).T / scale_eigen
-    Ws[:, 4, :] -= 0.5 * (line.record_last_track.zeta[7:13, i_start:i_stop+1] - zeta_co).T / scale_eigen
-    Ws[:, 5, :] -= 0.5 * (line.record_last_track.ptau[7:13, i_start:i_stop+1] - ptau_co).T / particle_on_co._xobject.beta0[0] / scale_eigen
-
-    dzeta = (((line.record_last_track.zeta[6, i_start:i_stop+1] - zeta_co).T
-            - (line.record_last_track.zeta[12, i_start:i_stop+1] - zeta_co).T )
-            / ((line.record_last_track.delta[6, i_start:i_stop+1] - delta_co).T
-            - (line.record_last_track.delta[12, i_start:i_stop+1] - delta_co).T))
+    Ws[:, 0, :] = 0.5 * (line.record_last_track.x[i_plus, i_start:i_stop+1] - x_co).T / scale_eigen
+    Ws[:, 1, :] = 0.5 * (line.record_last_track.px[i_plus, i_start:i_stop+1] - px_co).T / scale_eigen
+    Ws[:, 2, :] = 0.5 * (line.record_last_track.y[i_plus, i_start:i_stop+1] - y_co).T / scale_eigen
+    Ws[:, 3, :] = 0.5 * (line.record_last_track.py[i_plus, i_start:i_stop+1] - py_co).T / scale_eigen
+    Ws[:, 4, :] = 0.5 * (line.record_last_track.zeta[i_plus, i_start:i_stop+1] - zeta_co).T / scale_eigen
+    Ws[:, 5, :] = 0.5 * (line.record_last_track.ptau[i_plus, i_start:i_stop+1] - ptau_co).T / particle_on_co._xobject.beta0[0] / scale_eigen
+
+    Ws[:, 0, :] -= 0.5 * (line.record_last_track.x[i_minus, i_start:i_stop+1] - x_co).T / scale_eigen
+    Ws[:, 1, :] -= 0.5 * (line.record_last_track.px[i_minus, i_start:i_stop+1] - px_co).T / scale_eigen
+    Ws[:, 2, :] -= 0.5 * (line.record_last_track.y[i_minus, i_start:i_stop+1] - y_co).T / scale_eigen
+    Ws[:, 3, :] -= 0.5 * (line.record_last_track.py[i_minus, i_start:i_stop+1] - py_co).T / scale_eigen
+    Ws[:, 4, :] -= 0.5 * (line.record_last_track.zeta[i_minus, i_start:i_stop+1] - zeta_co).T / scale_eigen
+    Ws[:, 5, :] -= 0.5 * (line.record_last_track.ptau[i_minus, i_start:i_stop+1] - ptau_co).T / particle_on_co._xobject.beta0[0] / scale_eigen
+
+    dzeta = (((line.record_last_track.zeta[i_part + 6, i_start:i_stop+1] - zeta_co).T
+            - (line.record_last_track.zeta[i_part + 12, i_start:i_stop+1] - zeta_co).T )
+            / ((line.record_last_track.delta[i_part + 6, i_start:i_stop+1] - delta_co).T
+            - (line.record_last_track.delta[i_part + 12, i_start:i_stop+1] - delta_co).T))
 
     dzeta = dzeta - dzeta[0]
 
@@ -945,11 +1071,6 @@ def _twiss_open(line, twiss_init,
 
     extra_data = {}
     extra_data['only_markers'] = only_markers
-    if _keep_tracking_data:
-        extra_data['tracking_data'] = line.record_last_track.copy()
-
-    if _keep_initial_particles:
-        extra_data['_initial_particles'] = part_for_twiss0.copy()
 
     if hide_thin_groups:
         _vars_hide_changes = [
@@ -985,6 +1106,10 @@ def _twiss_open(line, twiss_init,
     twiss_res._data.update(extra_data)
 
     twiss_res._data['particle_on_co'] = particle_on_co.copy(_context=xo.context_default)
+    for kk in ['_fsolve_info', '_co_search_info']:
+        if hasattr(particle_on_co, kk):
+            setattr(twiss_res._data['particle_on_co'], kk,
+                    getattr(particle_on_co, kk))
 
     circumference = line.tracker._tracker_data_base.line_length
     twiss_res._data['circumference'] = circumference
@@ -993,18 +1118,209 @@ def _twiss_open(line, twiss_init,
     return twiss_res
 
 
-def _compute_lattice_functions(Ws, use_full_inverse, s_co):
 
-    # For removal ot thin groups of elements
-    i_take = [0]
-    for ii in range(1, len(s_co)):
-        if s_co[ii] > s_co[ii-1]:
-            i_take[-1] = ii-1
-            i_take.append(ii)
+# Maximum number of cached tracking results kept for each element range by the
+# incremental twiss (e.g. on-momentum and the two off-momentum twiss used for
+# the chromatic functions)
+MAX_INCREMENTAL_TWISS_CACHE_ENTRIES = 4
+
+
+def _track_twiss_incremental(line, part_for_twiss, ele_start, ele_stop_track):
+
+    """
+    Track the twiss particles as done by `_twiss_open`, reusing the results
+    of the previous call with the same initial particles. The checksums of the
+    elements in the tracker buffer are compared with the ones stored at the
+    previous call and the tracking is restarted from the first element that
+    has been modified (upstream of it the element-by-element data recorded in
+    the monitor is still valid). Returns the tracked particles, the
+    element-by-element data is available in `line.record_last_track`.
+    """
+
+    tracker = line.tracker
+    tracker_data = tracker._tracker_data_base
+    element_spans = _get_element_buffer_spans(tracker_data)
+
+    if element_spans is None: # some elements are not xobjects
+        line.track(part_for_twiss, turn_by_turn_monitor='ONE_TURN_EBE',
+                   ele_start=ele_start, ele_stop=ele_stop_track)
+        return part_for_twiss
+
+    if not hasattr(tracker_data, '_incremental_twiss_cache'):
+        tracker_data._incremental_twiss_cache = {}
+    cache_entries = tracker_data._incremental_twiss_cache.setdefault(
+                                            (ele_start, ele_stop_track), [])
+
+    checksums = _element_buffer_checksums(tracker_data._buffer.buffer,
+                                          element_spans)
+    initial_particles = part_for_twiss.to_dict()
+    config = dict(line.config)
+
+    entry = None
+    for ee in cache_entries:
+        if (ee['config'] == config
+                and _particles_dicts_equal(ee['initial_particles'],
+                                           initial_particles)):
+            entry = ee
+            break
+
+    i_restart = ele_start
+    if entry is not None:
+        i_restart = _first_modified_element(entry['checksums'], checksums,
+                                            element_spans, ele_start)
+
+    if entry is not None and i_restart is not None and i_restart > ele_start:
+        mon = entry['monitor']
+        stop_track = (len(line.element_names) if ele_stop_track is None
+                      else ele_stop_track)
+        if i_restart < stop_track:
+            # Restart from the particles recorded at the entrance of the first
+            # modified element (upstream data in the monitor are kept). The
+            # monitor is copied, as it may be referenced by previous results.
+            mon = mon.copy()
+            mask_restart = mon.data.at_element == i_restart
+            mask_restart &= (mon.data.at_turn == AT_TURN_FOR_TWISS)
+            part_restart = mon.data.filter(mask_restart)
+            assert len(part_restart.x) == len(part_for_twiss.x)
+            line.track(part_restart, turn_by_turn_monitor=mon,
+                       ele_start=i_restart, ele_stop=ele_stop_track)
+            part_for_twiss = part_restart
         else:
-            i_take.append(i_take[-1])
-    i_take = np.array(i_take)
-    _temp_range = np.arange(0, len(s_co), 1, dtype=int)
+            # Nothing changed in the tracked range
+            part_for_twiss = entry['particles_at_end'].copy()
+            tracker.record_last_track = mon
+    else:
+        line.track(part_for_twiss, turn_by_turn_monitor='ONE_TURN_EBE',
+                   ele_start=ele_start, ele_stop=ele_stop_track)
+        entry = {'config': config, 'initial_particles': initial_particles}
+
+    # Most recently used entry first
+    cache_entries[:] = [ee for ee in cache_entries if ee is not entry]
+    if np.all(part_for_twiss.state == 1):
+        entry.update({
+            'monitor': line.record_last_track,
+            'checksums': checksums,
+            'particles_at_end': part_for_twiss.copy(),
+        })
+        cache_entries.insert(0, entry)
+        del cache_entries[MAX_INCREMENTAL_TWISS_CACHE_ENTRIES:]
+
+    return part_for_twiss
+
+
+def _get_element_buffer_spans(tracker_data):
+
+    """
+    Return the byte ranges occupied by the elements in the tracker buffer,
+    together with the index in the line of each element (an element can be
+    present several times in the line). The result is cached in the tracker
+    data.
+    """
+
+    if hasattr(tracker_data, '_element_buffer_spans'):
+        return tracker_data._element_buffer_spans
+
+    elements = tracker_data.elements
+    if not all(hasattr(ee, '_xobject') for ee in elements):
+        spans = None
+    else:
+        offsets = np.array([ee._xobject._offset for ee in elements], dtype=np.int64)
+        sizes = np.array([ee._xobject._size for ee in elements], dtype=np.int64)
+        unique_offsets, i_first, inverse = np.unique(
+                            offsets, return_index=True, return_inverse=True)
+        spans = {
+            'starts': unique_offsets,
+            'ends': unique_offsets + sizes[i_first],
+            'inverse': inverse,
+        }
+
+    tracker_data._element_buffer_spans = spans
+    return spans
+
+
+def _element_buffer_checksums(buffer_data, element_spans):
+
+    """
+    Return the checksums of the data of each element (span) in the tracker
+    buffer and of the regions of the buffer between the elements. Each 64-bit
+    word is multiplied by an odd position-dependent factor before summing, so
+    that any single modified word changes the checksum of its span.
+    """
+
+    starts = element_spans['starts']
+    ends = element_spans['ends']
+    size = len(buffer_data)
+
+    bounds = np.unique(np.concatenate([[0], starts, ends, [size]]))
+    if np.all(bounds % 8 == 0):
+        words = buffer_data.view(np.uint64)
+        i_bounds = bounds // 8
+    else:
+        words = buffer_data.astype(np.uint64)
+        i_bounds = bounds
+
+    weights = np.arange(len(words), dtype=np.uint64)
+    weights *= np.uint64(0x9E3779B97F4A7C15)
+    weights |= np.uint64(1)
+    seg_sums = np.add.reduceat(words * weights, i_bounds[:-1])
+
+    i_seg_span = np.searchsorted(bounds, starts)
+    is_gap = np.ones(len(seg_sums), dtype=bool)
+    is_gap[i_seg_span] = False
+
+    return {
+        'size': size,
+        'elements': seg_sums[i_seg_span],
+        'gaps': seg_sums[is_gap],
+    }
+
+
+def _first_modified_element(checksums_ref, checksums, element_spans,
+                            ele_start):
+
+    """
+    Return the index of the first element at or after `ele_start` whose
+    checksum differs between the two calls, the number of elements if nothing
+    changed, or None if the differences cannot be attributed to elements.
+    """
+
+    n_elements = len(element_spans['inverse'])
+
+    if (checksums_ref['size'] != checksums['size']
+            or not np.array_equal(checksums_ref['gaps'], checksums['gaps'])):
+        return None # e.g. element references have changed
+
+    span_modified = checksums_ref['elements'] != checksums['elements']
+    modified = span_modified[element_spans['inverse']]
+    modified[:ele_start] = False
+
+    if not np.any(modified):
+        return n_elements
+    return int(np.argmax(modified))
+
+
+def _particles_dicts_equal(dd1, dd2):
+    if dd1.keys() != dd2.keys():
+        return False
+    for kk in dd1.keys():
+        if not np.array_equal(dd1[kk], dd2[kk]):
+            return False
+    return True
+
+
+def _compute_lattice_functions(Ws, use_full_inverse, s_co):
+
+    # For removal ot thin groups of elements (groups of elements at the same
+    # s): all elements of a group except the first and the last take the
+    # values of the first one
+    n_elem = len(s_co)
+    _temp_range = np.arange(0, n_elem, 1, dtype=int)
+    s_increases = np.diff(s_co) > 0
+    is_group_start = np.concatenate([[True], s_increases])
+    is_group_end = np.concatenate([s_increases, [True]])
+    i_group_start = np.maximum.accumulate(
+                                np.where(is_group_start, _temp_range, 0))
+    i_take = np.where(is_group_end, _temp_range, i_group_start)
     mask_replace = _temp_range != i_take
     mask_replace[-1] = False # Force keeping of the last element
     i_replace = _temp_range[mask_replace]
@@ -1013,25 +1329,19 @@ def _compute_lattice_functions(Ws, use_full_inverse, s_co):
     # Re normalize eigenvectors (needed when radiation is present)
     nux, nuy, nuzeta = _renormalize_eigenvectors(Ws)
 
-    # Rotate eigenvectors to the Courant-Snyder basis
+    # Rotate eigenvectors to the Courant-Snyder basis, i.e. multiply the
+    # eigenvectors v_k = W[:, 2k] + i W[:, 2k+1] by exp(-i phi_k)
     phix = np.arctan2(Ws[:, 0, 1], Ws[:, 0, 0])
     phiy = np.arctan2(Ws[:, 2, 3], Ws[:, 2, 2])
     phizeta = np.arctan2(Ws[:, 4, 5], Ws[:, 4, 4])
 
-    v1 = Ws[:, :, 0] + 1j * Ws[:, :, 1]
-    v2 = Ws[:, :, 2] + 1j * Ws[:, :, 3]
-    v3 = Ws[:, :, 4] + 1j * Ws[:, :, 5]
-
-    for ii in range(6):
-        v1[:, ii] *= np.exp(-1j * phix)
-        v2[:, ii] *= np.exp(-1j * phiy)
-        v3[:, ii] *= np.exp(-1j * phizeta)
-    Ws[:, :, 0] = np.real(v1)
-    Ws[:, :, 1] = np.imag(v1)
-    Ws[:, :, 2] = np.real(v2)
-    Ws[:, :, 3] = np.imag(v2)
-    Ws[:, :, 4] = np.real(v3)
-    Ws[:, :, 5] = np.imag(v3)
+    phi = np.stack([phix, phiy, phizeta], axis=1)[:, None, :]
+    cos_phi = np.cos(phi)
+    sin_phi = np.sin(phi)
+    v_real = Ws[:, :, 0::2].copy()
+    v_imag = Ws[:, :, 1::2].copy()
+    Ws[:, :, 0::2] = v_real * cos_phi + v_imag * sin_phi
+    Ws[:, :, 1::2] = v_imag * cos_phi - v_real * sin_phi
 
     # Computation of twiss parameters
     if use_full_inverse:
@@ -1135,10 +1445,9 @@ def _compute_global_quantities(line, twiss_res):
             'beta0': part_on_co._xobject.beta0[0],
             'p0c': part_on_co._xobject.p0c[0],
         })
-        if hasattr(part_on_co, '_fsolve_info'):
-            twiss_res.particle_on_co._fsolve_info = part_on_co._fsolve_info
-        else:
-            twiss_res.particle_on_co._fsolve_info = None
+        for kk in ['_fsolve_info', '_co_search_info']:
+            setattr(twiss_res.particle_on_co, kk,
+                    getattr(part_on_co, kk, None))
 
         if 'mux' in twiss_res._data: # Lattice functions are available
             mux = twiss_res['mux']
@@ -1173,9 +1482,50 @@ def _compute_chromatic_functions(line, twiss_init, delta_chrom, steps_r_matrix,
                     hide_thin_groups=False,
                     group_compound_elements=False,
                     only_markers=False,
-                    periodic=False):
+                    periodic=False,
+                    incremental=False):
+
+    tw_init_chrom_list = _twiss_inits_for_chromatic_functions(
+        line=line, twiss_init=twiss_init, delta_chrom=delta_chrom,
+        steps_r_matrix=steps_r_matrix,
+        matrix_responsiveness_tol=matrix_responsiveness_tol,
+        matrix_stability_tol=matrix_stability_tol, symplectify=symplectify,
+        method=method, nemitt_x=nemitt_x, nemitt_y=nemitt_y,
+        periodic=periodic)
 
     tw_chrom_res = []
+    for tw_init_chrom in tw_init_chrom_list:
+        tw_chrom_res.append(
+            _twiss_open(
+                line=line,
+                twiss_init=tw_init_chrom,
+                ele_start=ele_start, ele_stop=ele_stop,
+                nemitt_x=nemitt_x,
+                nemitt_y=nemitt_y,
+                r_sigma=r_sigma,
+                delta_disp=delta_disp,
+                zeta_disp=zeta_disp,
+                use_full_inverse=use_full_inverse,
+                hide_thin_groups=hide_thin_groups,
+                group_compound_elements=group_compound_elements,
+                only_markers=only_markers,
+                _continue_if_lost=False,
+                _keep_tracking_data=False,
+                _keep_initial_particles=False,
+                _initial_particles=None,
+                _ebe_monitor=None,
+                _incremental=incremental))
+
+    return _chromatic_functions_from_twiss(tw_chrom_res, delta_chrom)
+
+
+def _twiss_inits_for_chromatic_functions(line, twiss_init, delta_chrom,
+                    steps_r_matrix, matrix_responsiveness_tol,
+                    matrix_stability_tol, symplectify, method='6d',
+                    nemitt_x=None, nemitt_y=None, periodic=False):
+
+    # Initial conditions for the twiss at -delta_chrom and +delta_chrom
+    tw_init_chrom_list = []
     for dd in [-delta_chrom, delta_chrom]:
         tw_init_chrom  = twiss_init.copy()
         part_co = tw_init_chrom.particle_on_co
@@ -1190,17 +1540,7 @@ def _compute_chromatic_functions(line, twiss_init, delta_chrom, steps_r_matrix,
                 W_matrix=tw_init_chrom.W_matrix)
         tw_init_chrom.particle_on_co = part_chrom
 
-        if periodic:
-            RR_chrom = line.compute_one_turn_matrix_finite_differences(
-                                        particle_on_co=tw_init_chrom.particle_on_co.copy(),
-                                        steps_r_matrix=steps_r_matrix)['R_matrix']
-            (WW_chrom, _, _, _) = lnf.compute_linear_normal_form(RR_chrom,
-                                    only_4d_block=method=='4d',
-                                    responsiveness_tol=matrix_responsiveness_tol,
-                                    stability_tol=matrix_stability_tol,
-                                    symplectify=symplectify)
-            tw_init_chrom.W_matrix = WW_chrom
-        else:
+        if not periodic:
             alfx = twiss_init.alfx
             betx = twiss_init.betx
             alfy = twiss_init.alfy
@@ -1231,25 +1571,28 @@ def _compute_chromatic_functions(line, twiss_init, delta_chrom, steps_r_matrix,
             twinit_aux._complete(line, element_name=twiss_init.element_name)
             tw_init_chrom.W_matrix = twinit_aux.W_matrix
 
-        tw_chrom_res.append(
-            _twiss_open(
-                line=line,
-                twiss_init=tw_init_chrom,
-                ele_start=ele_start, ele_stop=ele_stop,
-                nemitt_x=nemitt_x,
-                nemitt_y=nemitt_y,
-                r_sigma=r_sigma,
-                delta_disp=delta_disp,
-                zeta_disp=zeta_disp,
-                use_full_inverse=use_full_inverse,
-                hide_thin_groups=hide_thin_groups,
-                group_compound_elements=group_compound_elements,
-                only_markers=only_markers,
-                _continue_if_lost=False,
-                _keep_tracking_data=False,
-                _keep_initial_particles=False,
-                _initial_particles=None,
-                _ebe_monitor=None))
+        tw_init_chrom_list.append(tw_init_chrom)
+
+    if periodic:
+        # The two off-momentum one-turn matrices are obtained from a single
+        # tracking call
+        RR_chrom = line.compute_one_turn_matrices_finite_differences(
+            particles_on_co=xp.Particles.merge(
+                [tt.particle_on_co for tt in tw_init_chrom_list],
+                _context=line._context),
+            steps_r_matrix=steps_r_matrix)['R_matrix']
+        for tw_init_chrom, RR in zip(tw_init_chrom_list, RR_chrom):
+            (WW_chrom, _, _, _) = lnf.compute_linear_normal_form(RR,
+                                    only_4d_block=method=='4d',
+                                    responsiveness_tol=matrix_responsiveness_tol,
+                                    stability_tol=matrix_stability_tol,
+                                    symplectify=symplectify)
+            tw_init_chrom.W_matrix = WW_chrom
+
+    return tw_init_chrom_list
+
+
+def _chromatic_functions_from_twiss(tw_chrom_res, delta_chrom):
 
     dmux = (tw_chrom_res[1].mux - tw_chrom_res[0].mux)/(2*delta_chrom)
     dmuy = (tw_chrom_res[1].muy - tw_chrom_res[0].muy)/(2*delta_chrom)
@@ -1881,16 +2224,15 @@ def find_closed_orbit_line(line, particle_co_guess=None, particle_ref=None,
         co_search_settings = {}
 
     co_search_settings = co_search_settings.copy()
-    if 'xtol' not in co_search_settings.keys():
-        co_search_settings['xtol'] = 1e-6 # Relative error between calls
+    co_search_method = co_search_settings.pop('method', 'fsolve')
+    if co_search_method not in ['fsolve', 'newton']:
+        raise ValueError(f'Invalid closed orbit search method: '
+                         f'{co_search_method}')
 
     particle_co_guess = particle_co_guess.copy(
                         _context=line._buffer.context)
 
-    for shift_factor in [0, 1.]: # if not found at first attempt we shift slightly the starting point
-        if shift_factor>0:
-            _print('Warning! Need second attempt on closed orbit search')
-
+    def _x0_for_shift_factor(shift_factor):
         x0=np.array([particle_co_guess._xobject.x[0] + shift_factor * 1e-5,
                     particle_co_guess._xobject.px[0] + shift_factor * 1e-7,
                     particle_co_guess._xobject.y[0] + shift_factor * 1e-5,
@@ -1899,16 +2241,48 @@ def find_closed_orbit_line(line, particle_co_guess=None, particle_ref=None,
                     particle_co_guess._xobject.delta[0] + shift_factor * 1e-5])
         if delta0 is not None and zeta0 is None:
             x0[5] = delta0
+        if zeta0 is not None:
+            x0[4] = zeta0
+        return x0
+
+    if co_search_method == 'newton':
+        # All the trial guesses are evaluated together
+        res, co_search_info = _find_closed_orbit_newton(line,
+                particle_co_guess=particle_co_guess,
+                x0_list=[_x0_for_shift_factor(ff) for ff in [0, 1.]],
+                delta_zeta=delta_zeta, delta0=delta0, zeta0=zeta0,
+                ele_start=ele_start, ele_stop=ele_stop,
+                **co_search_settings)
+        if res is None:
+            if not continue_on_closed_orbit_error:
+                raise ClosedOrbitSearchError
+            res = _x0_for_shift_factor(0)
+        particle_on_co = particle_co_guess.copy()
+        particle_on_co.x = res[0]
+        particle_on_co.px = res[1]
+        particle_on_co.y = res[2]
+        particle_on_co.py = res[3]
+        particle_on_co.zeta = res[4]
+        particle_on_co.delta = res[5]
+        particle_on_co._co_search_info = co_search_info
+        return particle_on_co
+
+    if 'xtol' not in co_search_settings.keys():
+        co_search_settings['xtol'] = 1e-6 # Relative error between calls
+
+    for shift_factor in [0, 1.]: # if not found at first attempt we shift slightly the starting point
+        if shift_factor>0:
+            _print('Warning! Need second attempt on closed orbit search')
+
+        x0 = _x0_for_shift_factor(shift_factor)
+        if delta0 is not None and zeta0 is None:
             _error_for_co = _error_for_co_search_4d_delta0
         elif delta0 is None and zeta0 is not None:
-            x0[4] = zeta0
             _error_for_co = _error_for_co_search_4d_zeta0
         elif delta0 is not None and zeta0 is not None:
             _error_for_co = _error_for_co_search_4d_delta0_zeta0
         else:
             _error_for_co = _error_for_co_search_6d
-        if zeta0 is not None:
-            x0[4] = zeta0
         if np.all(np.abs(_error_for_co(
                 x0, particle_co_guess, line, delta_zeta, delta0, zeta0,
                 ele_start=ele_start, ele_stop=ele_stop)) < DEFAULT_CO_SEARCH_TOL):
@@ -1944,6 +2318,186 @@ def find_closed_orbit_line(line, particle_co_guess=None, particle_ref=None,
 
     return particle_on_co
 
+def _track_closed_orbit_probes(line, particle_co_guess, coords, delta_zeta,
+                               ele_start, ele_stop):
+
+    # Tracks through the one-turn map all the points in `coords` (shape
+    # (n_points, 6)) in a single call. Coordinates of lost particles are NaN.
+    context = line._buffer.context
+    n_points = len(coords)
+
+    part = _repeat_particles(
+        particle_co_guess.copy(_context=xo.context_default), n_points)
+    part.x[:] = coords[:, 0]
+    part.px[:] = coords[:, 1]
+    part.y[:] = coords[:, 2]
+    part.py[:] = coords[:, 3]
+    part.zeta[:] = coords[:, 4] + delta_zeta
+    part.update_delta(coords[:, 5])
+
+    if line.energy_program is not None:
+        dp0c = line.energy_program.get_p0c_increse_per_turn_at_t_s(
+                                                        line.vv['t_turn_s'])
+        part.update_p0c_and_energy_deviations(p0c=part.p0c + dp0c)
+
+    part.move(_context=context)
+    line.track(part, ele_start=ele_start, ele_stop=ele_stop)
+
+    ctx2np = context.nparray_from_context_array
+    i_sorted = np.argsort(ctx2np(part.particle_id))
+    out = np.zeros(shape=(n_points, 6), dtype=np.float64)
+    for jj, kk in enumerate(['x', 'px', 'y', 'py', 'zeta', 'delta']):
+        out[:, jj] = ctx2np(getattr(part, kk))[i_sorted]
+    out[ctx2np(part.state)[i_sorted] <= 0, :] = np.nan
+
+    return out
+
+
+def _find_closed_orbit_newton(line, particle_co_guess, x0_list, delta_zeta,
+                              delta0, zeta0, ele_start, ele_stop,
+                              max_iter=30, reuse_jacobian=True):
+
+    # Vectorised Newton (Broyden) search of the closed orbit. At each
+    # iteration the one-turn map is evaluated for all the trial guesses, and
+    # when needed for the finite-difference probes of the Jacobian, in a single
+    # tracking call. The last converged orbit and Jacobian are stored in the
+    # tracker and used as first guess in the following searches.
+
+    if max_iter < 1:
+        raise ValueError('`max_iter` must be at least 1')
+
+    if delta0 is None and zeta0 is None:
+        i_free = np.arange(6)
+    else:
+        # delta and/or zeta are imposed (or irrelevant), only the transverse
+        # coordinates are searched
+        i_free = np.arange(4)
+    n_free = len(i_free)
+
+    tol = np.array(DEFAULT_CO_SEARCH_TOL)[i_free]
+    steps_jac = np.array([DEFAULT_STEPS_R_MATRIX[kk] for kk in
+                 ['dx', 'dpx', 'dy', 'dpy', 'dzeta', 'ddelta']])[i_free]
+
+    cache_key = (delta0, zeta0, delta_zeta, ele_start, ele_stop)
+    co_cache = line.tracker._co_search_cache
+    jac_reused = False
+
+    guesses = [np.array(x0, dtype=np.float64) for x0 in x0_list]
+    for gg in guesses:
+        if delta0 is not None:
+            gg[5] = delta0
+        if zeta0 is not None:
+            gg[4] = zeta0
+    jacobians = [None] * len(guesses)
+    if reuse_jacobian and cache_key in co_cache:
+        x_cached, jac_cached = co_cache[cache_key]
+        x_cached = x_cached.copy()
+        x_cached[~np.isin(np.arange(6), i_free)] = guesses[0][
+                                        ~np.isin(np.arange(6), i_free)]
+        guesses.insert(0, x_cached)
+        jacobians.insert(0, jac_cached.copy())
+        jac_reused = True
+
+    n_guesses = len(guesses)
+    active = [True] * n_guesses
+    res_prev = [None] * n_guesses
+    x_prev = [None] * n_guesses
+
+    i_converged = None
+    n_track_calls = 0
+    for i_iter in range(max_iter):
+
+        # Points to be tracked: the guesses and the probes for the Jacobians
+        coords = []
+        i_row_guess = {}
+        i_row_probes = {}
+        for kk in range(n_guesses):
+            if not active[kk]:
+                continue
+            i_row_guess[kk] = len(coords)
+            coords.append(guesses[kk])
+            if jacobians[kk] is None:
+                i_row_probes[kk] = len(coords)
+                for sign in [1, -1]:
+                    for jj, ii in enumerate(i_free):
+                        pp = guesses[kk].copy()
+                        pp[ii] += sign * steps_jac[jj]
+                        coords.append(pp)
+        if len(coords) == 0:
+            break
+
+        mapped = _track_closed_orbit_probes(line, particle_co_guess,
+                        np.array(coords), delta_zeta, ele_start, ele_stop)
+        n_track_calls += 1
+
+        for kk in list(i_row_guess.keys()):
+            res = (guesses[kk] - mapped[i_row_guess[kk]])[i_free]
+            if np.any(np.isnan(res)):
+                active[kk] = False
+                continue
+
+            if np.all(np.abs(res) < tol):
+                i_converged = kk
+                break
+
+            if kk in i_row_probes:
+                i0 = i_row_probes[kk]
+                m_plus = mapped[i0:i0 + n_free][:, i_free]
+                m_minus = mapped[i0 + n_free:i0 + 2 * n_free][:, i_free]
+                if np.any(np.isnan(m_plus)) or np.any(np.isnan(m_minus)):
+                    active[kk] = False
+                    continue
+                dmap = ((m_plus - m_minus) / (2 * steps_jac[:, None])).T
+                jacobians[kk] = np.eye(n_free) - dmap
+            elif res_prev[kk] is not None:
+                if (np.max(np.abs(res) / tol)
+                        > np.max(np.abs(res_prev[kk]) / tol)):
+                    # No improvement, go back and recompute the Jacobian
+                    guesses[kk] = x_prev[kk]
+                    jacobians[kk] = None
+                    res_prev[kk] = None
+                    continue
+                # Broyden update
+                dx = (guesses[kk] - x_prev[kk])[i_free]
+                dres = res - res_prev[kk]
+                jacobians[kk] = jacobians[kk] + np.outer(
+                    dres - jacobians[kk] @ dx, dx) / np.dot(dx, dx)
+
+            try:
+                dx_newton = -np.linalg.solve(jacobians[kk], res)
+            except np.linalg.LinAlgError:
+                active[kk] = False
+                continue
+
+            x_prev[kk] = guesses[kk].copy()
+            res_prev[kk] = res
+            guesses[kk] = guesses[kk].copy()
+            guesses[kk][i_free] += dx_newton
+
+        if i_converged is not None:
+            break
+
+    info = {
+        'method': 'newton',
+        'converged': i_converged is not None,
+        'n_iter': i_iter + 1,
+        'n_track_calls': n_track_calls,
+        'n_guesses': n_guesses,
+        'i_converged_guess': i_converged,
+        'jacobian_reused': jac_reused,
+    }
+
+    if i_converged is None:
+        # Return the best point found
+        return None, info
+
+    res = guesses[i_converged]
+    if jacobians[i_converged] is not None:
+        co_cache[cache_key] = (res.copy(), jacobians[i_converged].copy())
+
+    return res, info
+
+
 def _one_turn_map(p, particle_ref, line, delta_zeta, ele_start, ele_stop):
     part = particle_ref.copy()
     part.x = p[0]
@@ -2010,7 +2564,8 @@ def compute_one_turn_matrix_finite_differences(
         steps_r_matrix=None,
         ele_start=None, ele_stop=None,
         element_by_element=False,
-        only_markers=False):
+        only_markers=False,
+        at_elements=None):
 
     if steps_r_matrix is None:
         steps_r_matrix = {}
@@ -2030,6 +2585,27 @@ def compute_one_turn_matrix_finite_differences(
     if ele_start is not None and ele_stop is not None and ele_start > ele_stop:
         raise ValueError('ele_start > ele_stop')
 
+    if at_elements is not None and only_markers:
+        raise ValueError('`at_elements` and `only_markers` cannot be used together')
+
+    # Observation points for the element-by-element matrices (None means all
+    # elements). The monitor records only at these points, so that memory and
+    # transfers scale with their number rather than with the line length.
+    i_ebe_record = None
+    if element_by_element:
+        if only_markers:
+            mask_twiss = line.tracker._get_twiss_mask_markers()[
+                                        :len(line.element_names) + 1].copy()
+            mask_twiss[-1] = True # to include the "_end_point"
+            i_ebe_record = np.where(mask_twiss)[0]
+        elif at_elements is not None:
+            i_ebe_record = np.unique([
+                line.element_names.index(ee) if isinstance(ee, str) else ee
+                for ee in at_elements]).astype(np.int64)
+            if (len(i_ebe_record) > 0 and (i_ebe_record[0] < 0
+                    or i_ebe_record[-1] > len(line.element_names))):
+                raise ValueError('Invalid element index in `at_elements`')
+
     context = line._buffer.context
 
     particle_on_co = particle_on_co.copy(
@@ -2069,7 +2645,15 @@ def compute_one_turn_matrix_finite_differences(
         line.track(part_temp, num_elements=i_start)
     else:
         assert particle_on_co._xobject.at_element[0] == 0
-        monitor_setting = 'ONE_TURN_EBE' if element_by_element else None
+        if not element_by_element:
+            monitor_setting = None
+        elif i_ebe_record is None:
+            monitor_setting = 'ONE_TURN_EBE'
+        else:
+            monitor_setting = line.tracker.particles_monitor_class(
+                _context=context,
+                ebe_record_at=i_ebe_record,
+                particle_id_range=part_temp.get_active_particle_id_range())
         line.track(part_temp, turn_by_turn_monitor=monitor_setting)
 
     temp_mat = np.zeros(shape=(6, 12), dtype=np.float64)
@@ -2090,7 +2674,8 @@ def compute_one_turn_matrix_finite_differences(
 
     if element_by_element:
         mon = line.record_last_track
-        temp_mad_ebe = np.zeros(shape=(len(line.element_names) + 1, 6, 12), dtype=np.float64)
+        n_ebe = mon.x.shape[1]
+        temp_mad_ebe = np.zeros(shape=(n_ebe, 6, 12), dtype=np.float64)
         temp_mad_ebe[:, 0, :] = mon.x.T
         temp_mad_ebe[:, 1, :] = mon.px.T
         temp_mad_ebe[:, 2, :] = mon.y.T
@@ -2098,21 +2683,143 @@ def compute_one_turn_matrix_finite_differences(
         temp_mad_ebe[:, 4, :] = mon.zeta.T
         temp_mad_ebe[:, 5, :] = mon.ptau.T/mon.beta0.T
 
-        RR_ebe = np.zeros(shape=(len(line.element_names) + 1, 6, 6), dtype=np.float64)
+        RR_ebe = np.zeros(shape=(n_ebe, 6, 6), dtype=np.float64)
         for jj, dd in enumerate([dx, dpx, dy, dpy, dzeta, dpzeta]):
             RR_ebe[:, :, jj] = (temp_mad_ebe[:, :, jj] - temp_mad_ebe[:, :, jj+6])/(2*dd)
 
-        if only_markers:
-            mask_twiss = line.tracker._get_twiss_mask_markers()
-            mask_twiss[-1] = True # to include the "_end_point"
-
         out['R_matrix_ebe'] = RR_ebe
+        out['R_matrix_ebe_at_element'] = (
+            np.arange(n_ebe) if i_ebe_record is None else i_ebe_record)
     else:
         out['R_matrix_ebe'] = None
 
     return out
 
 
+def compute_one_turn_matrices_finite_differences(
+        line, particles_on_co,
+        steps_r_matrix=None,
+        ele_start=None, ele_stop=None):
+
+    """
+    Batched version of `compute_one_turn_matrix_finite_differences`. The
+    N particles in `particles_on_co` are used as reference orbits and the
+    corresponding N one-turn matrices are obtained from a single tracking call
+    of 12 * N particles. Per-particle properties of the references (e.g. delta,
+    chi, charge_ratio) are preserved in the probe particles.
+    """
+
+    if steps_r_matrix is None:
+        steps_r_matrix = {}
+
+    steps_r_matrix = _complete_steps_r_matrix_with_default(steps_r_matrix)
+
+    if line.enable_time_dependent_vars:
+        raise RuntimeError(
+            'Time-dependent vars not supported in one-turn matrix computation')
+
+    if isinstance(ele_start, str):
+        ele_start = line.element_names.index(ele_start)
+
+    if isinstance(ele_stop, str):
+        ele_stop = line.element_names.index(ele_stop)
+
+    if ele_start is not None and ele_stop is not None and ele_start > ele_stop:
+        raise ValueError('ele_start > ele_stop')
+
+    context = line._buffer.context
+
+    part_temp, steps = _build_particles_for_r_matrix_batch(
+                                    particles_on_co, steps_r_matrix)
+    num_ref = len(steps)
+    at_element_start = part_temp.at_element[0]
+    if np.any(part_temp.at_element != at_element_start):
+        raise ValueError('All reference particles must be at the same element')
+
+    part_temp.move(_context=context)
+
+    if ele_start is not None:
+        assert ele_stop is not None
+        line.track(part_temp, ele_start=ele_start, ele_stop=ele_stop)
+    elif at_element_start > 0:
+        line.track(part_temp, ele_start=at_element_start)
+        line.track(part_temp, num_elements=at_element_start)
+    else:
+        line.track(part_temp)
+
+    ctx2np = context.nparray_from_context_array
+    i_sorted = np.argsort(ctx2np(part_temp.particle_id))
+    lost = ctx2np(part_temp.state)[i_sorted] <= 0
+
+    temp_mat = np.zeros(shape=(6, 12 * num_ref), dtype=np.float64)
+    temp_mat[0, :] = ctx2np(part_temp.x)[i_sorted]
+    temp_mat[1, :] = ctx2np(part_temp.px)[i_sorted]
+    temp_mat[2, :] = ctx2np(part_temp.y)[i_sorted]
+    temp_mat[3, :] = ctx2np(part_temp.py)[i_sorted]
+    temp_mat[4, :] = ctx2np(part_temp.zeta)[i_sorted]
+    temp_mat[5, :] = ctx2np(part_temp.ptau/part_temp.beta0)[i_sorted] # pzeta
+    temp_mat[:, lost] = np.nan
+
+    # shape (num_ref, 6, 12)
+    temp_mat = temp_mat.reshape(6, num_ref, 12).transpose(1, 0, 2)
+
+    RR = (temp_mat[:, :, :6] - temp_mat[:, :, 6:]) / (2 * steps[:, None, :])
+
+    return {'R_matrix': RR}
+
+
+def _build_particles_for_r_matrix_batch(particles_on_co, steps_r_matrix):
+
+    # Probe particles are built on the CPU and moved to the context afterwards
+    p_co = particles_on_co.copy(_context=xo.context_default)
+    num_ref = p_co._capacity
+    if np.any(p_co.state <= 0):
+        raise ValueError('All reference particles must be active')
+
+    dx = steps_r_matrix["dx"]
+    dpx = steps_r_matrix["dpx"]
+    dy = steps_r_matrix["dy"]
+    dpy = steps_r_matrix["dpy"]
+    dzeta = steps_r_matrix["dzeta"]
+    ddelta = steps_r_matrix["ddelta"]
+
+    shifts = np.zeros(shape=(6, 12), dtype=np.float64)
+    for jj, dd in enumerate([dx, dpx, dy, dpy, dzeta, ddelta]):
+        shifts[jj, jj] = dd
+        shifts[jj, jj + 6] = -dd
+
+    part_temp = _repeat_particles(p_co, 12)
+    for jj, kk in enumerate(['x', 'px', 'y', 'py', 'zeta']):
+        getattr(part_temp, kk)[:] += np.tile(shifts[jj], num_ref)
+    part_temp.update_delta(part_temp.delta + np.tile(shifts[5], num_ref))
+
+    # Actual step in pzeta for each reference particle
+    pzeta = (part_temp.ptau / part_temp.beta0).reshape(num_ref, 12)
+    dpzeta = (pzeta[:, 5] - pzeta[:, 11]) / 2
+
+    steps = np.zeros(shape=(num_ref, 6), dtype=np.float64)
+    steps[:, :5] = [dx, dpx, dy, dpy, dzeta]
+    steps[:, 5] = dpzeta
+
+    return part_temp, steps
+
+
+def _repeat_particles(particles, repeats):
+
+    # Returns a new Particles object (on CPU) in which each particle of
+    # `particles` (on CPU) is repeated `repeats` times. Particle ids are reset.
+    num_ref = particles._capacity
+    dct = particles.to_dict()
+    for kk, vv in dct.items():
+        if np.ndim(vv) == 1 and len(vv) == num_ref:
+            dct[kk] = np.repeat(vv, repeats)
+    dct['particle_id'] = np.arange(repeats * num_ref, dtype=np.int64)
+    dct['parent_particle_id'] = dct['particle_id'].copy()
+    dct['at_turn'][:] = AT_TURN_FOR_TWISS
+
+    return type(particles).from_dict(dct)
+
+
 def _updated_kwargs_from_locals(kwargs, loc):
 
     out = kwargs.copy()
@@ -2127,7 +2834,7 @@ def _updated_kwargs_from_locals(kwargs, loc):
 def _build_auxiliary_tracker_with_extra_markers(tracker, at_s, marker_prefix,
                                                 algorithm='auto'):
 
-    assert algorithm in ['auto', 'insert', 'regen_all_drift']
+    assert algorithm in ['auto', 'insert', 'regen_all_drifts']
     if algorithm == 'auto':
         if len(at_s)<10:
             algorithm = 'insert'
@@ -2150,38 +2857,10 @@ def _build_auxiliary_tracker_with_extra_markers(tracker, at_s, marker_prefix,
         for nn, mm, ss in zip(names_inserted_markers, markers, at_s):
             auxline.insert_element(element=mm, name=nn, at_s=ss)
     elif algorithm == 'regen_all_drifts':
-        raise ValueError # This algorithm is not enabled since it is not fully tested
-        # s_elems = auxline.get_s_elements()
-        # s_keep = []
-        # enames_keep = []
-        # for ss, nn in zip(s_elems, auxline.element_names):
-        #     if not (_behaves_like_drift(auxline[nn]) and np.abs(auxline[nn].length)>0):
-        #         s_keep.append(ss)
-        #         enames_keep.append(nn)
-        #         assert not xt.line._is_thick(auxline[nn]) or auxline[nn].length == 0
-
-        # s_keep.extend(list(at_s))
-        # enames_keep.extend(names_inserted_markers)
-
-        # ind_sorted = np.argsort(s_keep)
-        # s_keep = np.take(s_keep, ind_sorted)
-        # enames_keep = np.take(enames_keep, ind_sorted)
-
-        # i_new_drift = 0
-        # new_enames = []
-        # new_ele_dict = auxline.element_dict.copy()
-        # new_ele_dict.update({nn: ee for nn, ee in zip(names_inserted_markers, markers)})
-        # s_curr = 0
-        # for ss, nn in zip(s_keep, enames_keep):
-        #     if ss > s_curr + 1e-6:
-        #         new_drift = xt.Drift(length=ss-s_curr)
-        #         new_dname = f'_auxrift_{i_new_drift}'
-        #         new_ele_dict[new_dname] = new_drift
-        #         new_enames.append(new_dname)
-        #         i_new_drift += 1
-        #         s_curr = ss
-        #     new_enames.append(nn)
-        # auxline = xt.Line(elements=new_ele_dict, element_names=new_enames)
+        # All markers are inserted in a single pass over the line
+        auxline.insert_elements_at_s(
+            [(ss, [(nn, mm)]) for nn, mm, ss in zip(
+                                names_inserted_markers, markers, at_s)])
 
     auxtracker = xt.Tracker(
         _buffer=tracker._buffer,
@@ -2718,8 +3397,10 @@ class TwissTable(Table):
                         / particles._xobject.gamma0[0])
 
 
-        ctx2np = particles._context.nparray_from_context_array
-        at_element_particles = ctx2np(particles.at_element)
+        context = particles._context
+        nplike_lib = context.nplike_lib
+        ctx2np = context.nparray_from_context_array
+        np2ctx = context.nparray_to_context_array
 
         part_id = ctx2np(particles.particle_id).copy()
         at_element = part_id.copy() * 0 + xp.particles.LAST_INVALID_STATE
@@ -2730,49 +3411,137 @@ class TwissTable(Table):
         zeta_norm = x_norm.copy()
         pzeta_norm = x_norm.copy()
 
-        at_element_no_rep = list(set(
-            at_element_particles[part_id > xp.particles.LAST_INVALID_STATE]))
-
-        for at_ele in at_element_no_rep:
-
-            if _force_at_element is not None:
-                at_ele = _force_at_element
-
-            W = self.W_matrix[at_ele]
-            W_inv = np.linalg.inv(W)
-
-            mask_at_ele = at_element_particles == at_ele
-
-            if _force_at_element is not None:
-                mask_at_ele = ctx2np(particles.state) > xp.particles.LAST_INVALID_STATE
-
-            n_at_ele = np.sum(mask_at_ele)
-
-            # Coordinates wrt to the closed orbit
-            XX = np.zeros(shape=(6, n_at_ele), dtype=np.float64)
-            XX[0, :] = ctx2np(particles.x)[mask_at_ele] - self.x[at_ele]
-            XX[1, :] = ctx2np(particles.px)[mask_at_ele] - self.px[at_ele]
-            XX[2, :] = ctx2np(particles.y)[mask_at_ele] - self.y[at_ele]
-            XX[3, :] = ctx2np(particles.py)[mask_at_ele] - self.py[at_ele]
-            XX[4, :] = ctx2np(particles.zeta)[mask_at_ele] - self.zeta[at_ele]
-            XX[5, :] = ((ctx2np(particles.ptau)[mask_at_ele] - self.ptau[at_ele])
-                        / particles._xobject.beta0[0])
-
-            XX_norm = np.dot(W_inv, XX)
-
-            x_norm[mask_at_ele] = XX_norm[0, :] / np.sqrt(gemitt_x)
-            px_norm[mask_at_ele] = XX_norm[1, :] / np.sqrt(gemitt_x)
-            y_norm[mask_at_ele] = XX_norm[2, :] / np.sqrt(gemitt_y)
-            py_norm[mask_at_ele] = XX_norm[3, :] / np.sqrt(gemitt_y)
-            zeta_norm[mask_at_ele] = XX_norm[4, :]
-            pzeta_norm[mask_at_ele] = XX_norm[5, :]
-            at_element[mask_at_ele] = at_ele
+        if _force_at_element is not None:
+            mask_valid = ctx2np(particles.state) > xp.particles.LAST_INVALID_STATE
+            at_element_particles = np.full(len(part_id), _force_at_element)
+        else:
+            mask_valid = part_id > xp.particles.LAST_INVALID_STATE
+            at_element_particles = ctx2np(particles.at_element)
+
+        i_valid = np.where(mask_valid)[0]
+
+        # W^-1 and closed orbit only at the elements where particles are
+        at_ele_unique, i_ele = np.unique(at_element_particles[i_valid],
+                                         return_inverse=True)
+        W_inv = np.linalg.inv(self.W_matrix[at_ele_unique])
+        beta0 = particles._xobject.beta0[0]
+        XX_co = np.array([self.x[at_ele_unique], self.px[at_ele_unique],
+                          self.y[at_ele_unique], self.py[at_ele_unique],
+                          self.zeta[at_ele_unique],
+                          self.ptau[at_ele_unique] / beta0]).T
+
+        coords = [particles.x, particles.px, particles.y, particles.py,
+                  particles.zeta, particles.ptau]
+        on_context = not isinstance(context, xo.ContextPyopencl)
+        if on_context:
+            # Transform on the context of the particles
+            nplike = nplike_lib
+            i_valid_nl = np2ctx(i_valid)
+            i_ele_nl = np2ctx(i_ele)
+            W_inv_nl = np2ctx(W_inv)
+            XX_co_nl = np2ctx(XX_co)
+        else:
+            # No fancy indexing on pyopencl arrays, transform on the host
+            nplike = np
+            coords = [ctx2np(cc) for cc in coords]
+            i_valid_nl, i_ele_nl = i_valid, i_ele
+            W_inv_nl, XX_co_nl = W_inv, XX_co
+
+        XX = nplike.stack([cc[i_valid_nl] for cc in coords], axis=1)
+        XX[:, 5] /= beta0
+        XX -= XX_co_nl[i_ele_nl]
+
+        # W^-1 is gathered column by column for each particle, to avoid
+        # building an (n_particles, 6, 6) array
+        XX_norm = nplike.zeros_like(XX)
+        for jj in range(6):
+            XX_norm += W_inv_nl[:, :, jj][i_ele_nl] * XX[:, jj:jj+1]
+        if on_context:
+            XX_norm = ctx2np(XX_norm)
+
+        x_norm[i_valid] = XX_norm[:, 0] / np.sqrt(gemitt_x)
+        px_norm[i_valid] = XX_norm[:, 1] / np.sqrt(gemitt_x)
+        y_norm[i_valid] = XX_norm[:, 2] / np.sqrt(gemitt_y)
+        py_norm[i_valid] = XX_norm[:, 3] / np.sqrt(gemitt_y)
+        zeta_norm[i_valid] = XX_norm[:, 4]
+        pzeta_norm[i_valid] = XX_norm[:, 5]
+        at_element[i_valid] = at_element_particles[i_valid]
 
         return Table({'particle_id': part_id, 'at_element': at_element,
                       'x_norm': x_norm, 'px_norm': px_norm, 'y_norm': y_norm,
                       'py_norm': py_norm, 'zeta_norm': zeta_norm,
                       'pzeta_norm': pzeta_norm}, index='particle_id')
 
+    def build_particles_from_normalized_coordinates(self, at_element,
+            x_norm=0, px_norm=0, y_norm=0, py_norm=0, zeta_norm=0,
+            pzeta_norm=0, nemitt_x=None, nemitt_y=None, _context=None):
+
+        """
+        Build particles from normalized coordinates, i.e. the inverse of
+        `get_normalized_coordinates`. The particles can be located at
+        different elements.
+
+        Parameters
+        ----------
+        at_element : int, str or array
+            Index or name of the element at which each particle is located.
+        x_norm, px_norm, y_norm, py_norm, zeta_norm, pzeta_norm : float or array
+            Normalized coordinates of the particles.
+        nemitt_x, nemitt_y : float, optional
+            Normalized emittances used to scale the transverse normalized
+            coordinates.
+        _context : xobjects context, optional
+            Context on which the particles are built.
+
+        Returns
+        -------
+        particles : xpart.Particles
+            Particles with the physical coordinates.
+        """
+
+        if isinstance(at_element, str) or (
+                np.ndim(at_element) > 0 and len(at_element) > 0
+                and isinstance(at_element[0], str)):
+            name_to_index = {nn: ii for ii, nn in enumerate(self.name)}
+            at_element = np.vectorize(name_to_index.__getitem__,
+                                      otypes=[np.int64])(at_element)
+
+        (at_element, x_norm, px_norm, y_norm, py_norm, zeta_norm,
+            pzeta_norm) = np.broadcast_arrays(np.atleast_1d(at_element),
+                x_norm, px_norm, y_norm, py_norm, zeta_norm, pzeta_norm)
+
+        beta0 = self.particle_on_co._xobject.beta0[0]
+        gamma0 = self.particle_on_co._xobject.gamma0[0]
+        gemitt_x = 1 if nemitt_x is None else nemitt_x / beta0 / gamma0
+        gemitt_y = 1 if nemitt_y is None else nemitt_y / beta0 / gamma0
+
+        XX_norm = np.array([x_norm * np.sqrt(gemitt_x),
+                            px_norm * np.sqrt(gemitt_x),
+                            y_norm * np.sqrt(gemitt_y),
+                            py_norm * np.sqrt(gemitt_y),
+                            zeta_norm, pzeta_norm], dtype=np.float64).T
+
+        # W and closed orbit only at the elements where particles are
+        at_ele_unique, i_ele = np.unique(at_element, return_inverse=True)
+        WW = self.W_matrix[at_ele_unique]
+        XX_co = np.array([self.x[at_ele_unique], self.px[at_ele_unique],
+                          self.y[at_ele_unique], self.py[at_ele_unique],
+                          self.zeta[at_ele_unique],
+                          self.ptau[at_ele_unique] / beta0]).T
+
+        XX = (WW[i_ele] @ XX_norm[:, :, None])[:, :, 0] + XX_co[i_ele]
+
+        particles = xp.build_particles(_context=_context,
+            particle_ref=self.particle_on_co, mode='set',
+            x=XX[:, 0], px=XX[:, 1], y=XX[:, 2], py=XX[:, 3],
+            zeta=XX[:, 4], pzeta=XX[:, 5])
+
+        np2ctx = particles._context.nparray_to_context_array
+        particles.at_element[:] = np2ctx(at_element.astype(np.int64))
+        particles.s[:] = np2ctx(self.s[at_element])
+
+        return particles
+
     def reverse(self):
 
         assert self.values_at == 'entry', 'Not yet implemented for exit'
@@ -2951,46 +3720,19 @@ def _complete_steps_r_matrix_with_default(steps_r_matrix):
     return steps_r_matrix
 
 def _renormalize_eigenvectors(Ws):
-    # Re normalize eigenvectors
-    v1 = Ws[:, :, 0] + 1j * Ws[:, :, 1]
-    v2 = Ws[:, :, 2] + 1j * Ws[:, :, 3]
-    v3 = Ws[:, :, 4] + 1j * Ws[:, :, 5]
-
-    S = lnf.S
-    S_v1_imag = v1 * 0.0
-    S_v2_imag = v2 * 0.0
-    S_v3_imag = v3 * 0.0
-    for ii in range(6):
-        for jj in range(6):
-            if S[ii, jj] !=0:
-                S_v1_imag[:, ii] +=  S[ii, jj] * v1.imag[:, jj]
-                S_v2_imag[:, ii] +=  S[ii, jj] * v2.imag[:, jj]
-                S_v3_imag[:, ii] +=  S[ii, jj] * v3.imag[:, jj]
+    # Re normalize eigenvectors v_k = W[:, 2k] + i W[:, 2k+1] such that
+    # Re(v_k)^T S Im(v_k) = 1
+    v_real = Ws[:, :, 0::2]
+    v_imag = Ws[:, :, 1::2]
 
-    nux = np.squeeze(Ws[:, 0, 0]) * (0.0 + 0j)
-    nuy = nux * 0.0
-    nuzeta = nux * 0.0
+    S_v_imag = lnf.S @ v_imag
+    nu = np.sqrt(np.abs(np.sum(v_real * S_v_imag, axis=1))) # always positive
 
-    for ii in range(6):
-        nux += v1.real[:, ii] * S_v1_imag[:, ii]
-        nuy += v2.real[:, ii] * S_v2_imag[:, ii]
-        nuzeta += v3.real[:, ii] * S_v3_imag[:, ii]
-
-    nux = np.sqrt(np.abs(nux)) # nux is always positive
-    nuy = np.sqrt(np.abs(nuy)) # nuy is always positive
-    nuzeta = np.sqrt(np.abs(nuzeta)) # nuzeta is always positive
+    Ws /= np.repeat(nu, 2, axis=1)[:, None, :]
 
-    for ii in range(6):
-        v1[:, ii] /= nux
-        v2[:, ii] /= nuy
-        v3[:, ii] /= nuzeta
-
-    Ws[:, :, 0] = np.real(v1)
-    Ws[:, :, 1] = np.imag(v1)
-    Ws[:, :, 2] = np.real(v2)
-    Ws[:, :, 3] = np.imag(v2)
-    Ws[:, :, 4] = np.real(v3)
-    Ws[:, :, 5] = np.imag(v3)
+    nux = nu[:, 0]
+    nuy = nu[:, 1]
+    nuzeta = nu[:, 2]
 
     return nux, nuy, nuzeta
 
@@ -3000,17 +3742,15 @@ def _extract_twiss_parameters_with_inverse(Ws):
     # From E. Forest, "From tracking code to analysis", Sec 4.1.2 or better
     # https://iopscience.iop.org/article/10.1088/1748-0221/7/07/P07012
 
-    EE = np.zeros(shape=(3, Ws.shape[0], 6, 6), dtype=np.float64)
-
-    for ii in range(3):
-        Iii = np.zeros(shape=(6, 6))
-        Iii[2*ii, 2*ii] = 1
-        Iii[2*ii+1, 2*ii+1] = 1
-        Sii = lnf.S @ Iii
+    # E_k = - W S I_k W^-1 S (I_k projector on plane k), only the
+    # transverse planes are needed. As S is block diagonal, only the
+    # columns of W and the rows of W^-1 S of plane k contribute.
+    Ws_inv_S = np.linalg.inv(Ws) @ lnf.S
 
-        Ws_inv = np.linalg.inv(Ws)
-
-        EE[ii, :, :, :] = - Ws @ Sii @ Ws_inv @ lnf.S
+    EE = np.zeros(shape=(2, Ws.shape[0], 6, 6), dtype=np.float64)
+    for ii in range(2):
+        kk = slice(2*ii, 2*ii + 2)
+        EE[ii, :, :, :] = - Ws[:, :, kk] @ lnf.S[kk, kk] @ Ws_inv_S[:, kk, :]
 
     betx = EE[0, :, 0, 0]
     bety = EE[1, :, 2, 2]
@@ -3136,24 +3876,25 @@ def compute_T_matrix_line(line, ele_start, ele_stop, particle_on_co=None,
         tw = line.twiss(reverse=False)
         particle_on_co = tw.get_twiss_init(ele_start).particle_on_co
 
-    R_plus = {}
-    R_minus = {}
     p_plus = {}
     p_minus = {}
 
     for kk in ['x', 'px', 'y', 'py', 'zeta', 'delta']:
-
         p_plus[kk] = particle_on_co.copy()
         setattr(p_plus[kk], kk, getattr(particle_on_co, kk) + steps_t_matrix['d' + kk])
-        R_plus[kk] = line.compute_one_turn_matrix_finite_differences(
-                            ele_start=ele_start, ele_stop=ele_stop,
-                            particle_on_co=p_plus[kk])['R_matrix']
-
         p_minus[kk] = particle_on_co.copy()
         setattr(p_minus[kk], kk, getattr(particle_on_co, kk) - steps_t_matrix['d' + kk])
-        R_minus[kk] = line.compute_one_turn_matrix_finite_differences(
-                            ele_start=ele_start, ele_stop=ele_stop,
-                            particle_on_co=p_minus[kk])['R_matrix']
+
+    # All the twelve R matrices are obtained from a single tracking call
+    kk_list = list(p_plus.keys())
+    RR = line.compute_one_turn_matrices_finite_differences(
+                        ele_start=ele_start, ele_stop=ele_stop,
+                        particles_on_co=xp.Particles.merge(
+                            [p_plus[kk] for kk in kk_list]
+                            + [p_minus[kk] for kk in kk_list],
+                            _context=line._context))['R_matrix']
+    R_plus = {kk: RR[ii] for ii, kk in enumerate(kk_list)}
+    R_minus = {kk: RR[ii + len(kk_list)] for ii, kk in enumerate(kk_list)}
 
     TT = np.zeros((6, 6, 6))
     TT[:, :, 0] = 0.5 * (R_plus['x'] - R_minus['x']) / (